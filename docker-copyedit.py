@@ -4,4 +4,4 @@ import sys
 import os.path
 sys.path = [ os.path.dirname(os.path.abspath(__file__)) ] + sys.path
 from docker_copyedit1 import docker_copyedit
-docker_copyedit.main()
+sys.exit(docker_copyedit.main())
@@ -10,30 +10,54 @@ try docker-copyedit.py FROM image1 INTO image2 REMOVE ALL VOLUMES"""
 __copyright__ = "(C) 2017-2025 Guido U. Draheim, licensed under the EUPL"
 __version__ = "1.5.1222"
 
-from typing import Optional, NamedTuple, Union, Tuple, Iterator, List, Dict, Sequence
-import subprocess
+from typing import Optional, NamedTuple, Union, Tuple, Iterator, List, Dict, Sequence, IO, Any, TYPE_CHECKING
 import sys
 import os
 import re
-import json
-import shutil
-import hashlib
-import datetime
-import logging
+import contextlib
+import time
+import threading
+import io
 from fnmatch import fnmatchcase as fnmatch
+if TYPE_CHECKING:  # the others are imported where they are needed (keeps the startup small)
+    import cProfile
+    import tracemalloc
+    import http.client
+    import logging
 
-logg = logging.getLogger("edit")
+class LazyLogger:
+    """ the logging.getLogger(name) - imported with the first message that is not dropped (a plain retag has none) """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.threshold = 0  # the messages below are dropped before logging is imported - it gets basicConfig(level=threshold)
+        self.logger: "Optional[logging.Logger]" = None
+    def __getattr__(self, attr: str) -> Any:
+        if LOGLEVELS.get(attr, 100) < self.threshold:
+            return self.dropped
+        return getattr(self.get(), attr)
+    def get(self) -> "logging.Logger":
+        if self.logger is None:
+            import logging # pylint: disable=import-outside-toplevel
+            if self.threshold:
+                logging.basicConfig(level=self.threshold)
+            self.logger = logging.getLogger(self.name)
+        return self.logger
+    def dropped(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+LOGLEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+logg = LazyLogger("edit")
 
 MAX_PATH = 1024  # on Win32 = 260 / Linux PATH_MAX = 4096 / Mac = 1024
 MAX_NAME = 253
 MAX_PART = 63
 MAX_VERSION = 127
-MAX_COLLISIONS = 100
 
 TMPDIR = "load.tmp"
 DOCKER = "docker"  # override --docker=podman to use it for FROM image1 INTO image2
 PODMAN = "podman"  # use PODMAN image1 INTO image2 to work only on podman images
 IMPORT = ""  # use FROM image1 IMPORT image2 to move an image from docker to podman
+LOAD = ""  # use INTO image2 LOAD docker,podman,ctx:name to load the image into several engines
 TAR = "tar"
 KEEPDIR = 0
 KEEPDATADIR = False
@@ -41,14 +65,50 @@ KEEPSAVEFILE = False
 KEEPINPUTFILE = False
 KEEPOUTPUTFILE = False
 DRYRUN = False
+DOCKERROOT = "/var/lib/docker"  # --offline edits in the imagedb of a stopped docker daemon
+DOCKERDRIVER = ""  # storage driver in DOCKERROOT/image (if there are several)
+DOCKERPIDFILE = "/var/run/docker.pid"
+PODMANSTORAGE = ""  # --offline edits in the containers-storage (default from 'podman info')
+PODMANDRIVER = ""
+OFFLINE = False
+REGISTRY = False  # --registry edits the manifest and config in the registry of FROM and INTO
+REGISTRYHTTP = "localhost,127.0.0.1"  # registries spoken to in plain http
+REGISTRYTIMEOUT = 60
+REGISTRYTHREADS = 4  # parallel blob checks and copies between repositories
+REWRITEHOLD = 1024 * 1024  # json members up to this size are held back when rewriting a save stream for IMPORT
+REMOTE = False  # --remote runs the edit in a helper container next to the daemon of DOCKER_HOST
+REMOTEIMAGE = "docker_copyedit:latest"  # from the Dockerfile ('make docker')
+REMOTESOCKET = "/var/run/docker.sock"
+PROFILE = ""  # --profile=cpu|mem writes profile.pstats / profile.mem.txt into the TMPDIR
+PROFILETOP = 25  # the number of entries in the profile summary
+PROGRESS = "auto"  # --progress=always|never shows the bytes, MB/s and ETA of the streams (auto: on a tty)
+PROGRESSRATE = 1.0  # seconds between the progress lines
+METRICS = ""  # --metrics=FILE rewrites a Prometheus textfile for the node_exporter (the counters add up over the runs)
+METRICBUCKETS = [0.1, 0.5, 1., 5., 10., 30., 60., 300., 900.]  # phase durations in seconds
+TRACE = ""  # --trace=FILE writes a Chrome trace-event timeline with one track per worker
+TIMINGS_REPORT = False  # --timings logs a summary of the phases
+JSON_REPORT = ""  # --json=FILE writes the phases and counters ('-' for stdout)
+RESULT = ""  # --result=FILE writes the new image ids as json ('-' for stdout)
+PLATFORM = ""  # --platform=linux/arm64,linux/amd64 selects the images of an index to be edited
+REGISTRYSPOOL = 64 * 1024 * 1024  # per blob buffer in memory when streaming a registry image into 'docker load'
+DOCKERCONFIG = os.environ.get("DOCKER_CONFIG", "~/.docker")  # has the config.json from 'docker login'
+SOURCE_DATE_EPOCH = os.environ.get("SOURCE_DATE_EPOCH", "")  # reproducible history entries (same edits => same image id)
 OK = True
 NULL = "NULL"
 
+MANIFEST_TYPES = ["application/vnd.oci.image.manifest.v1+json",
+                  "application/vnd.docker.distribution.manifest.v2+json"]
+INDEX_TYPES = ["application/vnd.oci.image.index.v1+json",
+               "application/vnd.docker.distribution.manifest.list.v2+json"]
+OCI_REFNAME = "org.opencontainers.image.ref.name"
+
 StringConfigs = {"user": "User", "domainname": "Domainname",
                  "workingdir": "WorkingDir", "workdir": "WorkingDir", "hostname": "Hostname"}
 StringMeta = {"author": "author", "os": "os", "architecture": "architecture", "arch": "architecture", "variant": "variant"}
 StringCmd = {"cmd": "Cmd", "entrypoint": "Entrypoint"}
 
+ConfigPath = Tuple[Union[str, int], ...]
+
 
 def decodes(text: Union[str, bytes]) -> str:
     if isinstance(text, bytes):
@@ -72,14 +132,18 @@ class ShellException(Exception):
         self.result = result
 
 def sh(cmd: str = ":", shell: bool =True, check: bool=True, ok: Optional[bool]=None, default: str="") -> ShellResult:
+    import subprocess # pylint: disable=import-outside-toplevel
     if ok is None:
         ok = not DRYRUN
     if not ok:
         logg.info("skip %s", cmd)
         return ShellResult(0, default, "")
     # pylint: disable=redefined-outer-name
+    started = time.monotonic()
     run = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     run.wait()
+    JOB.subprocesses["calls"] += 1
+    JOB.subprocesses["wall"] += time.monotonic() - started
     assert run.stdout is not None and run.stderr is not None
     result = ShellResult(run.returncode, decodes(run.stdout.read()), decodes(run.stderr.read()))
     if check and result.returncode:
@@ -90,6 +154,104 @@ def sh(cmd: str = ":", shell: bool =True, check: bool=True, ok: Optional[bool]=N
         raise ShellException("shell command failed", result)
     return result
 
+def progress_enabled() -> bool:
+    if PROGRESS == "auto":
+        return sys.stderr.isatty()
+    return PROGRESS in ("always", "yes", "1")
+
+def human_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f TB" % size
+
+class Progress:
+    """ the bytes done of a data stream with MB/s and ETA - throttled to one line per PROGRESSRATE seconds,
+        updated in place on a tty (or as plain lines on stderr for --progress=always) """
+    def __init__(self, name: str, expected: int = 0) -> None:
+        self.name = name
+        self.expected = expected
+        self.done = 0
+        self.shown = 0
+        self.enabled = progress_enabled()
+        self.started = self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    def update(self, size: int) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.done += size
+            now = time.monotonic()
+            if now - self.updated < PROGRESSRATE:
+                return
+            self.updated = now
+        self.show(self.line(now))
+    def line(self, now: float) -> str:
+        elapsed = max(now - self.started, 0.001)
+        rate = self.done / elapsed
+        text = F"{self.name}: {human_size(self.done)}"
+        if self.expected:
+            text += F" of {human_size(self.expected)} ({min(100, 100 * self.done // self.expected)}%)"
+        text += " %.1f MB/s" % (rate / 1024 / 1024)
+        if self.expected and rate and self.done < self.expected:
+            text += " ETA %is" % ((self.expected - self.done) / rate)
+        return text
+    def show(self, text: str) -> None:
+        self.shown += 1
+        if sys.stderr.isatty():
+            sys.stderr.write("\r" + text + "\033[K")
+        else:
+            sys.stderr.write(text + "\n")
+        sys.stderr.flush()
+    def finish(self) -> None:
+        """ the final line - only when the stream was slow enough to have shown some progress """
+        if self.enabled and self.shown:
+            self.show(self.line(time.monotonic()))
+            if sys.stderr.isatty():
+                sys.stderr.write("\n")
+
+def progress_expected(docker: str, image: str) -> int:
+    """ the inspected size of the image (only asked when the progress is shown) """
+    if not progress_enabled():
+        return 0
+    inspect = sh(F"{docker} image inspect --format '{{{{.Size}}}}' {image}", check=False)
+    size = inspect.stdout.strip()
+    return int(size) if size.isdigit() else 0
+
+def sh_pipe(source: str, target: str, name: str, expected: int = 0) -> int:
+    """ run 'source | target' with the data passing through this process to show its progress => the bytes """
+    import subprocess # pylint: disable=import-outside-toplevel
+    if DRYRUN:
+        logg.info("skip %s | %s", source, target)
+        return 0
+    progress = Progress(name, expected)
+    reader = subprocess.Popen(source, shell=True, stdout=subprocess.PIPE)
+    writer = subprocess.Popen(target, shell=True, stdin=subprocess.PIPE)
+    assert reader.stdout is not None and writer.stdin is not None
+    try:
+        while True:
+            chunk = reader.stdout.read(1024 * 1024)
+            if not chunk:
+                break
+            writer.stdin.write(chunk)
+            progress.update(len(chunk))
+    except BrokenPipeError:
+        reader.kill()
+    finally:
+        reader.stdout.close()
+        try:
+            writer.stdin.close()
+        except BrokenPipeError:
+            pass
+    for cmd, returncode in [(source, reader.wait()), (target, writer.wait())]:
+        if returncode:
+            logg.error("CMD %s", cmd)
+            logg.error("EXIT %s", returncode)
+            raise ShellException("shell command failed", ShellResult(returncode, "", ""))
+    progress.finish()
+    return progress.done
+
 def portprot(arg: str) -> Tuple[str, str]:
     port, prot = arg, ""
     if "/" in arg:
@@ -98,10 +260,13 @@ def portprot(arg: str) -> Tuple[str, str]:
         pass
     else:
         import socket # pylint: disable=import-outside-toplevel
-        if prot:
-            portnum = socket.getservbyname(port, prot)
-        else:
-            portnum = socket.getservbyname(port)
+        try:
+            if prot:
+                portnum = socket.getservbyname(port, prot)
+            else:
+                portnum = socket.getservbyname(port)
+        except OSError as e:
+            raise CommandError("bad port value %s (%s)" % (arg, e)) from e
         port = str(portnum)
     if not prot:
         prot = "tcp"
@@ -113,10 +278,205 @@ def need_to_clean_whitespaces() -> bool:
     return "podman" in DOCKER
 def need_to_chmod_file_stat() -> bool:
     return "podman" in DOCKER
-def clean_whitespaces(text: str) -> str:
+def json_dumps(data: Any) -> str:
+    import json # pylint: disable=import-outside-toplevel
     if need_to_clean_whitespaces():
-        return text.replace('": ', '":').replace(', "', ',"').replace(', {', ',{')
-    return text
+        return json.dumps(data, separators=(",", ":"))
+    return json.dumps(data)
+def json_skip(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in " \t\n\r":
+        pos += 1
+    return pos
+def json_members(text: str, start: int) -> List[Tuple[str, int, int, int, int]]:
+    """ scan the json object at text[start] => [(key, key_start, key_end, value_start, value_end)] """
+    import json # pylint: disable=import-outside-toplevel
+    decoder = json.JSONDecoder()
+    members: List[Tuple[str, int, int, int, int]] = []
+    if text[start] != "{":
+        raise ValueError("no json object at %i" % start)
+    pos = json_skip(text, start + 1)
+    if text[pos] == "}":
+        return members
+    while True:
+        if text[pos] != '"':
+            raise ValueError("no json key at %i" % pos)
+        key, key_end = json.decoder.scanstring(text, pos + 1)  # type: ignore[attr-defined]
+        colon = json_skip(text, key_end)
+        if text[colon] != ":":
+            raise ValueError("no json colon at %i" % colon)
+        value_start = json_skip(text, colon + 1)
+        _, value_end = decoder.raw_decode(text, value_start)
+        members.append((key, pos, key_end, value_start, value_end))
+        pos = json_skip(text, value_end)
+        if text[pos] == "}":
+            return members
+        if text[pos] != ",":
+            raise ValueError("no json comma at %i" % pos)
+        pos = json_skip(text, pos + 1)
+def json_elements(text: str, start: int) -> List[Tuple[int, int]]:
+    """ scan the json array at text[start] => [(value_start, value_end)] """
+    import json # pylint: disable=import-outside-toplevel
+    decoder = json.JSONDecoder()
+    elements: List[Tuple[int, int]] = []
+    if text[start] != "[":
+        raise ValueError("no json array at %i" % start)
+    pos = json_skip(text, start + 1)
+    if text[pos] == "]":
+        return elements
+    while True:
+        _, value_end = decoder.raw_decode(text, pos)
+        elements.append((pos, value_end))
+        pos = json_skip(text, value_end)
+        if text[pos] == "]":
+            return elements
+        if text[pos] != ",":
+            raise ValueError("no json comma at %i" % pos)
+        pos = json_skip(text, pos + 1)
+def json_separators(text: str, start: int) -> Tuple[str, str]:
+    """ guess the separators that were used to write the json text """
+    item_separator, key_separator = ", ", ": "
+    members = json_members(text, start)
+    if members:
+        _, _, key_end, value_start, value_end = members[0]
+        key_separator = ":" if text[key_end:value_start] == ":" else ": "
+        if len(members) > 1:
+            item_separator = "," if text[value_end:members[1][1]] == "," else ", "
+        else:
+            item_separator = "," if key_separator == ":" else ", "
+    return item_separator, key_separator
+def json_splice(text: str, data: Any, changes: Sequence[ConfigPath]) -> Optional[str]:
+    """ rewrite only the changed paths of the original json text, keeping all other bytes.
+        Returns None if the changes can not be spliced, then the caller should use json_dumps. """
+    import json # pylint: disable=import-outside-toplevel
+    if not changes:
+        return text
+    try:
+        root = json_skip(text, 0)
+        separators = json_separators(text, root)
+        def dumps(value: Any) -> str:
+            return json.dumps(value, separators=separators)
+        def find_new(path: ConfigPath) -> Tuple[bool, Any]:
+            node = data
+            for elem in path:
+                if isinstance(elem, int):
+                    if not isinstance(node, list) or elem >= len(node):
+                        return False, None
+                elif not isinstance(node, dict) or elem not in node:
+                    return False, None
+                node = node[elem]
+            return True, node
+        def find_old(path: ConfigPath) -> Tuple[int, int]:
+            """ the depth up to which the path exists in the old text, and the start of that value """
+            node = root
+            for depth, elem in enumerate(path):
+                if isinstance(elem, int):
+                    if text[node] != "[":
+                        return depth, node
+                    elements = json_elements(text, node)
+                    if elem >= len(elements):
+                        return depth, node
+                    node = elements[elem][0]
+                else:
+                    if text[node] != "{":
+                        return depth, node
+                    found = [member for member in json_members(text, node) if member[0] == elem]
+                    if not found:
+                        return depth, node
+                    node = found[-1][3]
+            return len(path), node
+        def container(path: ConfigPath, node: int) -> bool:
+            return text[node] == ("[" if isinstance(path[-1], int) else "{")
+        # resolve each change to a 'replace', 'insert' or 'remove' operation
+        ops: Dict[ConfigPath, str] = {}
+        for path in changes:
+            exists, _ = find_new(path)
+            depth, node = find_old(path)
+            if depth == len(path):
+                ops[path] = "replace" if exists else "remove"
+            elif exists:
+                found = path[:depth + 1]
+                if container(found, node):
+                    ops[found] = "insert"
+                else:
+                    ops[path[:depth]] = "replace"
+        while True:
+            # drop changes inside of values that are replaced, inserted or removed as a whole
+            replaced = list(ops.keys())
+            for path in replaced:
+                for other in replaced:
+                    if len(other) < len(path) and path[:len(other)] == other:
+                        del ops[path]
+                        break
+            # more than one removal in a container is done by replacing the container
+            escalate: List[ConfigPath] = []
+            parents: Dict[ConfigPath, List[str]] = {}
+            for path, op in ops.items():
+                if op in ["remove", "insert"]:
+                    parents.setdefault(path[:-1], []).append(op)
+            for parent, parentops in parents.items():
+                if parentops.count("remove") > 1 or ("remove" in parentops and "insert" in parentops):
+                    escalate.append(parent)
+            if not escalate:
+                break
+            for parent in escalate:
+                if not parent:
+                    return dumps(data)
+                ops[parent] = "replace"
+        # compute the text edits on the original text
+        edits: List[Tuple[int, int, str]] = []
+        inserts: Dict[ConfigPath, List[ConfigPath]] = {}
+        for path, op in ops.items():
+            if op == "insert":
+                inserts.setdefault(path[:-1], []).append(path)
+                continue
+            if not path:
+                return dumps(data)
+            _, node = find_old(path[:-1])
+            if isinstance(path[-1], int):
+                spans = json_elements(text, node)
+                index = path[-1]
+            else:
+                members = json_members(text, node)
+                spans = [(member[1], member[4]) for member in members]
+                index = [n for n, member in enumerate(members) if member[0] == path[-1]][-1]
+            if op == "replace":
+                _, value = find_new(path)
+                _, value_node = find_old(path)
+                _, value_end = json.JSONDecoder().raw_decode(text, value_node)
+                edits.append((value_node, value_end, dumps(value)))
+            elif index > 0:
+                edits.append((spans[index - 1][1], spans[index][1], ""))
+            elif len(spans) > 1:
+                edits.append((spans[0][0], spans[1][0], ""))
+            else:
+                edits.append((spans[0][0], spans[0][1], ""))
+        for parent, paths in inserts.items():
+            _, node = find_old(parent)
+            if text[node] == "[":
+                ends = [span[1] for span in json_elements(text, node)]
+                paths = sorted(paths, key=lambda path: int(path[-1]))
+            else:
+                ends = [member[4] for member in json_members(text, node)]
+            newtext = ""
+            for path in paths:
+                _, value = find_new(path)
+                if newtext or ends:
+                    newtext += separators[0]
+                if isinstance(path[-1], int):
+                    newtext += dumps(value)
+                else:
+                    newtext += json.dumps(path[-1]) + separators[1] + dumps(value)
+            position = ends[-1] if ends else node + 1
+            edits.append((position, position, newtext))
+        for start, end, newtext in sorted(edits, reverse=True):
+            text = text[:start] + newtext + text[end:]
+        if json.loads(text) != data:
+            logg.warning("could not splice the json changes (checked %s)", len(changes))
+            return None
+        return text
+    except (ValueError, IndexError) as e:
+        logg.warning("could not splice the json changes: %s", e)
+        return None
 def chmod_file_stat(filename: str) -> None:
     if need_to_chmod_file_stat():
         os.chmod(filename, 0o644)
@@ -291,7 +651,323 @@ class ImageName:
                 yield "image version= " + self.version
 
 Commands = List[Tuple[Optional[str], Optional[str], Optional[str]]]
+
+class PhaseTiming(NamedTuple):
+    phase: str
+    wall: float  # seconds
+    cpu: float  # seconds in this process
+    children: float  # seconds in the subprocesses that have finished (docker, tar)
+    bytes_in: int
+    bytes_out: int
+    disk: int  # temp-disk usage at the end of the phase
+
+def disk_usage(path: str) -> int:
+    """ the bytes of the files below path (as 'du' does) """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+TRACE_LOCK = threading.Lock()
+
+def trace_event(name: str, started: float, ended: float, args: Dict[str, Any]) -> None:
+    """ a complete span on the track of the current thread (--trace=FILE) """
+    thread = threading.current_thread()
+    with TRACE_LOCK:
+        if thread.ident not in JOB.trace_threads:
+            track = 1 if thread is threading.main_thread() else len(JOB.trace_threads) + 2
+            JOB.trace_threads[thread.ident or 0] = track
+            JOB.trace_events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track,
+                                 "args": {"name": "main" if track == 1 else F"worker {track - 1}"}})
+        JOB.trace_events.append({"name": name, "cat": "copyedit", "ph": "X", "pid": os.getpid(), "tid": JOB.trace_threads[thread.ident or 0],
+                             "ts": int((started - JOB.trace_started) * 1000000), "dur": int((ended - started) * 1000000),
+                             "args": args})
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """ trace a worker step - the body may add args like the 'bytes' and the 'result' """
+    if not TRACE:
+        yield args
+        return
+    started = time.monotonic()
+    try:
+        yield args
+    finally:
+        trace_event(name, started, time.monotonic(), args)
+
+def write_file(filename: str, text: str) -> None:
+    """ replace the file atomically - through a temp file of its own, so that parallel runs do not share one """
+    import tempfile # pylint: disable=import-outside-toplevel
+    fd, tmpfile = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp", dir=os.path.dirname(filename) or ".")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            fp.write(text)
+        os.chmod(tmpfile, 0o644)
+        os.rename(tmpfile, filename)
+    except BaseException:
+        os.remove(tmpfile)
+        raise
+
+def write_trace(filename: str) -> None:
+    """ the spans as Chrome trace-event json (for chrome://tracing or ui.perfetto.dev) """
+    import json # pylint: disable=import-outside-toplevel
+    text = json.dumps({"traceEvents": JOB.trace_events, "displayTimeUnit": "ms"}) + "\n"
+    write_file(filename, text)
+
+@contextlib.contextmanager
+def phase(name: str, tmpdir: str = "", image: str = "") -> Iterator[Dict[str, Any]]:
+    """ record the wall and cpu time of a phase - the body may fill in the 'in' and 'out' bytes and the 'result' """
+    sizes: Dict[str, Any] = {"in": 0, "out": 0}
+    started, times = time.monotonic(), os.times()
+    try:
+        yield sizes
+    finally:
+        ended, stopped = os.times(), time.monotonic()
+        disk = disk_usage(tmpdir) if tmpdir and (TIMINGS_REPORT or JSON_REPORT) and os.path.exists(tmpdir) else 0
+        JOB.timings.append(PhaseTiming(name, stopped - started,
+                                   (ended.user - times.user) + (ended.system - times.system),
+                                   (ended.children_user - times.children_user) + (ended.children_system - times.children_system),
+                                   sizes["in"], sizes["out"], disk))
+        if TRACE:
+            trace_event(name, started, stopped, {"image": image, "bytes_in": sizes["in"], "bytes_out": sizes["out"],
+                                                 "result": sizes.get("result", "")})
+
+@contextlib.contextmanager
+def profiled() -> Iterator[None]:
+    """ run parse_commands, edit_datadir and the tar handling under cProfile / tracemalloc (-c PROFILE=cpu|mem) """
+    if PROFILE not in ("cpu", "mem") or JOB.profiled:
+        yield
+        return
+    import cProfile # pylint: disable=import-outside-toplevel
+    import tracemalloc # pylint: disable=import-outside-toplevel
+    JOB.profiled += 1
+    for name in ("datetime", "shutil", "tarfile", "tempfile"):
+        __import__(name)  # the deferred imports are not what the profile is about
+    if PROFILE == "cpu":
+        if JOB.profiler is None:
+            JOB.profiler = cProfile.Profile()
+        JOB.profiler.enable()
+    elif not tracemalloc.is_tracing():
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        JOB.profiled -= 1
+        if PROFILE == "cpu" and JOB.profiler is not None:
+            JOB.profiler.disable()
+        elif tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            if JOB.snapshot is None or sum(stat.size for stat in snapshot.statistics("filename")) > sum(stat.size for stat in JOB.snapshot.statistics("filename")):
+                JOB.snapshot = snapshot
+
+def write_profile(tmpdir: str) -> str:
+    """ the cpu pstats or the tracemalloc top-N into the tmpdir - with the subprocess time apart. The names get a
+        part of their own (profile.XXXX.pstats and profile.XXXX.txt) so that the jobs on a shared tmpdir keep theirs """
+    import pstats # pylint: disable=import-outside-toplevel
+    import tempfile # pylint: disable=import-outside-toplevel
+    import tracemalloc # pylint: disable=import-outside-toplevel
+    if not os.path.isdir(tmpdir):
+        os.makedirs(tmpdir, exist_ok=True)
+    times = os.times()
+    output = io.StringIO()
+    output.write("in-process cpu %.3fs\n" % (times.user + times.system))
+    output.write("subprocesses cpu %.3fs (%i calls waited %.3fs)\n" % (
+        times.children_user + times.children_system, JOB.subprocesses["calls"], JOB.subprocesses["wall"]))
+    fd, filename = tempfile.mkstemp(prefix="profile.", suffix=".pstats" if PROFILE == "cpu" else ".mem.txt", dir=tmpdir)
+    os.close(fd)
+    if PROFILE == "cpu":
+        if JOB.profiler is not None:
+            JOB.profiler.dump_stats(filename)
+            pstats.Stats(JOB.profiler, stream=output).sort_stats("cumulative").print_stats(PROFILETOP)
+    else:
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            output.write("traced memory %i bytes, peak %i bytes\n" % (current, peak))
+            tracemalloc.stop()
+        for stat in (JOB.snapshot.statistics("lineno") if JOB.snapshot else [])[:PROFILETOP]:
+            output.write("%s\n" % stat)
+    textfile = filename if PROFILE == "mem" else filename[:-len(".pstats")] + ".txt"
+    with open(textfile, "w") as fp:
+        fp.write(output.getvalue())
+    return filename
+
+def timings_summary() -> List[str]:
+    lines = ["%-8s %9s %9s %9s %10s %10s %10s" % ("phase", "wall", "cpu", "children", "in", "out", "disk")]
+    for timing in JOB.timings:
+        lines.append("%-8s %8.3fs %8.3fs %8.3fs %10i %10i %10i" % timing)
+    lines.append("%-8s %8.3fs %8.3fs %8.3fs %10s %10s %10i" % (
+        "total", sum(timing.wall for timing in JOB.timings), sum(timing.cpu for timing in JOB.timings),
+        sum(timing.children for timing in JOB.timings), "", "", max([timing.disk for timing in JOB.timings] or [0])))
+    lines.append("configs rewritten %i, hash collisions %i" % (JOB.counters["configs_rewritten"], JOB.counters["hash_collisions"]))
+    return lines
+
+def write_report(filename: str, image: str) -> None:
+    """ the timings and counters of the job as json (to stdout for '-') """
+    import json # pylint: disable=import-outside-toplevel
+    report = {"image": image, "phases": [timing._asdict() for timing in JOB.timings], "counters": JOB.counters,
+              "wall": sum(timing.wall for timing in JOB.timings), "peak_disk": max([timing.disk for timing in JOB.timings] or [0])}
+    text = json.dumps(report, indent=2) + "\n"
+    if filename == "-":
+        sys.stdout.write(text)
+    else:
+        write_file(filename, text)
+
+def metric_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+def metric_families(exitcode: int) -> List[Tuple[str, str, str, List[Tuple[str, float]]]]:
+    """ the samples of this run => (name, type, help, [(sample, value)]) """
+    prefix = "docker_copyedit"
+    durations: List[Tuple[str, float]] = []
+    for name in sorted(set(timing.phase for timing in JOB.timings)):
+        walls = [timing.wall for timing in JOB.timings if timing.phase == name]
+        for bucket in METRICBUCKETS:
+            durations.append((F'{prefix}_phase_duration_seconds_bucket{{phase="{name}",le="{bucket:g}"}}',
+                              len([wall for wall in walls if wall <= bucket])))
+        durations.append((F'{prefix}_phase_duration_seconds_bucket{{phase="{name}",le="+Inf"}}', len(walls)))
+        durations.append((F'{prefix}_phase_duration_seconds_sum{{phase="{name}"}}', sum(walls)))
+        durations.append((F'{prefix}_phase_duration_seconds_count{{phase="{name}"}}', len(walls)))
+    failures: List[Tuple[str, float]] = []
+    if exitcode:
+        failures.append((F'{prefix}_failures_total{{phase="{JOB.timings[-1].phase if JOB.timings else "parse"}"}}', 1))
+    return [
+        (F"{prefix}_images_processed_total", "counter", "images written by an edit",
+         [(F"{prefix}_images_processed_total", len(JOB.results))]),
+        (F"{prefix}_images_unchanged_total", "counter", "images skipped as unchanged",
+         [(F"{prefix}_images_unchanged_total", len([result for result in JOB.results if not result.changed]))]),
+        (F"{prefix}_bytes_total", "counter", "bytes of the saved and the loaded image archives",
+         [(F'{prefix}_bytes_total{{direction="saved"}}', sum(timing.bytes_out for timing in JOB.timings if timing.phase == "save")),
+          (F'{prefix}_bytes_total{{direction="loaded"}}', sum(timing.bytes_in for timing in JOB.timings if timing.phase == "load"))]),
+        (F"{prefix}_cache_total", "counter", "lookups of an already edited image",
+         [(F'{prefix}_cache_total{{result="hit"}}', JOB.counters["cache_hits"]),
+          (F'{prefix}_cache_total{{result="miss"}}', JOB.counters["cache_misses"])]),
+        (F"{prefix}_phase_duration_seconds", "histogram", "wall time of the phases", durations),
+        (F"{prefix}_failures_total", "counter", "failed runs by the phase they stopped in", failures),
+        (F"{prefix}_last_run_timestamp_seconds", "gauge", "end of the last run",
+         [(F"{prefix}_last_run_timestamp_seconds", int(time.time()))]),
+        (F"{prefix}_last_run_success", "gauge", "whether the last run succeeded",
+         [(F"{prefix}_last_run_success", 0 if exitcode else 1)])]
+
+def write_metrics(filename: str, exitcode: int) -> None:
+    """ rewrite the Prometheus textfile atomically - adding this run to the counters that are already in it """
+    import fcntl # pylint: disable=import-outside-toplevel
+    with open(filename + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # parallel runs add up instead of the last one winning
+        write_file(filename, "\n".join(metric_lines(filename, exitcode)) + "\n")
+
+def metric_lines(filename: str, exitcode: int) -> List[str]:
+    """ the textfile lines of this run - with the counters already in the file added up """
+    previous: Dict[str, float] = {}
+    if os.path.exists(filename):
+        with open(filename) as fp:
+            for line in fp:
+                if line.strip() and not line.startswith("#"):
+                    sample, _, number = line.strip().rpartition(" ")
+                    try:
+                        previous[sample] = float(number)
+                    except ValueError:
+                        logg.debug("ignored metric %s", line.strip())
+    lines: List[str] = []
+    for name, kind, text, samples in metric_families(exitcode):
+        values = dict(samples)
+        if kind != "gauge":
+            for sample, value in previous.items():
+                if re.match(re.escape(name) + r"(_bucket|_sum|_count)?(\{|$)", sample):
+                    values[sample] = values.get(sample, 0) + value
+        lines += [F"# HELP {name} {text}", F"# TYPE {name} {kind}"]
+        lines += [F"{sample} {metric_value(value)}" for sample, value in sorted(values.items())]
+    return lines
+
+class EditResult(NamedTuple):
+    image: str  # the INTO name
+    id: str  # sha256 of the config (the image id of docker and podman), empty if not known
+    digest: str = ""  # sha256 of the manifest (in a registry or oci layout)
+    changed: bool = True
+
+class JobState:
+    """ what a job has timed, counted, traced and written - run_job starts each job with a new one """
+    def __init__(self) -> None:
+        self.timings: List[PhaseTiming] = []
+        self.counters: Dict[str, int] = {"configs_rewritten": 0, "hash_collisions": 0, "cache_hits": 0, "cache_misses": 0}
+        self.results: List[EditResult] = []
+        self.trace_events: List[Dict[str, Any]] = []
+        self.trace_threads: Dict[int, int] = {}  # thread ident => track (the main thread is 1)
+        self.trace_started = time.monotonic()
+        self.subprocesses: Dict[str, float] = {"calls": 0, "wall": 0.}  # waited in sh()
+        self.profiler: "Optional[cProfile.Profile]" = None
+        self.profiled = 0  # nesting depth of the profiled() sections
+        self.snapshot: "Optional[tracemalloc.Snapshot]" = None
+
+JOB = JobState()
+
+def edit_result(image: str, image_id: str, digest: str = "", changed: bool = True) -> None:
+    """ remember the new image id (and manifest digest) for --result - callers do not need to inspect it """
+    JOB.results.append(EditResult(image, image_id, digest, changed))
+    logg.info("result %s id %s %s", image, image_id or "(unknown)", digest)
+
+def write_results(filename: str) -> None:
+    """ the results of the job as json (to stdout for '-') """
+    import json # pylint: disable=import-outside-toplevel
+    text = json.dumps([result._asdict() for result in JOB.results], indent=2) + "\n"
+    if filename == "-":
+        sys.stdout.write(text)
+    else:
+        write_file(filename, text)
+def reclaim_workdirs(tmpdir: str) -> List[str]:
+    """ remove the job directories whose lock is free - their job has crashed (the ones of -k have a 'keep' file) """
+    import fcntl # pylint: disable=import-outside-toplevel
+    import shutil # pylint: disable=import-outside-toplevel
+    reclaimed: List[str] = []
+    for name in sorted(os.listdir(tmpdir)):
+        workdir = os.path.join(tmpdir, name)
+        if not name.startswith("job.") or not os.path.isdir(workdir) or os.path.exists(os.path.join(workdir, "keep")):
+            continue
+        try:
+            with open(os.path.join(workdir, "lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            continue  # a running job (or one that is just removing its directory)
+        logg.warning("removing stale %s", workdir)
+        shutil.rmtree(workdir, ignore_errors=True)
+        reclaimed.append(workdir)
+    return reclaimed
+
+@contextlib.contextmanager
+def workspace(tmpdir: str) -> Iterator[str]:
+    """ a work directory of its own for the job below the tmpdir, held by an advisory lock on its 'lock' file
+        as long as the job runs - removed at the end unless something was kept with -k """
+    import fcntl # pylint: disable=import-outside-toplevel
+    import shutil # pylint: disable=import-outside-toplevel
+    import tempfile # pylint: disable=import-outside-toplevel
+    if DRYRUN:
+        yield os.path.join(tmpdir, "job.dryrun")
+        return
+    if not os.path.isdir(tmpdir):
+        logg.debug("mkdir %s", tmpdir)
+        os.makedirs(tmpdir, exist_ok=True)
+    with open(os.path.join(tmpdir, "jobs.lock"), "w") as jobs:
+        fcntl.flock(jobs, fcntl.LOCK_EX)  # no other job is between its mkdtemp and its lock
+        reclaim_workdirs(tmpdir)
+        workdir = tempfile.mkdtemp(prefix="job.", dir=tmpdir)
+        lock = open(os.path.join(workdir, "lock"), "w")
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    try:
+        yield workdir
+    finally:
+        if KEEPDIR or KEEPDATADIR or KEEPSAVEFILE or KEEPINPUTFILE or KEEPOUTPUTFILE:
+            open(os.path.join(workdir, "keep"), "w").close()
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+        lock.close()
+
 def edit_image(inp: Optional[str], out: Optional[str], edits: Commands) -> int:
+    import shutil # pylint: disable=import-outside-toplevel
     if not inp:
         raise CommandError("no FROM value provided")
     elif not out:
@@ -310,452 +986,641 @@ def edit_image(inp: Optional[str], out: Optional[str], edits: Commands) -> int:
         inp_tag = inp
         out_tag = out_name.tag()
         #
-        tmpdir = TMPDIR
-        if not os.path.isdir(tmpdir):
-            logg.debug("mkdir %s", tmpdir)
-            if not DRYRUN:
-                os.makedirs(tmpdir)
-        datadir = os.path.join(tmpdir, "data")
-        if not os.path.isdir(datadir):
-            logg.debug("mkdir %s", datadir)
-            if not DRYRUN:
-                os.makedirs(datadir)
-        inputfile = os.path.join(tmpdir, "saved.tar")
-        outputfile = os.path.join(tmpdir, "ready.tar")
-        inputfile_hints = ""
-        outputfile_hints = ""
+        if layout_reference(inp)[0] or layout_reference(out)[0]:
+            with phase("layout", TMPDIR, out):
+                return edit_layout(inp, out, edits)
+        if REGISTRY:
+            with phase("registry", image=out):
+                return edit_registry(inp, out, edits)
+        if OFFLINE and "podman" in DOCKER:
+            with phase("offline", image=out_tag):
+                return edit_storage(PODMANSTORAGE, inp, out_tag, edits)
+        if OFFLINE:
+            with phase("offline", image=out_tag):
+                return edit_imagedb(DOCKERROOT, inp, out_tag, edits)
         #
-        docker = DOCKER
-        tar = TAR
-        if KEEPSAVEFILE:
-            if os.path.exists(inputfile):
-                os.remove(inputfile)
-            sh(F"{docker} save {inp} -o {inputfile}")
-            sh(F"{tar} xf {inputfile} -C {datadir}")
-            logg.info("%s", F"new {datadir} from {inputfile}")
-        else:
-            sh(F"{docker} save {inp} | {tar} x -f - -C {datadir}")
-            logg.info("%s", F"new {datadir} from {docker} save")
-            inputfile_hints += " (not created)"
-        tmplist = sh(F"ls -l {tmpdir}")
-        logg.debug(tmplist.stdout)
+        if registry_domain(inp) and not image_present(DOCKER, inp):
+            with phase("pull-load", image=out_tag):
+                return load_registry_image(inp, out_tag, edits)
+        applied = edits_applied(DOCKER, inp, edits) if not IMPORT else ""  # one 'docker history' that can spare the save
+        if applied:
+            logg.warning("unchanged image from %s (edits were already applied)", inp_tag)
+            if inp != out:
+                sh(F"{DOCKER} tag {inp_tag} {out_tag}")
+                logg.warning(" tagged old image as %s", out_tag)
+            edit_result(out_tag, applied if applied.startswith("sha256:") else "", changed=False)
+            return os.EX_OK
+        if IMPORT and not LOAD and not KEEPDATADIR and not KEEPSAVEFILE:
+            with phase("import", image=out_tag):
+                return import_image(inp, out_tag, edits)
         #
-        if not DRYRUN:
-            changed = edit_datadir(datadir, out_tag, edits)
-            if changed or IMPORT:
-                outfile = os.path.realpath(outputfile)
-                sh(F"cd {datadir} && {tar} cf {outfile} .")
-                import_docker = IMPORT or DOCKER
-                sh(F"{import_docker} load -i {outputfile}")
-                logg.debug("done loading %s", outputfile)
+        with workspace(TMPDIR) as tmpdir:
+            datadir = os.path.join(tmpdir, "data")
+            if not os.path.isdir(datadir):
+                logg.debug("mkdir %s", datadir)
+                if not DRYRUN:
+                    os.makedirs(datadir)
+            inputfile = os.path.join(tmpdir, "saved.tar")
+            outputfile = os.path.join(tmpdir, "ready.tar")
+            inputfile_hints = ""
+            outputfile_hints = ""
+            exitcode = os.EX_OK
+            #
+            docker = DOCKER
+            tar = TAR
+            if KEEPSAVEFILE:
+                if os.path.exists(inputfile):
+                    os.remove(inputfile)
+                with phase("save", tmpdir, out_tag) as sizes:
+                    if progress_enabled():
+                        sh_pipe(F"{docker} save {inp}", F"cat > {inputfile}", "save", progress_expected(docker, inp))
+                    else:
+                        sh(F"{docker} save {inp} -o {inputfile}")
+                    sizes["out"] = os.path.getsize(inputfile) if os.path.exists(inputfile) else 0
+                with phase("unpack", tmpdir, out_tag) as sizes:
+                    if progress_enabled():
+                        sh_pipe(F"cat {inputfile}", F"{tar} x -f - -C {datadir}", "unpack",
+                                os.path.getsize(inputfile) if os.path.exists(inputfile) else 0)
+                    else:
+                        sh(F"{tar} xf {inputfile} -C {datadir}")
+                    sizes["in"] = os.path.getsize(inputfile) if os.path.exists(inputfile) else 0
+                    sizes["out"] = disk_usage(datadir)
+                logg.info("%s", F"new {datadir} from {inputfile}")
             else:
-                logg.warning("unchanged image from %s", inp_tag)
-                outputfile_hints += " (not created)"
-                if inp != out:
-                    sh(F"{docker} tag {inp_tag} {out_tag}")
-                    logg.warning(" tagged old image as %s", out_tag)
-        #
-        if KEEPDATADIR:
-            logg.warning("keeping %s", datadir)
-        else:
-            if os.path.exists(datadir):
-                shutil.rmtree(datadir)
-        if KEEPINPUTFILE:
-            logg.warning("keeping %s%s", inputfile, inputfile_hints)
-        else:
-            if os.path.exists(inputfile):
-                os.remove(inputfile)
-        if KEEPOUTPUTFILE:
-            logg.warning("keeping %s%s", outputfile, outputfile_hints)
-        else:
-            if os.path.exists(outputfile):
-                os.remove(outputfile)
-        return os.EX_OK
+                with phase("save", tmpdir, out_tag) as sizes:
+                    if progress_enabled():
+                        sh_pipe(F"{docker} save {inp}", F"{tar} x -f - -C {datadir}", "save", progress_expected(docker, inp))
+                    else:
+                        sh(F"{docker} save {inp} | {tar} x -f - -C {datadir}")
+                    sizes["out"] = disk_usage(datadir)
+                logg.info("%s", F"new {datadir} from {docker} save")
+                inputfile_hints += " (not created)"
+            tmplist = sh(F"ls -l {tmpdir}")
+            logg.debug(tmplist.stdout)
+            #
+            if not DRYRUN:
+                with phase("edit", tmpdir, out_tag) as sizes:
+                    try:
+                        with profiled():
+                            changed = edit_datadir(datadir, out_tag, edits)
+                    except CommandError as e:
+                        logg.error("%s", e)
+                        changed, exitcode = 0, os.EX_USAGE
+                    sizes["result"] = "failed" if exitcode else "changed" if changed else "unchanged"
+            if not DRYRUN and not exitcode:
+                import_docker = IMPORT or DOCKER
+                image_ids = datadir_image_ids(datadir)
+                edit_result(out_tag, image_ids[0] if image_ids else "", changed=bool(changed))
+                lookup = bool(changed and SOURCE_DATE_EPOCH and image_ids and not LOAD)
+                present = lookup and all(image_present(import_docker, image_id) for image_id in image_ids)
+                if lookup:
+                    JOB.counters["cache_hits" if present else "cache_misses"] += 1
+                if present:
+                    logg.warning("edited image is already present as %s", image_ids[0])
+                    outputfile_hints += " (not created)"
+                    with phase("tag", tmpdir, out_tag):
+                        sh(F"{import_docker} tag {image_ids[0]} {out_tag}")
+                    logg.warning(" tagged present image as %s", out_tag)
+                elif LOAD:
+                    outputfile_hints += " (not created)"
+                    with phase("load", tmpdir, out_tag) as sizes:
+                        sizes["in"] = disk_usage(datadir)
+                        exitcode = load_datadir(datadir)
+                        sizes["result"] = "failed" if exitcode else "loaded"
+                    logg.debug("done loading into %s", LOAD)
+                elif changed or IMPORT:
+                    outfile = os.path.realpath(outputfile)
+                    with phase("pack", tmpdir, out_tag) as sizes:
+                        sizes["in"] = disk_usage(datadir)
+                        if progress_enabled():
+                            sh_pipe(F"cd {datadir} && {tar} cf - .", F"cat > {outfile}", "pack", sizes["in"])
+                        else:
+                            sh(F"cd {datadir} && {tar} cf {outfile} .")
+                        sizes["out"] = os.path.getsize(outfile) if os.path.exists(outfile) else 0
+                    with phase("load", tmpdir, out_tag) as sizes:
+                        if progress_enabled():
+                            sh_pipe(F"cat {outfile}", F"{import_docker} load", "load", os.path.getsize(outfile))
+                        else:
+                            sh(F"{import_docker} load -i {outputfile}")
+                        sizes["in"] = os.path.getsize(outfile) if os.path.exists(outfile) else 0
+                        sizes["result"] = "loaded"
+                    logg.debug("done loading %s", outputfile)
+                else:
+                    logg.warning("unchanged image from %s", inp_tag)
+                    outputfile_hints += " (not created)"
+                    if inp != out:
+                        with phase("tag", tmpdir, out_tag):
+                            sh(F"{docker} tag {inp_tag} {out_tag}")
+                        logg.warning(" tagged old image as %s", out_tag)
+            #
+            with phase("cleanup", tmpdir, out_tag):
+                if KEEPDATADIR:
+                    logg.warning("keeping %s", datadir)
+                else:
+                    if os.path.exists(datadir):
+                        shutil.rmtree(datadir)
+                if KEEPINPUTFILE:
+                    logg.warning("keeping %s%s", inputfile, inputfile_hints)
+                else:
+                    if os.path.exists(inputfile):
+                        os.remove(inputfile)
+                if KEEPOUTPUTFILE:
+                    logg.warning("keeping %s%s", outputfile, outputfile_hints)
+                else:
+                    if os.path.exists(outputfile):
+                        os.remove(outputfile)
+            return exitcode
+
+
+def edit_config(config: Dict[str, Any], edits: Commands, config_filename: str = "") -> List[ConfigPath]:
+    """ apply the edits to the parsed image config and return the paths that were changed """
+    import json # pylint: disable=import-outside-toplevel
+    changes: List[ConfigPath] = []
+    args: List[str]
+    for CONFIG in ['config', 'Config', 'container_config']:
+        if CONFIG not in config:
+            logg.debug("no section '%s' in config", CONFIG)
+            continue
+        logg.debug("with %s: %s", CONFIG, config[CONFIG])
+        for action, target, arg in edits:
+            if action in ["remove", "rm"] and target in ["volume", "volumes"]:
+                key = 'Volumes'
+                if not arg:
+                    logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
+                    continue
+                elif target in ["volumes"] and arg in ["*", "%"]:
+                    args = []
+                    try:
+                        if key in config[CONFIG] and config[CONFIG][key] is not None:
+                            del config[CONFIG][key]
+                            changes.append((CONFIG, key))
+                            logg.warning("done actual config %s %s '%s'", action, target, arg)
+                    except KeyError:
+                        logg.warning("there was no '%s' in %s", key, config_filename)
+                elif target in ["volumes"]:
+                    pattern = arg.replace("%", "*")
+                    args = []
+                    if key in config[CONFIG] and config[CONFIG][key] is not None:
+                        for entry in config[CONFIG][key]:
+                            if fnmatch(entry, pattern):
+                                args += [entry]
+                    logg.debug("volume pattern %s -> %s", pattern, args)
+                    if not args:
+                        logg.warning("%s pattern '%s' did not match anything", target, pattern)
+                elif arg.startswith("/"):
+                    args = [arg]
+                else:
+                    logg.error("can not do edit %s %s %s", action, target, arg)
+                    continue
+                #
+                for arg in args:
+                    entry = os.path.normpath(arg)
+                    try:
+                        if config[CONFIG][key] is None:
+                            raise KeyError("null section " + key)
+                        del config[CONFIG][key][entry]
+                        changes.append((CONFIG, key, entry))
+                    except KeyError:
+                        logg.warning("there was no '%s' in '%s' of  %s", entry, key, config_filename)
+            if action in ["remove", "rm"] and target in ["port", "ports"]:
+                key = 'ExposedPorts'
+                if not arg:
+                    logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
+                    continue
+                elif target in ["ports"] and arg in ["*", "%"]:
+                    args = []
+                    try:
+                        if key in config[CONFIG] and config[CONFIG][key] is not None:
+                            del config[CONFIG][key]
+                            changes.append((CONFIG, key))
+                            logg.warning("done actual config %s %s %s", action, target, arg)
+                    except KeyError:
+                        logg.warning("there were no '%s' in %s", key, config_filename)
+                elif target in ["ports"]:
+                    pattern = arg.replace("%", "*")
+                    args = []
+                    if key in config[CONFIG] and config[CONFIG][key] is not None:
+                        for entry in config[CONFIG][key]:
+                            if fnmatch(entry, pattern):
+                                args += [entry]
+                    logg.debug("ports pattern %s -> %s", pattern, args)
+                    if not args:
+                        logg.warning("%s pattern '%s' did not match anything", target, pattern)
+                else:
+                    args = [arg]
+                #
+                for arg in args:
+                    port, prot = portprot(arg)
+                    if not port:
+                        logg.error("can not do edit %s %s %s", action, target, arg)
+                        raise CommandError("bad port value %s" % arg)
+                    entry = F"{port}/{prot}"
+                    try:
+                        if config[CONFIG][key] is None:
+                            raise KeyError("null section " + key)
+                        del config[CONFIG][key][entry]
+                        changes.append((CONFIG, key, entry))
+                        logg.info("done rm-port '%s' from '%s'", entry, key)
+                    except KeyError:
+                        logg.warning("there was no '%s' in '%s' of  %s", entry, key, config_filename)
+            if action in ["append", "add"] and target in ["volume"]:
+                if not arg:
+                    logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
+                    continue
+                key = 'Volumes'
+                entry = os.path.normpath(arg)
+                if config[CONFIG].get(key) is None:
+                    config[CONFIG][key] = {}
+                    changes.append((CONFIG, key))
+                if arg not in config[CONFIG][key] and config[CONFIG][key].get(entry) != {}:
+                    config[CONFIG][key][entry] = {}
+                    changes.append((CONFIG, key, entry))
+                    logg.info("added %s to %s", entry, key)
+            if action in ["append", "add"] and target in ["port"]:
+                if not arg:
+                    logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
+                    continue
+                key = 'ExposedPorts'
+                port, prot = portprot(arg)
+                entry = "%s/%s" % (port, prot)
+                if key not in config[CONFIG]:
+                    config[CONFIG][key] = {}
+                    changes.append((CONFIG, key))
+                if arg not in config[CONFIG][key] and config[CONFIG][key].get(entry) != {}:
+                    config[CONFIG][key][entry] = {}
+                    changes.append((CONFIG, key, entry))
+                    logg.info("added %s to %s", entry, key)
+            if action in ["set", "set-shell"] and target in ["entrypoint"]:
+                key = 'Entrypoint'
+                try:
+                    if not arg:
+                        running = None
+                    elif action in ["set-shell"]:
+                        running = ["/bin/sh", "-c", arg]
+                    elif arg.startswith("["):
+                        running = json.loads(arg)
+                    else:
+                        running = [arg]
+                    if key not in config[CONFIG] or config[CONFIG][key] != running:
+                        config[CONFIG][key] = running
+                        changes.append((CONFIG, key))
+                    logg.warning("done edit %s %s", action, arg)
+                except KeyError:
+                    logg.warning("there was no '%s' in %s", key, config_filename)
+            if action in ["set", "set-shell"] and target in ["cmd"]:
+                key = 'Cmd'
+                try:
+                    if not arg:
+                        running = None
+                    elif action in ["set-shell"]:
+                        running = ["/bin/sh", "-c", arg]
+                        logg.info("%s %s", action, running)
+                    elif arg.startswith("["):
+                        running = json.loads(arg)
+                    else:
+                        running = [arg]
+                    if key not in config[CONFIG] or config[CONFIG][key] != running:
+                        config[CONFIG][key] = running
+                        changes.append((CONFIG, key))
+                    logg.warning("done edit %s %s", action, arg)
+                except KeyError:
+                    logg.warning("there was no '%s' in %s", key, config_filename)
+            if action in ["set"] and target in StringConfigs:
+                key = StringConfigs[target]
+                try:
+                    if not arg:
+                        value = ''
+                    else:
+                        value = arg
+                    if key in config[CONFIG]:
+                        if config[CONFIG][key] == value:
+                            logg.warning("unchanged config '%s' %s", key, value)
+                        else:
+                            config[CONFIG][key] = value
+                            changes.append((CONFIG, key))
+                            logg.warning("done edit config '%s' %s", key, value)
+                    else:
+                        config[CONFIG][key] = value
+                        changes.append((CONFIG, key))
+                        logg.warning("done  new config '%s' %s", key, value)
+                except KeyError:
+                    logg.warning("there was no config %s in %s", target, config_filename)
+            if action in ["set"] and target in StringMeta:
+                key = StringMeta[target]
+                try:
+                    if not arg:
+                        value = ''
+                    else:
+                        value = arg
+                    if key in config:
+                        if config[key] == value:
+                            logg.warning("unchanged meta '%s' %s", key, value)
+                        else:
+                            config[key] = value
+                            changes.append((key,))
+                            logg.warning("done edit meta '%s' %s", key, value)
+                    else:
+                        config[key] = value
+                        changes.append((key,))
+                        logg.warning("done  new meta '%s' %s", key, value)
+                except KeyError:
+                    logg.warning("there was no meta %s in %s", target, config_filename)
+            if action in ["set-label"]:
+                key = "Labels"
+                try:
+                    value = arg or ''
+                    if key not in config[CONFIG]:
+                        config[CONFIG][key] = {}
+                        changes.append((CONFIG, key))
+                    if target in config[CONFIG][key]:
+                        if config[CONFIG][key][target] == value:
+                            logg.warning("unchanged label '%s' %s", target, value)
+                        else:
+                            config[CONFIG][key][target] = value
+                            changes.append((CONFIG, key, str(target)))
+                            logg.warning("done edit label '%s' %s", target, value)
+                    else:
+                        config[CONFIG][key][target] = value
+                        changes.append((CONFIG, key, str(target)))
+                        logg.warning("done  new label '%s' %s", target, value)
+                except KeyError:
+                    logg.warning("there was no config %s in %s", target, config_filename)
+            if action in ["remove-label", "rm-label"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Labels"
+                try:
+                    if key in config[CONFIG]:
+                        if config[CONFIG][key] is None:
+                            raise KeyError("null section " + key)
+                        del config[CONFIG][key][target]
+                        changes.append((CONFIG, key, target))
+                        logg.warning("done actual %s %s ", action, target)
+                except KeyError:
+                    logg.warning("there was no label %s in %s", target, config_filename)
+            if action in ["remove-labels", "rm-labels"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Labels"
+                try:
+                    pattern = target.replace("%", "*")
+                    args = []
+                    if key in config[CONFIG] and config[CONFIG][key] is not None:
+                        for entry in config[CONFIG][key]:
+                            if fnmatch(entry, pattern):
+                                args += [entry]
+                    for arg in args:
+                        del config[CONFIG][key][arg]
+                        changes.append((CONFIG, key, arg))
+                        logg.warning("done actual %s %s (%s)", action, target, arg)
+                except KeyError:
+                    logg.warning("there was no label %s in %s", target, config_filename)
+            if action in ["remove-envs", "rm-envs"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Env"
+                try:
+                    pattern = target.strip() + "=*"
+                    pattern = pattern.replace("%", "*")
+                    found = []
+                    if key in config[CONFIG] and config[CONFIG][key] is not None:
+                        for n, entry in enumerate(config[CONFIG][key]):
+                            if fnmatch(entry, pattern):
+                                found += [n]
+                    for n in reversed(found):
+                        del config[CONFIG][key][n]
+                        logg.warning("done actual %s %s (%s)", action, target, n)
+                    if found:
+                        changes.append((CONFIG, key))
+                except KeyError:
+                    logg.warning("there was no label %s in %s", target, config_filename)
+            if action in ["remove-env", "rm-env"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Env"
+                try:
+                    if "=" in target:
+                        pattern = target.strip()
+                    else:
+                        pattern = target.strip() + "=*"
+                    found = []
+                    if key in config[CONFIG] and config[CONFIG][key] is not None:
+                        for n, entry in enumerate(config[CONFIG][key]):
+                            if fnmatch(entry, pattern):
+                                found += [n]
+                    for n in reversed(found):
+                        del config[CONFIG][key][n]
+                        logg.warning("done actual %s %s (%s)", action, target, n)
+                    if found:
+                        changes.append((CONFIG, key))
+                except KeyError:
+                    logg.warning("there was no label %s in %s", target, config_filename)
+            if action in ["remove-healthcheck", "rm-healthcheck"]:
+                key = "Healthcheck"
+                try:
+                    del config[CONFIG][key]
+                    changes.append((CONFIG, key))
+                    logg.warning("done actual %s %s", action, target)
+                except KeyError:
+                    logg.warning("there was no %s in %s", key, config_filename)
+            if action in ["set-envs"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Env"
+                try:
+                    if "=" in target:
+                        pattern = target.strip().replace("%", "*")
+                    else:
+                        pattern = target.strip().replace("%", "*") + "=*"
+                    if key not in config[CONFIG]:
+                        config[key] = {}
+                        changes.append((key,))
+                    found = []
+                    for n, entry in enumerate(config[CONFIG][key]):
+                        if fnmatch(entry, pattern):
+                            found += [n]
+                    if found:
+                        for n in reversed(found):
+                            oldvalue = config[CONFIG][key][n]
+                            varname = oldvalue.split("=", 1)[0]
+                            newvalue = varname + "=" + (arg or '')
+                            if config[CONFIG][key][n] == newvalue:
+                                logg.warning("unchanged var '%s' %s", target, newvalue)
+                            else:
+                                config[CONFIG][key][n] = newvalue
+                                changes.append((CONFIG, key))
+                                logg.warning("done edit var '%s' %s", target, newvalue)
+                    elif "=" in target or "*" in target or "%" in target or "?" in target or "[" in target:
+                        logg.info("non-existing var pattern '%s'", target)
+                    else:
+                        value = target.strip() + "=" + (arg or '')
+                        config[CONFIG][key] += [pattern + value]
+                        changes.append((CONFIG, key))
+                        logg.warning("done  new var '%s' %s", target, value)
+                except KeyError:
+                    logg.warning("there was no config %s in %s", target, config_filename)
+            if action in ["set-env"]:
+                if not target:
+                    logg.error("can not do edit %s without arg: <%s>", action, target)
+                    continue
+                key = "Env"
+                try:
+                    pattern = target.strip() + "="
+                    if key not in config[CONFIG]:
+                        config[key] = {}
+                        changes.append((key,))
+                    found = []
+                    for n, entry in enumerate(config[CONFIG][key]):
+                        if entry.startswith(pattern):
+                            found += [n]
+                    if found:
+                        for n in reversed(found):
+                            oldvalue = config[CONFIG][key][n]
+                            varname = oldvalue.split("=", 1)[0]
+                            newvalue = varname + "=" + (arg or '')
+                            if config[CONFIG][key][n] == newvalue:
+                                logg.warning("unchanged var '%s' %s", target, newvalue)
+                            else:
+                                config[CONFIG][key][n] = newvalue
+                                changes.append((CONFIG, key))
+                                logg.warning("done edit var '%s' %s", target, newvalue)
+                    elif "=" in target or "*" in target or "%" in target or "?" in target or "[" in target:
+                        logg.info("may not use pattern characters in env variable '%s'", target)
+                    else:
+                        value = target.strip() + "=" + (arg or '')
+                        config[CONFIG][key] += [pattern + value]
+                        changes.append((CONFIG, key))
+                        logg.warning("done  new var '%s' %s", target, value)
+                except KeyError:
+                    logg.warning("there was no config %s in %s", target, config_filename)
+        logg.debug("done %s: %s", CONFIG, config[CONFIG])
+    return list(dict.fromkeys(changes))  # unique paths in order of changes
+
+
+def edits_comment(edits: Commands) -> str:
+    """ the history comment that marks an image as edited with this plan """
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    plan = hashlib.sha256(json.dumps(edits).encode("utf-8")).hexdigest()
+    return "docker-copyedit edits sha256:%s" % plan[:16]
+
+def edits_applied(docker: str, image: str, edits: Commands) -> str:
+    """ check the latest history entry of the image for the comment of this plan => its image id (or empty) """
+    history = sh(F"{docker} history --no-trunc --format '{{{{.ID}}}} {{{{.Comment}}}}' {image}", check=False)
+    if history.returncode:
+        return ""  # not a lookup - not counted
+    entries = history.stdout.splitlines()
+    image_id, _, comment = entries[0].partition(" ") if entries else ("", "", "")
+    if comment.strip() != edits_comment(edits):
+        JOB.counters["cache_misses"] += 1
+        return ""
+    JOB.counters["cache_hits"] += 1
+    return image_id if image_id.startswith("sha256:") else image
 
+def history_entry(edits: Commands) -> Dict[str, Any]:
+    import datetime # pylint: disable=import-outside-toplevel
+    if SOURCE_DATE_EPOCH:
+        myself = "docker-copyedit.py"
+        created = datetime.datetime.fromtimestamp(int(SOURCE_DATE_EPOCH), datetime.timezone.utc)
+        return {"empty_layer": True,
+                "created_by": "%s #(%s)" % (myself, __version__),
+                "created": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "comment": edits_comment(edits)}
+    myself = os.path.basename(sys.argv[0])
+    return {"empty_layer": True,
+            "created_by": "%s #(%s)" % (myself, __version__),
+            "created": datetime.datetime.utcnow().isoformat() + "Z",
+            "comment": edits_comment(edits)}
+
+def datadir_image_ids(datadir: str) -> List[str]:
+    """ the image ids are the sha256 of the config files named in the manifest """
+    import json # pylint: disable=import-outside-toplevel
+    manifest_filename = os.path.join(datadir, "manifest.json")
+    with open(manifest_filename) as _manifest_file:
+        manifest = json.load(_manifest_file)
+    image_ids: List[str] = []
+    for item in manifest:
+        config_hash = os.path.basename(item["Config"])
+        if config_hash.endswith(".json"):
+            config_hash = config_hash[:-len(".json")]
+        image_ids.append("sha256:" + config_hash)
+    return image_ids
+
+def image_present(docker: str, image_id: str) -> bool:
+    found = sh(F"{docker} image inspect --format '{{{{.Id}}}}' {image_id}", check=False)
+    return not found.returncode
+
+def edit_config_text(config_text: str, edits: Commands, config_filename: str = "") -> Optional[str]:
+    """ apply the edits to the config text => the new config text, or None when nothing was changed """
+    import json # pylint: disable=import-outside-toplevel
+    config = json.loads(config_text)
+    if config.get("history") and config["history"][-1].get("comment") == edits_comment(edits):
+        logg.warning("edits were already applied to %s", config_filename)
+        return None
+    changes = edit_config(config, edits, config_filename)
+    if not changes:
+        return None
+    for CONFIG in ['history']:
+        if CONFIG in config:
+            changes.append((CONFIG, len(config[CONFIG])))
+            config[CONFIG] += [history_entry(edits)]
+    for path in changes:
+        logg.info("changed %s", "/".join([str(elem) for elem in path]))
+    return json_splice(config_text, config, changes) or json_dumps(config)
 
 def edit_datadir(datadir: str, out: Optional[str], edits: Commands) -> int:
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
     if OK:
         manifest_file = "manifest.json"
         manifest_filename = os.path.join(datadir, manifest_file)
         with open(manifest_filename) as _manifest_file:
             manifest = json.load(_manifest_file)
-        replaced: Dict[str, Optional[str]] = {}
+        configs: Dict[str, List[int]] = {}  # config file => manifest items (same image with several tags)
         for item in range(len(manifest)):
-            config_file = manifest[item]["Config"]
+            configs.setdefault(manifest[item]["Config"], []).append(item)
+        replaced: Dict[str, Optional[str]] = {}
+        for config_file in configs:
             config_filename = os.path.join(datadir, config_file)
             replaced[config_filename] = None
         #
-        args: List[str]
-        for item in range(len(manifest)):
-            config_file = manifest[item]["Config"]
+        for config_file, items in configs.items():
             config_filename = os.path.join(datadir, config_file)
-            with open(config_filename) as _config_file:
-                config = json.load(_config_file)
-            old_config_text = clean_whitespaces(json.dumps(config))  # to compare later
-            #
-            for CONFIG in ['config', 'Config', 'container_config']:
-                if CONFIG not in config:
-                    logg.debug("no section '%s' in config", CONFIG)
-                    continue
-                logg.debug("with %s: %s", CONFIG, config[CONFIG])
-                for action, target, arg in edits:
-                    if action in ["remove", "rm"] and target in ["volume", "volumes"]:
-                        key = 'Volumes'
-                        if not arg:
-                            logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
-                            continue
-                        elif target in ["volumes"] and arg in ["*", "%"]:
-                            args = []
-                            try:
-                                if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                    del config[CONFIG][key]
-                                    logg.warning("done actual config %s %s '%s'", action, target, arg)
-                            except KeyError:
-                                logg.warning("there was no '%s' in %s", key, config_filename)
-                        elif target in ["volumes"]:
-                            pattern = arg.replace("%", "*")
-                            args = []
-                            if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                for entry in config[CONFIG][key]:
-                                    if fnmatch(entry, pattern):
-                                        args += [entry]
-                            logg.debug("volume pattern %s -> %s", pattern, args)
-                            if not args:
-                                logg.warning("%s pattern '%s' did not match anything", target, pattern)
-                        elif arg.startswith("/"):
-                            args = [arg]
-                        else:
-                            logg.error("can not do edit %s %s %s", action, target, arg)
-                            continue
-                        #
-                        for arg in args:
-                            entry = os.path.normpath(arg)
-                            try:
-                                if config[CONFIG][key] is None:
-                                    raise KeyError("null section " + key)
-                                del config[CONFIG][key][entry]
-                            except KeyError:
-                                logg.warning("there was no '%s' in '%s' of  %s", entry, key, config_filename)
-                    if action in ["remove", "rm"] and target in ["port", "ports"]:
-                        key = 'ExposedPorts'
-                        if not arg:
-                            logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
-                            continue
-                        elif target in ["ports"] and arg in ["*", "%"]:
-                            args = []
-                            try:
-                                if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                    del config[CONFIG][key]
-                                    logg.warning("done actual config %s %s %s", action, target, arg)
-                            except KeyError:
-                                logg.warning("there were no '%s' in %s", key, config_filename)
-                        elif target in ["ports"]:
-                            pattern = arg.replace("%", "*")
-                            args = []
-                            if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                for entry in config[CONFIG][key]:
-                                    if fnmatch(entry, pattern):
-                                        args += [entry]
-                            logg.debug("ports pattern %s -> %s", pattern, args)
-                            if not args:
-                                logg.warning("%s pattern '%s' did not match anything", target, pattern)
-                        else:
-                            args = [arg]
-                        #
-                        for arg in args:
-                            port, prot = portprot(arg)
-                            if not port:
-                                logg.error("can not do edit %s %s %s", action, target, arg)
-                                return 64  # EX_USAGE
-                            entry = F"{port}/{prot}"
-                            try:
-                                if config[CONFIG][key] is None:
-                                    raise KeyError("null section " + key)
-                                del config[CONFIG][key][entry]
-                                logg.info("done rm-port '%s' from '%s'", entry, key)
-                            except KeyError:
-                                logg.warning("there was no '%s' in '%s' of  %s", entry, key, config_filename)
-                    if action in ["append", "add"] and target in ["volume"]:
-                        if not arg:
-                            logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
-                            continue
-                        key = 'Volumes'
-                        entry = os.path.normpath(arg)
-                        if config[CONFIG].get(key) is None:
-                            config[CONFIG][key] = {}
-                        if arg not in config[CONFIG][key]:
-                            config[CONFIG][key][entry] = {}
-                            logg.info("added %s to %s", entry, key)
-                    if action in ["append", "add"] and target in ["port"]:
-                        if not arg:
-                            logg.error("can not do edit %s %s without arg: <%s>", action, target, arg)
-                            continue
-                        key = 'ExposedPorts'
-                        port, prot = portprot(arg)
-                        entry = "%s/%s" % (port, prot)
-                        if key not in config[CONFIG]:
-                            config[CONFIG][key] = {}
-                        if arg not in config[CONFIG][key]:
-                            config[CONFIG][key][entry] = {}
-                            logg.info("added %s to %s", entry, key)
-                    if action in ["set", "set-shell"] and target in ["entrypoint"]:
-                        key = 'Entrypoint'
-                        try:
-                            if not arg:
-                                running = None
-                            elif action in ["set-shell"]:
-                                running = ["/bin/sh", "-c", arg]
-                            elif arg.startswith("["):
-                                running = json.loads(arg)
-                            else:
-                                running = [arg]
-                            config[CONFIG][key] = running
-                            logg.warning("done edit %s %s", action, arg)
-                        except KeyError:
-                            logg.warning("there was no '%s' in %s", key, config_filename)
-                    if action in ["set", "set-shell"] and target in ["cmd"]:
-                        key = 'Cmd'
-                        try:
-                            if not arg:
-                                running = None
-                            elif action in ["set-shell"]:
-                                running = ["/bin/sh", "-c", arg]
-                                logg.info("%s %s", action, running)
-                            elif arg.startswith("["):
-                                running = json.loads(arg)
-                            else:
-                                running = [arg]
-                            config[CONFIG][key] = running
-                            logg.warning("done edit %s %s", action, arg)
-                        except KeyError:
-                            logg.warning("there was no '%s' in %s", key, config_filename)
-                    if action in ["set"] and target in StringConfigs:
-                        key = StringConfigs[target]
-                        try:
-                            if not arg:
-                                value = ''
-                            else:
-                                value = arg
-                            if key in config[CONFIG]:
-                                if config[CONFIG][key] == value:
-                                    logg.warning("unchanged config '%s' %s", key, value)
-                                else:
-                                    config[CONFIG][key] = value
-                                    logg.warning("done edit config '%s' %s", key, value)
-                            else:
-                                config[CONFIG][key] = value
-                                logg.warning("done  new config '%s' %s", key, value)
-                        except KeyError:
-                            logg.warning("there was no config %s in %s", target, config_filename)
-                    if action in ["set"] and target in StringMeta:
-                        key = StringMeta[target]
-                        try:
-                            if not arg:
-                                value = ''
-                            else:
-                                value = arg
-                            if key in config:
-                                if config[key] == value:
-                                    logg.warning("unchanged meta '%s' %s", key, value)
-                                else:
-                                    config[key] = value
-                                    logg.warning("done edit meta '%s' %s", key, value)
-                            else:
-                                config[key] = value
-                                logg.warning("done  new meta '%s' %s", key, value)
-                        except KeyError:
-                            logg.warning("there was no meta %s in %s", target, config_filename)
-                    if action in ["set-label"]:
-                        key = "Labels"
-                        try:
-                            value = arg or ''
-                            if key not in config[CONFIG]:
-                                config[CONFIG][key] = {}
-                            if target in config[CONFIG][key]:
-                                if config[CONFIG][key][target] == value:
-                                    logg.warning("unchanged label '%s' %s", target, value)
-                                else:
-                                    config[CONFIG][key][target] = value
-                                    logg.warning("done edit label '%s' %s", target, value)
-                            else:
-                                config[CONFIG][key][target] = value
-                                logg.warning("done  new label '%s' %s", target, value)
-                        except KeyError:
-                            logg.warning("there was no config %s in %s", target, config_filename)
-                    if action in ["remove-label", "rm-label"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Labels"
-                        try:
-                            if key in config[CONFIG]:
-                                if config[CONFIG][key] is None:
-                                    raise KeyError("null section " + key)
-                                del config[CONFIG][key][target]
-                                logg.warning("done actual %s %s ", action, target)
-                        except KeyError:
-                            logg.warning("there was no label %s in %s", target, config_filename)
-                    if action in ["remove-labels", "rm-labels"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Labels"
-                        try:
-                            pattern = target.replace("%", "*")
-                            args = []
-                            if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                for entry in config[CONFIG][key]:
-                                    if fnmatch(entry, pattern):
-                                        args += [entry]
-                            for arg in args:
-                                del config[CONFIG][key][arg]
-                                logg.warning("done actual %s %s (%s)", action, target, arg)
-                        except KeyError:
-                            logg.warning("there was no label %s in %s", target, config_filename)
-                    if action in ["remove-envs", "rm-envs"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Env"
-                        try:
-                            pattern = target.strip() + "=*"
-                            pattern = pattern.replace("%", "*")
-                            found = []
-                            if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                for n, entry in enumerate(config[CONFIG][key]):
-                                    if fnmatch(entry, pattern):
-                                        found += [n]
-                            for n in reversed(found):
-                                del config[CONFIG][key][n]
-                                logg.warning("done actual %s %s (%s)", action, target, n)
-                        except KeyError:
-                            logg.warning("there was no label %s in %s", target, config_filename)
-                    if action in ["remove-env", "rm-env"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Env"
-                        try:
-                            if "=" in target:
-                                pattern = target.strip()
-                            else:
-                                pattern = target.strip() + "=*"
-                            found = []
-                            if key in config[CONFIG] and config[CONFIG][key] is not None:
-                                for n, entry in enumerate(config[CONFIG][key]):
-                                    if fnmatch(entry, pattern):
-                                        found += [n]
-                            for n in reversed(found):
-                                del config[CONFIG][key][n]
-                                logg.warning("done actual %s %s (%s)", action, target, n)
-                        except KeyError:
-                            logg.warning("there was no label %s in %s", target, config_filename)
-                    if action in ["remove-healthcheck", "rm-healthcheck"]:
-                        key = "Healthcheck"
-                        try:
-                            del config[CONFIG][key]
-                            logg.warning("done actual %s %s", action, target)
-                        except KeyError:
-                            logg.warning("there was no %s in %s", key, config_filename)
-                    if action in ["set-envs"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Env"
-                        try:
-                            if "=" in target:
-                                pattern = target.strip().replace("%", "*")
-                            else:
-                                pattern = target.strip().replace("%", "*") + "=*"
-                            if key not in config[CONFIG]:
-                                config[key] = {}
-                            found = []
-                            for n, entry in enumerate(config[CONFIG][key]):
-                                if fnmatch(entry, pattern):
-                                    found += [n]
-                            if found:
-                                for n in reversed(found):
-                                    oldvalue = config[CONFIG][key][n]
-                                    varname = oldvalue.split("=", 1)[0]
-                                    newvalue = varname + "=" + (arg or '')
-                                    if config[CONFIG][key][n] == newvalue:
-                                        logg.warning("unchanged var '%s' %s", target, newvalue)
-                                    else:
-                                        config[CONFIG][key][n] = newvalue
-                                        logg.warning("done edit var '%s' %s", target, newvalue)
-                            elif "=" in target or "*" in target or "%" in target or "?" in target or "[" in target:
-                                logg.info("non-existing var pattern '%s'", target)
-                            else:
-                                value = target.strip() + "=" + (arg or '')
-                                config[CONFIG][key] += [pattern + value]
-                                logg.warning("done  new var '%s' %s", target, value)
-                        except KeyError:
-                            logg.warning("there was no config %s in %s", target, config_filename)
-                    if action in ["set-env"]:
-                        if not target:
-                            logg.error("can not do edit %s without arg: <%s>", action, target)
-                            continue
-                        key = "Env"
-                        try:
-                            pattern = target.strip() + "="
-                            if key not in config[CONFIG]:
-                                config[key] = {}
-                            found = []
-                            for n, entry in enumerate(config[CONFIG][key]):
-                                if entry.startswith(pattern):
-                                    found += [n]
-                            if found:
-                                for n in reversed(found):
-                                    oldvalue = config[CONFIG][key][n]
-                                    varname = oldvalue.split("=", 1)[0]
-                                    newvalue = varname + "=" + (arg or '')
-                                    if config[CONFIG][key][n] == newvalue:
-                                        logg.warning("unchanged var '%s' %s", target, newvalue)
-                                    else:
-                                        config[CONFIG][key][n] = newvalue
-                                        logg.warning("done edit var '%s' %s", target, newvalue)
-                            elif "=" in target or "*" in target or "%" in target or "?" in target or "[" in target:
-                                logg.info("may not use pattern characters in env variable '%s'", target)
-                            else:
-                                value = target.strip() + "=" + (arg or '')
-                                config[CONFIG][key] += [pattern + value]
-                                logg.warning("done  new var '%s' %s", target, value)
-                        except KeyError:
-                            logg.warning("there was no config %s in %s", target, config_filename)
-                logg.debug("done %s: %s", CONFIG, config[CONFIG])
-            new_config_text = clean_whitespaces(json.dumps(config))
-            if new_config_text != old_config_text:
-                for CONFIG in ['history']:
-                    if CONFIG in config:
-                        myself = os.path.basename(sys.argv[0])
-                        config[CONFIG] += [{"empty_layer": True,
-                                            "created_by": "%s #(%s)" % (myself, __version__),
-                                            "created": datetime.datetime.utcnow().isoformat() + "Z"}]
-                        new_config_text = clean_whitespaces(json.dumps(config))
-                new_config_md = hashlib.sha256()
-                new_config_md.update(new_config_text.encode("utf-8"))
-                for collision in range(1, MAX_COLLISIONS):
-                    new_config_hash = new_config_md.hexdigest()
-                    new_config_file = "%s.json" % new_config_hash
-                    new_config_filename = os.path.join(datadir, new_config_file)
-                    if new_config_filename in replaced.keys() or new_config_filename in replaced.values():
-                        logg.info("collision %s %s", collision, new_config_filename)
-                        new_config_md.update(" ".encode("utf-8"))
-                        continue
-                    break
-                with open(new_config_filename, "wb") as fp:
-                    fp.write(new_config_text.encode("utf-8"))
-                logg.info("written new %s", new_config_filename)
+            with open(config_filename, "rb") as _config_file:
+                config_text = _config_file.read().decode("utf-8")
+            new_config_text = edit_config_text(config_text, edits, config_filename)  # a CommandError goes to edit_image
+            if new_config_text is not None:
+                new_config_data = new_config_text.encode("utf-8")
+                new_config_file = "%s.json" % hashlib.sha256(new_config_data).hexdigest()  # the name is the image id
+                new_config_filename = os.path.join(datadir, new_config_file)
+                if os.path.exists(new_config_filename):
+                    with open(new_config_filename, "rb") as _new_config_file:
+                        if _new_config_file.read() != new_config_data:
+                            raise CommandError("%s is there with other content than its sha256" % new_config_filename)
+                    logg.info("same config %s", new_config_filename)
+                    JOB.counters["hash_collisions"] += 1
+                else:
+                    with open(new_config_filename, "wb") as fp:
+                        fp.write(new_config_data)
+                    logg.info("written new %s", new_config_filename)
+                    chmod_file_stat(new_config_filename)
                 logg.info("removed old %s", config_filename)
-                chmod_file_stat(new_config_filename)
                 #
-                manifest[item]["Config"] = new_config_file
+                for item in items:
+                    manifest[item]["Config"] = new_config_file
                 replaced[config_filename] = new_config_filename
+                JOB.counters["configs_rewritten"] += 1
             else:
                 logg.info("  unchanged %s", config_filename)
+        for item in range(len(manifest)):
             if "RepoTags" in manifest[item]:
                 manifest[item]["RepoTags"] = [out]
-        manifest_text = clean_whitespaces(json.dumps(manifest))
+        manifest_text = json_dumps(manifest)
         manifest_filename = os.path.join(datadir, manifest_file)
         # report the result
         with open(manifest_filename + ".tmp", "wb") as fp:
@@ -778,16 +1643,1213 @@ def edit_datadir(datadir: str, out: Optional[str], edits: Commands) -> int:
         return changed
     return 0
 
+def daemon_running(pidfile: str) -> bool:
+    if not os.path.isfile(pidfile):
+        return False
+    with open(pidfile) as _pidfile:
+        pid = _pidfile.read().strip()
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def imagedb_dir(root: str) -> str:
+    """ the image store of the docker storage driver => root/image/overlay2 """
+    imagedir = os.path.join(root, "image")
+    if not os.path.isdir(imagedir):
+        raise CommandError("no docker image store in %s" % root)
+    if DOCKERDRIVER:
+        return os.path.join(imagedir, DOCKERDRIVER)
+    drivers = [driver for driver in sorted(os.listdir(imagedir))
+               if os.path.isfile(os.path.join(imagedir, driver, "repositories.json"))]
+    if not drivers:
+        raise CommandError("no docker storage driver found in %s" % imagedir)
+    if len(drivers) > 1:
+        raise CommandError("several docker storage drivers in %s - use -c DOCKERDRIVER=%s" % (imagedir, drivers[0]))
+    return os.path.join(imagedir, drivers[0])
+
+def repository_name(image: str) -> Tuple[str, str]:
+    """ the repositories.json entry of an image name => (repository, reference) """
+    name = ImageName(image)
+    reference = name.tag()
+    if name.version and name.version.startswith("@"):
+        return reference[:-len(name.version)], reference
+    return reference.rsplit(":", 1)[0], reference
+
+def chain_ids(diff_ids: List[str]) -> List[str]:
+    """ the layerdb uses chain ids => sha256 of parent chain id and the layer diff id """
+    import hashlib # pylint: disable=import-outside-toplevel
+    chains: List[str] = []
+    for diff_id in diff_ids:
+        if not chains:
+            chains.append(diff_id)
+        else:
+            chain = hashlib.sha256((chains[-1] + " " + diff_id).encode("utf-8")).hexdigest()
+            chains.append("sha256:" + chain)
+    return chains
+
+def edit_imagedb(root: str, inp: str, out: str, edits: Commands) -> int:
+    """ edit the config of an image directly in the imagedb of a stopped docker daemon """
+    import datetime # pylint: disable=import-outside-toplevel
+    import shutil # pylint: disable=import-outside-toplevel
+    import fcntl # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    if DRYRUN:
+        logg.info("skip offline edit in %s", root)
+        return os.EX_OK
+    if daemon_running(DOCKERPIDFILE):
+        logg.error("docker daemon is running (%s) - stop it before offline edits", DOCKERPIDFILE)
+        return os.EX_UNAVAILABLE
+    try:
+        imagedir = imagedb_dir(root)
+    except CommandError as e:
+        logg.error("%s", e)
+        return os.EX_NOINPUT
+    contentdir = os.path.join(imagedir, "imagedb", "content", "sha256")
+    metadatadir = os.path.join(imagedir, "imagedb", "metadata", "sha256")
+    repositories_filename = os.path.join(imagedir, "repositories.json")
+    with open(os.path.join(imagedir, "repositories.json.lock"), "w") as lockfile:
+        try:
+            fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            logg.error("offline edits are locked by another process (%s)", lockfile.name)
+            return os.EX_TEMPFAIL
+        with open(repositories_filename) as _repositories_file:
+            repositories = json.load(_repositories_file)
+        if inp.startswith("sha256:"):
+            old_image_id = inp
+        else:
+            inp_repo, inp_ref = repository_name(inp)
+            old_image_id = repositories.get("Repositories", {}).get(inp_repo, {}).get(inp_ref, "")
+            if not old_image_id:
+                logg.error("no image %s in %s", inp_ref, repositories_filename)
+                return os.EX_NOINPUT
+        old_config_filename = os.path.join(contentdir, old_image_id.split(":", 1)[1])
+        with open(old_config_filename, "rb") as _config_file:
+            config_text = _config_file.read().decode("utf-8")
+        try:
+            new_config_text = edit_config_text(config_text, edits, old_config_filename)
+        except CommandError as e:
+            logg.error("%s", e)
+            return os.EX_USAGE
+        if new_config_text is None:
+            logg.warning("unchanged image from %s", inp)
+            new_image_id = old_image_id
+        else:
+            new_config_data = new_config_text.encode("utf-8")
+            new_image_id = "sha256:" + hashlib.sha256(new_config_data).hexdigest()
+            # verify that the layers are present before anything is registered
+            diff_ids = json.loads(new_config_text)["rootfs"]["diff_ids"]
+            for diff_id, chain_id in zip(diff_ids, chain_ids(diff_ids)):
+                layer_diff = os.path.join(imagedir, "layerdb", "sha256", chain_id.split(":", 1)[1], "diff")
+                if not os.path.isfile(layer_diff):
+                    logg.error("missing layer %s for %s", chain_id, diff_id)
+                    return os.EX_DATAERR
+                with open(layer_diff) as _layer_diff:
+                    if _layer_diff.read().strip() != diff_id:
+                        logg.error("bad layer %s for %s", chain_id, diff_id)
+                        return os.EX_DATAERR
+            new_config_filename = os.path.join(contentdir, new_image_id.split(":", 1)[1])
+            with open(new_config_filename + ".tmp", "wb") as fp:
+                fp.write(new_config_data)
+            os.chmod(new_config_filename + ".tmp", 0o600)
+            os.rename(new_config_filename + ".tmp", new_config_filename)
+            logg.info("written new %s", new_config_filename)
+            old_metadata = os.path.join(metadatadir, old_image_id.split(":", 1)[1])
+            new_metadata = os.path.join(metadatadir, new_image_id.split(":", 1)[1])
+            if not os.path.isdir(new_metadata):
+                os.makedirs(new_metadata)
+            old_parent = os.path.join(old_metadata, "parent")
+            if os.path.isfile(old_parent):
+                shutil.copyfile(old_parent, os.path.join(new_metadata, "parent"))
+            with open(os.path.join(new_metadata, "lastUpdated"), "w") as fp:
+                fp.write(datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z"))
+        out_repo, out_ref = repository_name(out)
+        repositories.setdefault("Repositories", {}).setdefault(out_repo, {})[out_ref] = new_image_id
+        with open(repositories_filename + ".tmp", "w") as fp:
+            fp.write(json.dumps(repositories))
+        os.chmod(repositories_filename + ".tmp", 0o600)
+        os.rename(repositories_filename + ".tmp", repositories_filename)
+        logg.warning("tagged %s as %s in %s", new_image_id, out_ref, repositories_filename)
+    edit_result(out, new_image_id, changed=new_image_id != old_image_id)
+    return os.EX_OK
+
+
+def bigdata_name(key: str) -> str:
+    """ the file name of a big-data item in containers-storage (keys like sha256:... are encoded) """
+    import base64 # pylint: disable=import-outside-toplevel
+    for char in key:
+        if char != "." and not ("0" <= char <= "9") and not ("a" <= char <= "z"):
+            return "=" + base64.b64encode(key.encode("utf-8")).decode("ascii")
+    return key
+
+def storage_name(image: str) -> str:
+    """ podman stores short names as localhost/name:tag """
+    name = ImageName(image).tag()
+    domain = name.split("/")[0]
+    if "/" in name and ("." in domain or ":" in domain or domain == "localhost"):
+        return name
+    return "localhost/" + name
+
+def storage_image(images: List[Dict[str, Any]], image: str) -> Optional[Dict[str, Any]]:
+    refs = [image, ImageName(image).tag(), storage_name(image), "docker.io/library/" + ImageName(image).tag()]
+    for entry in images:
+        for ref in refs:
+            if ref in entry.get("names", []):
+                return entry
+    hexid = image.split(":", 1)[1] if image.startswith("sha256:") else image
+    found = [entry for entry in images if len(hexid) >= 12 and entry["id"].startswith(hexid)]
+    if len(found) == 1:
+        return found[0]
+    return None
+
+def edit_storage(root: str, inp: str, out: str, edits: Commands) -> int:
+    """ edit the config big-data of a podman image directly in its containers-storage """
+    import datetime # pylint: disable=import-outside-toplevel
+    import fcntl # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    if DRYRUN:
+        logg.info("skip offline edit in %s", root or "containers-storage")
+        return os.EX_OK
+    podman = DOCKER
+    if not root:
+        root = sh(F"{podman} info --format '{{{{.Store.GraphRoot}}}}'").stdout.strip()
+    driver = PODMANDRIVER
+    if not driver:
+        drivers = [name[:-len("-images")] for name in sorted(os.listdir(root)) if name.endswith("-images")]
+        driver = drivers[0] if drivers else "overlay"
+    imagesdir = os.path.join(root, F"{driver}-images")
+    images_filename = os.path.join(imagesdir, "images.json")
+    with open(os.path.join(imagesdir, "images.lock"), "r+b") as lockfile:
+        fcntl.lockf(lockfile, fcntl.LOCK_EX)
+        with open(images_filename) as _images_file:
+            images = json.load(_images_file)
+        old_image = storage_image(images, inp)
+        if old_image is None:
+            logg.error("no image %s in %s", inp, images_filename)
+            return os.EX_NOINPUT
+        old_id = old_image["id"]
+        old_config_key = "sha256:" + old_id
+        old_config_filename = os.path.join(imagesdir, old_id, bigdata_name(old_config_key))
+        with open(old_config_filename, "rb") as _config_file:
+            config_text = _config_file.read().decode("utf-8")
+        try:
+            new_config_text = edit_config_text(config_text, edits, old_config_filename)
+        except CommandError as e:
+            logg.error("%s", e)
+            return os.EX_USAGE
+        out_name = storage_name(out)
+        for entry in images:
+            if out_name in entry.get("names", []):
+                entry["names"].remove(out_name)
+        if new_config_text is None:
+            logg.warning("unchanged image from %s", inp)
+            old_image.setdefault("names", []).append(out_name)
+        else:
+            new_config_data = new_config_text.encode("utf-8")
+            new_id = hashlib.sha256(new_config_data).hexdigest()
+            new_config_key = "sha256:" + new_id
+            new_image: Dict[str, Any] = json.loads(json.dumps(old_image))
+            new_image["id"] = new_id
+            new_image["names"] = [out_name]
+            new_image["created"] = datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+            bigdata: Dict[str, bytes] = {new_config_key: new_config_data}
+            if "manifest" in old_image.get("big-data-names", []):
+                with open(os.path.join(imagesdir, old_id, "manifest"), "rb") as _manifest_file:
+                    manifest = json.loads(_manifest_file.read().decode("utf-8"))
+                if "config" in manifest:
+                    manifest["config"]["digest"] = new_config_key
+                    manifest["config"]["size"] = len(new_config_data)
+                manifest_data = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+                manifest_digest = "sha256:" + hashlib.sha256(manifest_data).hexdigest()
+                bigdata["manifest"] = manifest_data
+                bigdata["manifest-" + manifest_digest] = manifest_data
+                new_image["digest"] = manifest_digest
+                new_image["digests"] = [manifest_digest]
+            new_image["big-data-names"] = list(bigdata.keys())
+            new_image["big-data-sizes"] = dict([(key, len(data)) for key, data in bigdata.items()])
+            new_image["big-data-digests"] = dict([(key, "sha256:" + hashlib.sha256(data).hexdigest()) for key, data in bigdata.items()])
+            new_imagedir = os.path.join(imagesdir, new_id)
+            if not os.path.isdir(new_imagedir):
+                os.makedirs(new_imagedir, 0o700)
+            for key, data in bigdata.items():
+                with open(os.path.join(new_imagedir, bigdata_name(key)), "wb") as fp:
+                    fp.write(data)
+            logg.info("written new %s", new_imagedir)
+            images = [entry for entry in images if entry["id"] != new_id] + [new_image]
+        with open(images_filename + ".tmp", "w") as fp:
+            fp.write(json.dumps(images))
+        os.chmod(images_filename + ".tmp", 0o600)
+        os.rename(images_filename + ".tmp", images_filename)
+        os.pwrite(lockfile.fileno(), os.urandom(64), 0)  # let other podman processes reload the images.json
+        logg.warning("tagged %s as %s in %s", new_id if new_config_text else old_id, out_name, images_filename)
+        result = new_image if new_config_text else old_image
+        edit_result(out, "sha256:" + result["id"], result.get("digest", ""), changed=new_config_text is not None)
+    return os.EX_OK
 
 class CommandError(RuntimeError):
     pass
-def parse_commands(args: Sequence[str]) -> Tuple[Optional[str], Optional[str], Commands]:
-    global IMPORT, DOCKER # pylint: disable=global-statement
+class RegistryError(Exception):
+    pass
+
+def registry_reference(image: str) -> Tuple[str, str, str]:
+    """ registry/repo/name:tag => (registry, repository, tag or digest) """
+    reference = "latest"
+    if "@" in image:
+        image, reference = image.split("@", 1)
+    elif image.rfind(":") > image.rfind("/"):
+        image, reference = image.rsplit(":", 1)
+    parts = image.split("/")
+    if len(parts) > 1 and ("." in parts[0] or ":" in parts[0] or parts[0] == "localhost"):
+        return parts[0], "/".join(parts[1:]), reference
+    if len(parts) == 1:
+        parts = ["library"] + parts
+    return "registry-1.docker.io", "/".join(parts), reference
+
+def registry_credentials(registry: str) -> str:
+    """ the base64 'user:password' for the registry from the docker config.json (or empty) """
+    import json # pylint: disable=import-outside-toplevel
+    filename = os.path.join(os.path.expanduser(DOCKERCONFIG), "config.json")
+    if not os.path.isfile(filename):
+        return ""
+    with open(filename) as fp:
+        auths = json.load(fp).get("auths", {})
+    names = [registry, "https://" + registry, "http://" + registry]
+    if registry == "registry-1.docker.io":
+        names += ["https://index.docker.io/v1/"]
+    for name in names:
+        if name in auths and auths[name].get("auth"):
+            return str(auths[name]["auth"])
+    return ""
+
+class RegistryResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    data: bytes
+
+class RegistryClient:
+    """ speaks the OCI distribution api to one registry over a kept-alive connection """
+    def __init__(self, registry: str) -> None:
+        self.registry = registry
+        self.secure = registry.split(":")[0] not in REGISTRYHTTP.split(",")
+        self.connection: "Optional[http.client.HTTPConnection]" = None
+        self.connections = 0
+        self.authorization = ""
+        self.credentials = registry_credentials(registry)
+        self.scopes: List[str] = []
+    def clone(self) -> "RegistryClient":
+        """ another client with its own connection, sharing the credentials and the token """
+        client = RegistryClient(self.registry)
+        client.authorization = self.authorization
+        client.scopes = self.scopes
+        return client
+    def connect(self) -> "http.client.HTTPConnection":
+        import http.client # pylint: disable=import-outside-toplevel
+        if self.connection is None:
+            if self.secure:
+                self.connection = http.client.HTTPSConnection(self.registry, timeout=REGISTRYTIMEOUT)
+            else:
+                self.connection = http.client.HTTPConnection(self.registry, timeout=REGISTRYTIMEOUT)
+            self.connections += 1
+        return self.connection
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+    def request(self, method: str, path: str, body: Union[bytes, IO[bytes], None] = None, headers: Optional[Dict[str, str]] = None) -> RegistryResponse:
+        import http.client # pylint: disable=import-outside-toplevel
+        reconnect, login = isinstance(body, (bytes, type(None))), isinstance(body, (bytes, type(None)))
+        while True:
+            sendheaders = dict(headers or {})
+            if self.authorization:
+                sendheaders["Authorization"] = self.authorization
+            try:
+                connection = self.connect()
+                connection.request(method, path, body=body, headers=sendheaders)
+                resp = connection.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()  # the registry may have dropped the kept-alive connection
+                if not reconnect:
+                    raise RegistryError(F"{method} {self.registry}{path}: {e}") from e
+                reconnect = False
+                continue
+            if resp.will_close:
+                self.close()
+            response = RegistryResponse(resp.status, dict((name.lower(), value) for name, value in resp.getheaders()), data)
+            logg.debug("%s %s%s => %s", method, self.registry, path, response.status)
+            if response.status == 401 and login:
+                login = False
+                self.login(response.headers.get("www-authenticate", ""))
+                continue
+            return response
+    def login(self, challenge: str) -> None:
+        import urllib.parse # pylint: disable=import-outside-toplevel
+        import urllib.request # pylint: disable=import-outside-toplevel
+        import json # pylint: disable=import-outside-toplevel
+        scheme, _, params = challenge.partition(" ")
+        if scheme.lower() == "basic":
+            if not self.credentials:
+                raise RegistryError(F"{self.registry}: no credentials, use 'docker login {self.registry}'")
+            self.authorization = "Basic " + self.credentials
+            return
+        if scheme.lower() != "bearer":
+            raise RegistryError(F"{self.registry}: unsupported authentication '{challenge}'")
+        values = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        query = [("service", values["service"])] if "service" in values else []
+        for scope in [values.get("scope", "")] + self.scopes:
+            if scope and ("scope", scope) not in query:
+                query.append(("scope", scope))
+        request = urllib.request.Request(values.get("realm", "") + "?" + urllib.parse.urlencode(query))
+        if self.credentials:
+            request.add_header("Authorization", "Basic " + self.credentials)
+        try:
+            with urllib.request.urlopen(request, timeout=REGISTRYTIMEOUT) as resp:
+                token = json.loads(resp.read())
+        except (OSError, ValueError) as e:
+            raise RegistryError(F"{self.registry}: can not get a token: {e}") from e
+        self.authorization = "Bearer " + (token.get("token") or token.get("access_token", ""))
+    def location(self, response: RegistryResponse) -> str:
+        import urllib.parse # pylint: disable=import-outside-toplevel
+        url = urllib.parse.urlsplit(response.headers.get("location", ""))
+        return url.path + ("?" + url.query if url.query else "")
+    def get_manifest(self, repository: str, reference: str) -> Tuple[bytes, str]:
+        response = self.request("GET", F"/v2/{repository}/manifests/{reference}",
+                                headers={"Accept": ", ".join(MANIFEST_TYPES + INDEX_TYPES)})
+        if response.status != 200:
+            raise RegistryError(F"{self.registry}/{repository}:{reference}: no manifest ({response.status})")
+        return response.data, response.headers.get("content-type", "")
+    def has_blob(self, repository: str, digest: str) -> bool:
+        return self.request("HEAD", F"/v2/{repository}/blobs/{digest}").status == 200
+    def get_blob(self, repository: str, digest: str) -> bytes:
+        import urllib.request # pylint: disable=import-outside-toplevel
+        import hashlib # pylint: disable=import-outside-toplevel
+        response = self.request("GET", F"/v2/{repository}/blobs/{digest}")
+        data = response.data
+        if response.status in [301, 302, 303, 307, 308]:
+            try:
+                with urllib.request.urlopen(response.headers["location"], timeout=REGISTRYTIMEOUT) as resp:
+                    data = resp.read()
+            except OSError as e:
+                raise RegistryError(F"{self.registry}/{repository}@{digest}: {e}") from e
+        elif response.status != 200:
+            raise RegistryError(F"{self.registry}/{repository}@{digest}: no blob ({response.status})")
+        if "sha256:" + hashlib.sha256(data).hexdigest() != digest:
+            raise RegistryError(F"{self.registry}/{repository}@{digest}: blob does not match its digest")
+        return data
+    def put_blob(self, repository: str, data: bytes) -> str:
+        import urllib.parse # pylint: disable=import-outside-toplevel
+        import hashlib # pylint: disable=import-outside-toplevel
+        digest = "sha256:" + hashlib.sha256(data).hexdigest()
+        if self.has_blob(repository, digest):
+            return digest
+        response = self.request("POST", F"/v2/{repository}/blobs/uploads/", body=b"")
+        if response.status != 202:
+            raise RegistryError(F"{self.registry}/{repository}: can not start upload ({response.status})")
+        location = self.location(response)
+        location += ("&" if "?" in location else "?") + "digest=" + urllib.parse.quote(digest)
+        response = self.request("PUT", location, body=data, headers={"Content-Type": "application/octet-stream"})
+        if response.status != 201:
+            raise RegistryError(F"{self.registry}/{repository}: can not upload {digest} ({response.status})")
+        return digest
+    def mount_blob(self, repository: str, digest: str, source: str) -> bool:
+        response = self.request("POST", F"/v2/{repository}/blobs/uploads/?mount={digest}&from={source}", body=b"")
+        if response.status == 202:  # the registry started an upload instead
+            self.request("DELETE", self.location(response))
+        return response.status == 201
+    def open_blob(self, repository: str, digest: str) -> IO[bytes]:
+        """ the blob as a stream - it must be read up before the next request """
+        import http.client # pylint: disable=import-outside-toplevel
+        import urllib.request # pylint: disable=import-outside-toplevel
+        for login in [True, False]:
+            headers = {"Authorization": self.authorization} if self.authorization else {}
+            try:
+                connection = self.connect()
+                connection.request("GET", F"/v2/{repository}/blobs/{digest}", headers=headers)
+                resp = connection.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                raise RegistryError(F"GET {self.registry}/{repository}@{digest}: {e}") from e
+            if resp.status == 401 and login:
+                resp.read()
+                self.login(resp.getheader("www-authenticate", ""))
+                continue
+            if resp.status in [301, 302, 303, 307, 308]:
+                resp.read()
+                try:
+                    stream: IO[bytes] = urllib.request.urlopen(resp.getheader("location", ""), timeout=REGISTRYTIMEOUT)
+                except OSError as e:
+                    raise RegistryError(F"GET {self.registry}/{repository}@{digest}: {e}") from e
+                return stream
+            if resp.status != 200:
+                resp.read()
+                break
+            return resp
+        raise RegistryError(F"{self.registry}/{repository}@{digest}: no blob ({resp.status})")
+    def upload_blob(self, repository: str, digest: str, size: int, stream: IO[bytes]) -> None:
+        """ upload the blob from a stream in one request (the registry checks the digest) """
+        import urllib.parse # pylint: disable=import-outside-toplevel
+        response = self.request("POST", F"/v2/{repository}/blobs/uploads/", body=b"")
+        if response.status != 202:
+            raise RegistryError(F"{self.registry}/{repository}: can not start upload ({response.status})")
+        location = self.location(response)
+        location += ("&" if "?" in location else "?") + "digest=" + urllib.parse.quote(digest)
+        headers = {"Content-Type": "application/octet-stream", "Content-Length": str(size)}
+        response = self.request("PUT", location, body=stream, headers=headers)
+        if response.status != 201:
+            raise RegistryError(F"{self.registry}/{repository}: can not upload {digest} ({response.status})")
+    def put_manifest(self, repository: str, reference: str, data: bytes, media_type: str) -> str:
+        import hashlib # pylint: disable=import-outside-toplevel
+        response = self.request("PUT", F"/v2/{repository}/manifests/{reference}", body=data, headers={"Content-Type": media_type})
+        if response.status != 201:
+            raise RegistryError(F"{self.registry}/{repository}:{reference}: manifest not accepted ({response.status})")
+        return "sha256:" + hashlib.sha256(data).hexdigest()
+
+def platform_name(platform: Dict[str, str]) -> str:
+    return "/".join([platform.get(key, "") for key in ["os", "architecture", "variant"] if platform.get(key)])
+
+def platform_selected(platform: Dict[str, str], platforms: Optional[str] = None) -> bool:
+    """ check an index entry against the --platform list (attestations are never edited) """
+    if platforms is None:
+        platforms = PLATFORM
+    if not platform or platform.get("os") == "unknown":
+        return False
+    if not platforms:
+        return True
+    for wanted in platforms.split(","):
+        parts = wanted.strip().split("/")
+        if parts[0] != platform.get("os"):
+            continue
+        if len(parts) > 1 and parts[1] != platform.get("architecture"):
+            continue
+        if len(parts) > 2 and parts[2] != platform.get("variant"):
+            continue
+        return True
+    return False
+
+def platform_default() -> str:
+    """ the platform of this machine, os/architecture like in an index """
+    machine = os.uname().machine.lower()
+    architectures = {"x86_64": "amd64", "amd64": "amd64", "aarch64": "arm64", "arm64": "arm64", "i686": "386", "i386": "386"}
+    return "linux/" + architectures.get(machine, machine)
+
+class LayoutStore:
+    """ the blob and manifest calls of the RegistryClient on OCI image layout directories (the repository is the path) """
+    registry = "oci"
+    connections = 0
+    def __init__(self) -> None:
+        self.scopes: List[str] = []
+    def clone(self) -> "LayoutStore":
+        return self
+    def close(self) -> None:
+        pass
+    def filename(self, repository: str, digest: str) -> str:
+        algorithm, hexdigest = digest.split(":", 1)
+        return os.path.join(repository, "blobs", algorithm, hexdigest)
+    def index(self, repository: str) -> Dict[str, Any]:
+        import json # pylint: disable=import-outside-toplevel
+        index_filename = os.path.join(repository, "index.json")
+        if not os.path.isfile(index_filename):
+            return {"schemaVersion": 2, "manifests": []}
+        with open(index_filename) as fp:
+            return dict(json.load(fp))
+    def get_manifest(self, repository: str, reference: str) -> Tuple[bytes, str]:
+        import json # pylint: disable=import-outside-toplevel
+        if reference.startswith("sha256:"):
+            data = self.get_blob(repository, reference)
+            return data, str(json.loads(data).get("mediaType", ""))
+        descriptors = self.index(repository).get("manifests", [])
+        found = [descriptor for descriptor in descriptors if descriptor.get("annotations", {}).get(OCI_REFNAME) == reference]
+        if not found and reference == "latest" and len(descriptors) == 1:
+            found = descriptors
+        if not found:
+            raise RegistryError(F"oci:{repository}:{reference}: no such image")
+        return self.get_blob(repository, found[0]["digest"]), found[0].get("mediaType", "")
+    def has_blob(self, repository: str, digest: str) -> bool:
+        return os.path.isfile(self.filename(repository, digest))
+    def get_blob(self, repository: str, digest: str) -> bytes:
+        with self.open_blob(repository, digest) as fp:
+            return fp.read()
+    def open_blob(self, repository: str, digest: str) -> IO[bytes]:
+        if not self.has_blob(repository, digest):
+            raise RegistryError(F"oci:{repository}@{digest}: no blob")
+        return open(self.filename(repository, digest), "rb")
+    def write(self, repository: str, digest: str, stream: IO[bytes]) -> None:
+        import shutil # pylint: disable=import-outside-toplevel
+        import tempfile # pylint: disable=import-outside-toplevel
+        import json # pylint: disable=import-outside-toplevel
+        filename = self.filename(repository, digest)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        layout_filename = os.path.join(repository, "oci-layout")
+        if not os.path.isfile(layout_filename):
+            with open(layout_filename, "w") as fp:
+                fp.write(json.dumps({"imageLayoutVersion": "1.0.0"}))
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename))
+        with os.fdopen(fd, "wb") as fp:
+            shutil.copyfileobj(stream, fp)
+        os.chmod(tmpname, 0o644)
+        os.rename(tmpname, filename)
+    def put_blob(self, repository: str, data: bytes) -> str:
+        import hashlib # pylint: disable=import-outside-toplevel
+        digest = "sha256:" + hashlib.sha256(data).hexdigest()
+        if not self.has_blob(repository, digest):
+            self.write(repository, digest, io.BytesIO(data))
+        return digest
+    def upload_blob(self, repository: str, digest: str, size: int, stream: IO[bytes]) -> None:
+        self.write(repository, digest, stream)
+    def mount_blob(self, repository: str, digest: str, source: str) -> bool:
+        """ hardlink the blob from the source layout (or copy it) """
+        filename = self.filename(repository, digest)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        try:
+            os.link(self.filename(source, digest), filename)
+        except OSError:
+            with self.open_blob(source, digest) as stream:
+                self.write(repository, digest, stream)
+        return True
+    def put_manifest(self, repository: str, reference: str, data: bytes, media_type: str) -> str:
+        import json # pylint: disable=import-outside-toplevel
+        digest = self.put_blob(repository, data)
+        if not reference.startswith("sha256:"):
+            index = self.index(repository)
+            index["manifests"] = [descriptor for descriptor in index.get("manifests", [])
+                                  if descriptor.get("annotations", {}).get(OCI_REFNAME) != reference]
+            index["manifests"].append({"mediaType": media_type, "digest": digest, "size": len(data),
+                                       "annotations": {OCI_REFNAME: reference}})
+            index_filename = os.path.join(repository, "index.json")
+            with open(index_filename + ".tmp", "w") as fp:
+                fp.write(json.dumps(index))
+            os.rename(index_filename + ".tmp", index_filename)
+        return digest
+
+BlobStore = Union[RegistryClient, LayoutStore]
+
+def copy_blobs(source: BlobStore, source_repository: str, target: BlobStore, target_repository: str,
+               blobs: List[Dict[str, Any]]) -> int:
+    """ make the blobs available in the target repository - they are checked up front by HEAD requests, and
+        the missing ones are mounted from the source repository or streamed over on parallel connections """
+    import concurrent.futures # pylint: disable=import-outside-toplevel
+    import queue # pylint: disable=import-outside-toplevel
+    clients: "queue.Queue[Tuple[BlobStore, BlobStore]]" = queue.Queue()
+    for _ in range(max(1, REGISTRYTHREADS)):
+        clients.put((source.clone(), target.clone()))  # not one connection - a blob is read while it is uploaded
+    progress = Progress(F"copy {target_repository}")
+    def exists(blob: Dict[str, Any]) -> bool:
+        src, dst = clients.get()
+        try:
+            return dst.has_blob(target_repository, blob["digest"])
+        finally:
+            clients.put((src, dst))
+    def transfer(blob: Dict[str, Any]) -> str:
+        src, dst = clients.get()
+        try:
+            with span("copy", image=F"{target.registry}/{target_repository}", digest=blob["digest"], bytes=0) as args:
+                if src.registry == dst.registry and dst.mount_blob(target_repository, blob["digest"], source_repository):
+                    args["result"] = "mounted"
+                    return "mounted"
+                stream = src.open_blob(source_repository, blob["digest"])
+                try:
+                    dst.upload_blob(target_repository, blob["digest"], blob["size"], stream)
+                finally:
+                    stream.close()
+                args.update(bytes=blob["size"], result="copied")
+                progress.update(blob["size"])
+                return "copied"
+        finally:
+            clients.put((src, dst))
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max(1, REGISTRYTHREADS)) as pool:
+            found = list(pool.map(exists, blobs))
+            missing = [blob for blob, present in zip(blobs, found) if not present]
+            progress.expected = sum(blob.get("size", 0) for blob in missing)
+            done = list(pool.map(transfer, missing))
+            progress.finish()
+    finally:
+        while not clients.empty():
+            src, dst = clients.get()
+            src.close()
+            dst.close()
+    logg.info("%s/%s: %i blobs present, %i mounted, %i copied", target.registry, target_repository,
+              len(blobs) - len(missing), done.count("mounted"), done.count("copied"))
+    return len(missing)
+
+def edit_manifest(source: BlobStore, repository: str, manifest_data: bytes, target: BlobStore, target_repository: str,
+                  edits: Optional[Commands], name: str) -> Tuple[bytes, List[Dict[str, Any]], Dict[str, Any]]:
+    """ edit the config of an image manifest (pushing the new config blob into the target)
+        => the new manifest, the blobs that it references, and the config """
+    import json # pylint: disable=import-outside-toplevel
+    manifest = json.loads(manifest_data)
+    config_digest = manifest["config"]["digest"]
+    config_text = source.get_blob(repository, config_digest).decode("utf-8")
+    new_config_text = edit_config_text(config_text, edits, F"{name}@{config_digest}") if edits is not None else None
+    blobs = [dict(layer) for layer in manifest.get("layers", [])]
+    if new_config_text is None:
+        if edits is not None:
+            logg.warning("unchanged image from %s", name)
+        return manifest_data, blobs + [dict(manifest["config"])], dict(json.loads(config_text))
+    new_config_data = new_config_text.encode("utf-8")
+    manifest["config"]["digest"] = target.put_blob(target_repository, new_config_data)
+    manifest["config"]["size"] = len(new_config_data)
+    new_manifest_text = json_splice(manifest_data.decode("utf-8"), manifest, [("config", "digest"), ("config", "size")])
+    new_manifest_data = (new_manifest_text or json.dumps(manifest, indent=3)).encode("utf-8")
+    return new_manifest_data, blobs, dict(json.loads(new_config_text))
+
+def edit_index(source: BlobStore, repository: str, index_data: bytes, target: BlobStore, target_repository: str,
+               edits: Commands, name: str) -> Tuple[bytes, List[Tuple[str, bytes, str]], List[Dict[str, Any]]]:
+    """ edit the platform images of an index or manifest list in parallel (see --platform)
+        => the new index, the platform manifests (digest, data, media type), and the blobs they reference """
+    import concurrent.futures # pylint: disable=import-outside-toplevel
+    import queue # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    index = json.loads(index_data)
+    descriptors = index.get("manifests", [])
+    clients: "queue.Queue[Tuple[BlobStore, BlobStore]]" = queue.Queue()
+    for _ in range(max(1, REGISTRYTHREADS)):
+        clients.put((source.clone(), target.clone()))  # not one connection - a blob is read while it is uploaded
+    def edit_platform(descriptor: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes, str, List[Dict[str, Any]]]:
+        platform = dict(descriptor.get("platform", {}))
+        selected = platform_selected(platform)
+        src, dst = clients.get()
+        try:
+            with span("edit", image=F"{name} ({platform_name(platform)})") as args:
+                data, media_type = src.get_manifest(repository, descriptor["digest"])
+                media_type = json.loads(data).get("mediaType", media_type or descriptor.get("mediaType", ""))
+                if media_type not in MANIFEST_TYPES:
+                    args["result"] = "skipped"
+                    return dict(descriptor), data, media_type, []
+                new_data, blobs, config = edit_manifest(src, repository, data, dst, target_repository,
+                                                        edits if selected else None, F"{name} ({platform_name(platform)})")
+                args.update(bytes=len(new_data), result="changed" if new_data != data else "unchanged")
+        finally:
+            clients.put((src, dst))
+        new_descriptor = dict(descriptor)
+        new_descriptor["digest"] = "sha256:" + hashlib.sha256(new_data).hexdigest()
+        new_descriptor["size"] = len(new_data)
+        if selected:  # keep the index in line with 'set arch' or 'set variant' on this platform
+            for key in ["os", "architecture", "variant"]:
+                if config.get(key):
+                    platform[key] = config[key]
+                elif key in platform:
+                    del platform[key]
+            new_descriptor["platform"] = platform
+        return new_descriptor, new_data, media_type, blobs
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max(1, REGISTRYTHREADS)) as pool:
+            results = list(pool.map(edit_platform, descriptors))
+    finally:
+        while not clients.empty():
+            src, dst = clients.get()
+            src.close()
+            dst.close()
+    changes: List[ConfigPath] = []
+    manifests: List[Tuple[str, bytes, str]] = []
+    blobs: Dict[str, Dict[str, Any]] = {}
+    for num, (new_descriptor, new_data, media_type, platform_blobs) in enumerate(results):
+        for key in ["digest", "size", "platform"]:
+            if new_descriptor.get(key) != descriptors[num].get(key):
+                changes.append(("manifests", num, key))
+        descriptors[num] = new_descriptor
+        manifests.append((new_descriptor["digest"], new_data, media_type))
+        for blob in platform_blobs:
+            blobs[blob["digest"]] = blob
+    new_index_text = json_splice(index_data.decode("utf-8"), index, changes)
+    new_index_data = (new_index_text or json.dumps(index, indent=3)).encode("utf-8")
+    return new_index_data, manifests, list(blobs.values())
+
+def edit_repository(source: BlobStore, inp_repository: str, inp_reference: str,
+                    target: BlobStore, out_repository: str, out_reference: str, edits: Commands, name: str) -> Tuple[str, str]:
+    """ edit the image (or all platform images) and push it into the target => the new manifest digest and
+        the new config digest (the image id, which is empty for an index) """
+    import json # pylint: disable=import-outside-toplevel
+    manifest_data, media_type = source.get_manifest(inp_repository, inp_reference)
+    media_type = json.loads(manifest_data).get("mediaType", media_type)
+    manifests: List[Tuple[str, bytes, str]] = []
+    if media_type in INDEX_TYPES:
+        new_manifest_data, manifests, blobs = edit_index(source, inp_repository, manifest_data, target, out_repository, edits, name)
+    elif media_type in MANIFEST_TYPES:
+        new_manifest_data, blobs, _ = edit_manifest(source, inp_repository, manifest_data, target, out_repository, edits, name)
+    else:
+        raise RegistryError(F"{name}: not an image manifest ({media_type})")
+    same = (source.registry, inp_repository) == (target.registry, out_repository)
+    if not same:
+        copy_blobs(source, inp_repository, target, out_repository, blobs)
+    original = [descriptor["digest"] for descriptor in json.loads(manifest_data).get("manifests", [])]
+    for digest, data, manifest_type in manifests:
+        if not same or digest not in original:
+            target.put_manifest(out_repository, digest, data, manifest_type)
+    image_id = json.loads(new_manifest_data)["config"]["digest"] if media_type in MANIFEST_TYPES else ""
+    return target.put_manifest(out_repository, out_reference, new_manifest_data, media_type), image_id
+
+def edit_registry(inp: str, out: str, edits: Commands) -> int:
+    """ edit the image config in the registry - only the new config blobs and manifests are uploaded
+        (for another repository or registry the layer blobs are mounted or copied over) """
+    inp_registry, inp_repository, inp_reference = registry_reference(inp)
+    out_registry, out_repository, out_reference = registry_reference(out)
+    if DRYRUN:
+        logg.info("skip registry edit in %s", out_registry)
+        return os.EX_OK
+    source = RegistryClient(inp_registry)
+    source.scopes = [F"repository:{inp_repository}:pull"]
+    if inp_registry == out_registry:
+        target = source
+        target.scopes += [F"repository:{out_repository}:pull,push"]
+    else:
+        target = RegistryClient(out_registry)
+        target.scopes = [F"repository:{out_repository}:pull,push"]
+    try:
+        digest, image_id = edit_repository(source, inp_repository, inp_reference, target, out_repository, out_reference, edits,
+                                           F"{inp_registry}/{inp_repository}")
+        logg.warning("pushed %s/%s:%s as %s", out_registry, out_repository, out_reference, digest)
+        edit_result(out, image_id, digest)
+    except CommandError as e:
+        logg.error("%s", e)
+        return os.EX_USAGE
+    except RegistryError as e:
+        logg.error("%s", e)
+        return os.EX_UNAVAILABLE
+    finally:
+        source.close()
+        target.close()
+    logg.info("%s: used %i connection(s)", inp_registry, source.connections)
+    return os.EX_OK
+
+def layout_reference(image: str) -> Tuple[str, str, str]:
+    """ oci:dir:tag or oci-archive:file.tar:tag => (kind, path, tag) - or empty for other names """
+    kind, sep, rest = image.partition(":")
+    if not sep or kind not in ["oci", "oci-archive"]:
+        return "", "", ""
+    path, sep, reference = rest.rpartition(":")
+    if not sep or not path or "/" in reference:
+        return kind, rest, "latest"
+    return kind, path, reference
+
+def edit_layout(inp: str, out: str, edits: Commands) -> int:
+    """ edit the image (or all platform images) in an OCI image layout directory or oci-archive """
+    inp_kind, inp_path, inp_reference = layout_reference(inp)
+    out_kind, out_path, out_reference = layout_reference(out)
+    if not inp_kind or not out_kind:
+        logg.error("both FROM and INTO need to be oci:dir or oci-archive:file names")
+        return os.EX_USAGE
+    if DRYRUN:
+        logg.info("skip layout edit of %s", inp_path)
+        return os.EX_OK
+    with workspace(TMPDIR) as workdir:
+        inp_dir, out_dir = inp_path, out_path
+        if inp_kind == "oci-archive":
+            inp_dir = os.path.join(workdir, "oci-input")
+            os.makedirs(inp_dir)
+            sh(F"{TAR} xf {inp_path} -C {inp_dir}")
+        if out_kind == "oci-archive":
+            out_dir = os.path.join(workdir, "oci-output")
+            os.makedirs(out_dir)
+        store = LayoutStore()
+        try:
+            digest, image_id = edit_repository(store, inp_dir, inp_reference, store, out_dir, out_reference, edits, inp_path)
+        except CommandError as e:
+            logg.error("%s", e)
+            return os.EX_USAGE
+        except RegistryError as e:
+            logg.error("%s", e)
+            return os.EX_NOINPUT
+        if out_kind == "oci-archive":
+            sh(F"{TAR} cf {out_path} -C {out_dir} .")
+    logg.warning("written %s as %s", out, digest)
+    edit_result(out, image_id, digest)
+    return os.EX_OK
+
+def registry_domain(image: str) -> str:
+    """ the registry of an image name that has an explicit domain (or empty) """
+    parts = image.split("/")
+    if len(parts) > 1 and ("." in parts[0] or ":" in parts[0] or parts[0] == "localhost"):
+        return parts[0]
+    return ""
+
+def fetch_blobs(client: RegistryClient, repository: str, blobs: List[Dict[str, Any]]) -> Iterator[IO[bytes]]:
+    """ fetch the blobs on parallel connections but yield them in order - each one is
+        spooled to a buffer that moves to a temp file beyond REGISTRYSPOOL bytes """
+    import concurrent.futures # pylint: disable=import-outside-toplevel
+    import queue # pylint: disable=import-outside-toplevel
+    import tempfile # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    clients: "queue.Queue[RegistryClient]" = queue.Queue()
+    threads = max(1, REGISTRYTHREADS)
+    for _ in range(threads):
+        clients.put(client.clone())
+    def fetch(blob: Dict[str, Any]) -> IO[bytes]:
+        spool: IO[bytes] = tempfile.SpooledTemporaryFile(max_size=REGISTRYSPOOL)  # pylint: disable=consider-using-with
+        src = clients.get()
+        try:
+            with span("fetch", image=F"{client.registry}/{repository}", digest=blob["digest"], bytes=blob.get("size", 0)):
+                stream = src.open_blob(repository, blob["digest"])
+                try:
+                    sha256 = hashlib.sha256()
+                    while True:
+                        chunk = stream.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        sha256.update(chunk)
+                        spool.write(chunk)
+                finally:
+                    stream.close()
+        finally:
+            clients.put(src)
+        if "sha256:" + sha256.hexdigest() != blob["digest"]:
+            spool.close()
+            raise RegistryError(F"{client.registry}/{repository}@{blob['digest']}: blob does not match its digest")
+        spool.seek(0)
+        return spool
+    try:
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            pending: List["concurrent.futures.Future[IO[bytes]]"] = []
+            for blob in blobs:
+                pending.append(pool.submit(fetch, blob))
+                if len(pending) > threads:
+                    yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+    finally:
+        while not clients.empty():
+            clients.get().close()
+
+def load_engines() -> List[str]:
+    """ the tools for the LOAD engines - docker, podman, ctx:NAME for a docker context, or a tool path """
+    engines: List[str] = []
+    for engine in LOAD.split(","):
+        engine = engine.strip()
+        if engine == "docker":
+            engines.append(DOCKER if "podman" not in DOCKER else "docker")
+        elif engine == "podman":
+            engines.append(PODMAN)
+        elif engine.startswith("ctx:"):
+            engines.append("%s --context %s" % (DOCKER if "podman" not in DOCKER else "docker", engine[len("ctx:"):]))
+        elif engine:
+            engines.append(engine)
+    return engines or [IMPORT or DOCKER]
+
+class LoadStreams:
+    """ tee one archive stream into the 'load' of several engines - the slowest one sets the pace """
+    def __init__(self, engines: List[str], progress: Optional[Progress] = None) -> None:
+        import subprocess # pylint: disable=import-outside-toplevel
+        self.loads: List[Tuple[str, "subprocess.Popen[bytes]"]] = []
+        self.failed: List[str] = []
+        self.progress = progress
+        for engine in engines:
+            logg.info("%s load", engine)
+            self.loads.append((engine, subprocess.Popen(F"{engine} load", shell=True, stdin=subprocess.PIPE)))
+    def write(self, data: bytes) -> int:
+        for engine, load in self.loads:
+            if engine in self.failed or load.stdin is None:
+                continue
+            try:
+                load.stdin.write(data)
+            except BrokenPipeError:
+                logg.error("%s load did stop", engine)
+                self.failed.append(engine)
+        if len(self.failed) == len(self.loads):
+            raise BrokenPipeError("all loads did stop")
+        if self.progress:
+            self.progress.update(len(data))
+        return len(data)
+    def flush(self) -> None:
+        pass
+    def close(self) -> List[str]:
+        """ wait for the loads => the engines that failed """
+        for engine, load in self.loads:
+            try:
+                if load.stdin is not None:
+                    load.stdin.close()
+            except BrokenPipeError:
+                pass
+        for engine, load in self.loads:
+            returncode = load.wait()
+            if returncode and engine not in self.failed:
+                logg.error("%s load failed (%s)", engine, returncode)
+                self.failed.append(engine)
+        if self.progress and not self.failed:
+            self.progress.finish()
+        return self.failed
+
+def load_datadir(datadir: str) -> int:
+    """ stream the datadir as an archive into the LOAD engines """
+    import shutil # pylint: disable=import-outside-toplevel
+    import subprocess # pylint: disable=import-outside-toplevel
+    streams = LoadStreams(load_engines(), Progress("load", disk_usage(datadir)))
+    archive = subprocess.Popen(F"cd {datadir} && {TAR} cf - .", shell=True, stdout=subprocess.PIPE)
+    assert archive.stdout is not None
+    try:
+        shutil.copyfileobj(archive.stdout, streams, 1024 * 1024)
+    except BrokenPipeError:
+        archive.kill()
+    finally:
+        archive.stdout.close()
+        archive.wait()
+        failed = streams.close()
+    if failed:
+        logg.error("could not load into %s", ", ".join(failed))
+        return os.EX_SOFTWARE
+    return os.EX_OK
+
+def config_member(name: str) -> bool:
+    """ a member of a save archive that may be an image config or the manifest.json (layers are tar files) """
+    return name.endswith(".json") or os.path.normpath(name).startswith("blobs" + os.path.sep)
+
+def rewrite_archive(source: IO[bytes], target: IO[bytes], out: str, edits: Commands) -> Tuple[int, List[str]]:
+    """ copy a 'docker save' stream into a 'docker load' stream - the layers pass through while the json
+        members are held back to rewrite the configs and the manifest.json at the end => changed configs, image ids
+        (a config is held whatever its size - the manifest.json to name it comes last) """
+    import tarfile # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    held: Dict[str, Tuple[tarfile.TarInfo, bytes]] = {}
+    with tarfile.open(fileobj=source, mode="r|") as inp, tarfile.open(fileobj=target, mode="w|") as outp:
+        for member in inp:
+            stream = inp.extractfile(member) if member.isfile() else None
+            if stream is None:
+                outp.addfile(member)
+            elif member.size <= REWRITEHOLD:
+                data = stream.read()
+                if data[:1] in [b"{", b"["]:
+                    held[os.path.normpath(member.name)] = (member, data)
+                else:
+                    outp.addfile(member, io.BytesIO(data))
+            elif config_member(member.name) and isinstance(stream, io.BufferedReader) and stream.peek(1)[:1] in [b"{", b"["]:
+                held[os.path.normpath(member.name)] = (member, stream.read())
+            else:
+                outp.addfile(member, stream)
+        if "manifest.json" not in held:
+            raise CommandError("no manifest.json in the archive")
+        manifest_info, manifest_data = held.pop("manifest.json")
+        manifest = json.loads(manifest_data)
+        configs: Dict[str, List[int]] = {}
+        for item in range(len(manifest)):
+            configs.setdefault(os.path.normpath(manifest[item]["Config"]), []).append(item)
+        changed = 0
+        for config_file, items in configs.items():
+            if config_file not in held:
+                raise KeyError(F"no config {config_file} in the archive")
+            config_info, config_data = held[config_file]
+            new_config_text = edit_config_text(config_data.decode("utf-8"), edits, config_file)
+            if new_config_text is None:
+                logg.info("  unchanged %s", config_file)
+                continue
+            new_config_data = new_config_text.encode("utf-8")
+            new_config_hash = hashlib.sha256(new_config_data).hexdigest()
+            if config_file.endswith(".json"):
+                new_config_file = os.path.join(os.path.dirname(config_file), new_config_hash + ".json")
+            else:
+                new_config_file = os.path.join(os.path.dirname(config_file), new_config_hash)
+            new_config_info = tarfile.TarInfo(new_config_file)
+            new_config_info.mode, new_config_info.mtime = config_info.mode, config_info.mtime
+            held[new_config_file] = (new_config_info, new_config_data)
+            for item in items:
+                manifest[item]["Config"] = new_config_file
+            logg.info("written new %s", new_config_file)
+            JOB.counters["configs_rewritten"] += 1
+            changed += 1
+        for item in range(len(manifest)):
+            if "RepoTags" in manifest[item]:
+                manifest[item]["RepoTags"] = [out]
+        held["manifest.json"] = (manifest_info, json_dumps(manifest).encode("utf-8"))
+        for info, data in held.values():
+            info.size = len(data)
+            outp.addfile(info, io.BytesIO(data))
+    image_ids = ["sha256:" + os.path.basename(item["Config"]).replace(".json", "") for item in manifest]
+    return changed, image_ids
+
+def import_image(inp: str, out: str, edits: Commands) -> int:
+    """ stream 'docker save' into the 'load' of the IMPORT tool - through the archive rewriter, or
+        straight when there are no edits for the same image name """
+    import tarfile # pylint: disable=import-outside-toplevel
+    import subprocess # pylint: disable=import-outside-toplevel
+    if DRYRUN:
+        logg.info("skip import of %s", inp)
+        return os.EX_OK
+    save = subprocess.Popen(F"{DOCKER} save {inp}", shell=True, stdout=subprocess.PIPE)
+    assert save.stdout is not None
+    if not edits and ImageName(inp).tag() == out:
+        load = subprocess.Popen(F"{IMPORT} load", shell=True, stdin=save.stdout)
+        save.stdout.close()
+        failed = [tool for tool, returncode in [(DOCKER, save.wait()), (IMPORT, load.wait())] if returncode]
+        if failed:
+            logg.error("could not import %s (%s failed)", inp, ", ".join(failed))
+            return os.EX_SOFTWARE
+        logg.warning("imported %s", out)
+        edit_result(out, "", changed=False)
+        return os.EX_OK
+    streams = LoadStreams([IMPORT], Progress("import", progress_expected(DOCKER, inp)))
+    try:
+        with profiled():
+            changed, image_ids = rewrite_archive(save.stdout, streams, out, edits)  # type: ignore[arg-type]
+    except CommandError as e:
+        logg.error("%s", e)
+        save.kill()
+        return os.EX_USAGE
+    except (BrokenPipeError, KeyError, tarfile.TarError) as e:
+        logg.error("could not import %s: %s", inp, e)
+        save.kill()
+        changed, image_ids = -1, []
+    finally:
+        save.stdout.close()
+        returncode = save.wait()
+        failed = streams.close()
+    if returncode or failed or changed < 0:
+        logg.error("could not import %s", inp)
+        return os.EX_SOFTWARE
+    if not changed and edits:
+        logg.warning("unchanged image from %s", inp)
+    logg.warning("imported %s", out)
+    edit_result(out, image_ids[0] if image_ids else "", changed=bool(changed))
+    return os.EX_OK
+
+def load_registry_image(inp: str, out: str, edits: Commands) -> int:
+    """ fetch the image from its registry and stream it with the edited config into 'docker load' """
+    import tarfile # pylint: disable=import-outside-toplevel
+    import hashlib # pylint: disable=import-outside-toplevel
+    import json # pylint: disable=import-outside-toplevel
+    registry, repository, reference = registry_reference(inp)
+    if DRYRUN:
+        logg.info("skip loading from %s", registry)
+        return os.EX_OK
+    client = RegistryClient(registry)
+    client.scopes = [F"repository:{repository}:pull"]
+    try:
+        manifest_data, media_type = client.get_manifest(repository, reference)
+        manifest = json.loads(manifest_data)
+        media_type = manifest.get("mediaType", media_type)
+        if media_type in INDEX_TYPES:  # 'docker load' takes one platform image
+            platforms = PLATFORM or platform_default()
+            found = [descriptor for descriptor in manifest.get("manifests", [])
+                     if platform_selected(descriptor.get("platform", {}), platforms)]
+            if not found:
+                logg.error("%s: no image for %s", inp, platforms)
+                return os.EX_DATAERR
+            manifest_data, media_type = client.get_manifest(repository, found[0]["digest"])
+            manifest = json.loads(manifest_data)
+            media_type = manifest.get("mediaType", media_type)
+        if media_type not in MANIFEST_TYPES:
+            logg.error("%s: not an image manifest (%s)", inp, media_type)
+            return os.EX_DATAERR
+        config_digest = manifest["config"]["digest"]
+        config_text = client.get_blob(repository, config_digest).decode("utf-8")
+        try:
+            new_config_text = edit_config_text(config_text, edits, F"{registry}/{repository}@{config_digest}")
+        except CommandError as e:
+            logg.error("%s", e)
+            return os.EX_USAGE
+        if new_config_text is None:
+            logg.warning("unchanged image from %s", inp)
+        config_data = (new_config_text or config_text).encode("utf-8")
+        config_name = hashlib.sha256(config_data).hexdigest() + ".json"
+        layers = manifest.get("layers", [])
+        layer_names = [layer["digest"].split(":", 1)[1] + "/layer.tar" for layer in layers]
+        streams = LoadStreams(load_engines(), Progress("pull", sum(layer.get("size", 0) for layer in layers) + len(config_data)))
+        try:
+            with profiled(), tarfile.open(fileobj=streams, mode="w|") as tar:  # type: ignore[call-overload]
+                def add(name: str, size: int, stream: IO[bytes]) -> None:
+                    info = tarfile.TarInfo(name)
+                    info.size = size
+                    info.mtime = int(SOURCE_DATE_EPOCH or 0)
+                    tar.addfile(info, stream)
+                add(config_name, len(config_data), io.BytesIO(config_data))
+                for layer, name, stream in zip(layers, layer_names, fetch_blobs(client, repository, layers)):
+                    with stream:
+                        add(name, layer["size"], stream)
+                    logg.debug("streamed %s", name)
+                loaded = json.dumps([{"Config": config_name, "RepoTags": [out], "Layers": layer_names}]).encode("utf-8")
+                add("manifest.json", len(loaded), io.BytesIO(loaded))
+        except BrokenPipeError:
+            pass
+        finally:
+            failed = streams.close()
+        if failed:
+            logg.error("could not load into %s", ", ".join(failed))
+            return os.EX_SOFTWARE
+        logg.warning("loaded %s from %s/%s:%s", out, registry, repository, reference)
+        edit_result(out, "sha256:" + config_name[:-len(".json")], changed=new_config_text is not None)
+    except RegistryError as e:
+        logg.error("%s", e)
+        return os.EX_UNAVAILABLE
+    finally:
+        client.close()
+    return os.EX_OK
+
+def remote_command(args: Sequence[str], results: bool = False) -> str:
+    """ the 'docker run' of the helper container that does the edit next to the (remote) daemon
+        (with results it prints the --result json to be captured) """
+    import shlex # pylint: disable=import-outside-toplevel
+    helper_args: List[str] = ["--result=-"] if results else []
+    reports = ["--result", "--json", "--metrics", "--trace"]  # written here, the helper has no access to the files
+    local = ["REMOTE", "DOCKER", "RESULT", "JSON_REPORT", "METRICS", "TRACE"]  # the -c NAME=VAL of the options above
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in ["--remote"] or arg.startswith("--docker=") or (arg.startswith("-D") and len(arg) > 2):
+            pass  # the helper uses its own docker cli on the mounted socket
+        elif arg.split("=", 1)[0] in reports and "=" in arg:
+            pass
+        elif arg in ["--docker", "-D"] + reports:
+            args[:1] = []
+        elif arg in ["-c", "--config"] and args:
+            setting = args.pop(0)
+            if config_setting(setting)[0] not in local:
+                helper_args += [arg, setting]
+        elif arg.startswith("--config=") or (arg.startswith("-c") and len(arg) > 2):
+            if config_setting(arg[len("--config="):] if arg.startswith("--") else arg[2:])[0] not in local:
+                helper_args.append(arg)
+        else:
+            helper_args.append(arg)
+    options = F"--rm -v {REMOTESOCKET}:/var/run/docker.sock"
+    if SOURCE_DATE_EPOCH:
+        options += F" -e SOURCE_DATE_EPOCH={SOURCE_DATE_EPOCH}"
+    return F"{DOCKER} run {options} {REMOTEIMAGE} " + " ".join(shlex.quote(arg) for arg in helper_args)
+
+def run_remote(args: Sequence[str]) -> int:
+    """ run the edit in a helper container on the host of the daemon - only the command line and
+        the result go over the network instead of a 'docker save' and 'docker load' of the image
+        (the reports of --result, --json, --metrics and --trace are written here from that result) """
+    import json # pylint: disable=import-outside-toplevel
+    import subprocess # pylint: disable=import-outside-toplevel
+    results = bool(RESULT or JSON_REPORT or METRICS)
+    cmd = remote_command(args, results)
+    logg.info(": %s", cmd)
+    exitcode = os.EX_SOFTWARE
+    try:
+        with phase("remote"):
+            if not results:
+                exitcode = subprocess.call(cmd, shell=True)
+            else:
+                helper = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, check=False)
+                exitcode = helper.returncode
+                try:
+                    for result in json.loads(helper.stdout or b"[]"):
+                        edit_result(result["image"], result["id"], result.get("digest", ""), result.get("changed", True))
+                except (ValueError, TypeError, KeyError) as e:
+                    logg.error("no result from the helper: %s", e)
+                    exitcode = exitcode or os.EX_PROTOCOL
+    finally:
+        if METRICS:
+            write_metrics(METRICS, exitcode)
+    write_reports()
+    return exitcode
+
+def parse_commands(args: Sequence[str]) -> Tuple[Optional[str], Optional[str], Commands, Dict[str, str]]:
+    """ => FROM image, INTO image, the edits, and the settings of the PODMAN / IMPORT / LOAD words (see configure) """
     inp = None
     out = None
     action = None
     target = None
     commands: Commands = []
+    settings: Dict[str, str] = {}
     known_set_targets = list(StringCmd.keys()) + list(StringConfigs.keys()) + list(StringMeta.keys())
     for n in range(len(args)):
         arg = args[n]
@@ -843,7 +2905,7 @@ def parse_commands(args: Sequence[str]) -> Tuple[Optional[str], Optional[str], C
         if action in ["podman"]:
             inp = arg
             action = None
-            DOCKER = PODMAN
+            settings["DOCKER"] = PODMAN
             continue
         elif action in ["from"]:
             inp = arg
@@ -853,10 +2915,14 @@ def parse_commands(args: Sequence[str]) -> Tuple[Optional[str], Optional[str], C
             out = arg
             action = None
             continue
+        elif action in ["load"]:
+            settings["LOAD"] = arg
+            action = None
+            continue
         elif action in ["import"]:
             out = arg
             action = None
-            IMPORT = PODMAN
+            settings["IMPORT"] = PODMAN
             continue
         elif action in ["remove", "rm"]:
             if arg.lower() in ["volume", "port", "all", "volumes", "ports"]:
@@ -890,7 +2956,7 @@ def parse_commands(args: Sequence[str]) -> Tuple[Optional[str], Optional[str], C
         raise CommandError("no input image given - use 'FROM image-name'")
     if not out:
         raise CommandError("no output image given - use 'INTO image-name'")
-    return inp, out, commands
+    return inp, out, commands, settings
 
 def docker_tag(inp: Optional[str], out: Optional[str]) -> None:
     docker = DOCKER
@@ -899,20 +2965,36 @@ def docker_tag(inp: Optional[str], out: Optional[str]) -> None:
         logg.info("%s", cmd)
         sh(F"{docker} tag {inp} {out}", check=False)
 
+def plain_retag(args: Sequence[str]) -> Optional[Tuple[str, str]]:
+    """ FROM image1 INTO image2 without any edit or option => (image1, image2) - that is only a 'docker tag' """
+    if len(args) != 4 or any(arg.startswith("-") for arg in args):
+        return None
+    names = {args[0].lower(): args[1], args[2].lower(): args[3]}
+    if sorted(names) != ["from", "into"] or layout_reference(names["from"])[0] or layout_reference(names["into"])[0]:
+        return None
+    return names["from"], names["into"]
+
 def run(*args: str) -> int:
+    retag = plain_retag(args)
+    if retag and not REGISTRY and not LOAD and not IMPORT and not PROFILE:
+        logg.warning("nothing to do for %s", retag[1])
+        docker_tag(*retag)
+        return os.EX_OK
     try:
-        inp, out, commands = parse_commands(args)
+        with profiled():
+            inp, out, commands, settings = parse_commands(args)
     except Exception as e: # pylint: disable=broad-exception-caught
         logg.error(" %s", e)
         return os.EX_USAGE
-    if not commands:
+    configure(settings)
+    if not commands and not REGISTRY and not LOAD and not IMPORT and not layout_reference(inp or "")[0]:
         logg.warning("nothing to do for %s", out)
         docker_tag(inp, out)
         return os.EX_OK
     else:
         if DRYRUN:
             oldlevel = logg.level
-            logg.level = logging.INFO
+            logg.setLevel(20)  # logging.INFO
             logg.info(" | from %s    into %s", inp, out)
             for action, target, arg in commands:
                 if arg is None:
@@ -920,11 +3002,153 @@ def run(*args: str) -> int:
                 else:
                     arg = "'%s'" % arg
                 logg.info(" | %s %s   %s", action, target, arg)
-            logg.level = oldlevel
+            logg.setLevel(oldlevel)
         return edit_image(inp, out, commands)
 
+def configure(settings: Dict[str, Any]) -> None:
+    """ set the module settings by name - copyedit() does that in the namespace of its job """
+    for name, value in settings.items():
+        if name.isupper() and name in globals():
+            globals()[name] = value
+        else:
+            logg.warning("(ignored) unknown setting '%s'", name)
+
+def config_setting(setting: str) -> Tuple[str, str]:
+    """ NAME=VAL or NAME or NoNAME => (NAME, VAL) """
+    nam, val = setting, "1"
+    if "=" in setting:
+        nam, val = setting.split("=", 1)
+    elif nam.startswith("no-") or nam.startswith("NO-"):
+        nam, val = nam[3:], "0"
+    elif nam.startswith("No") or nam.startswith("NO"):
+        nam, val = nam[2:], "0"
+    return nam, val
+
+def config_settings(config: Sequence[str]) -> Dict[str, Any]:
+    """ the -c NAME=VAL overrides => the settings, with the type of the module setting """
+    settings: Dict[str, Any] = {}
+    for setting in config:
+        nam, val = config_setting(setting)
+        if nam in globals():
+            old = globals()[nam]
+            if old is False or old is True:
+                logg.debug("yes %s=%s", nam, val)
+                settings[nam] = (val in ("true", "True", "TRUE", "yes", "y", "Y", "YES", "1"))
+            elif isinstance(old, float):
+                logg.debug("num %s=%s", nam, val)
+                settings[nam] = float(val)
+            elif isinstance(old, int):
+                logg.debug("int %s=%s", nam, val)
+                settings[nam] = int(val)
+            elif isinstance(old, str):
+                logg.debug("str %s=%s", nam, val)
+                settings[nam] = val.strip()
+            else:
+                logg.warning("(ignored) unknown target type -c '%s' : %s", nam, type(old))
+        else:
+            logg.warning("(ignored) unknown target config -c '%s' : no such variable", nam)
+    return settings
+
+def run_job(*args: str) -> int:
+    """ run() and write the reports of --result, --timings, --json, --metrics, --profile and --trace """
+    global JOB
+    JOB = JobState()
+    if RESULT == "-" and JSON_REPORT == "-":
+        logg.error("--result=- and --json=- would both write to stdout, use a file for one of them")
+        return os.EX_USAGE
+    if SOURCE_DATE_EPOCH and not SOURCE_DATE_EPOCH.isdigit():
+        logg.error("SOURCE_DATE_EPOCH=%s is not a number of seconds", SOURCE_DATE_EPOCH)
+        return os.EX_USAGE
+    exitcode = os.EX_SOFTWARE
+    try:
+        exitcode = run(*args)
+    finally:
+        if METRICS:
+            write_metrics(METRICS, exitcode)
+    write_reports()
+    if PROFILE:
+        logg.warning("profile written to %s", write_profile(TMPDIR))
+    return exitcode
+
+def write_reports() -> None:
+    """ the reports of --result, --timings, --json and --trace """
+    if RESULT:
+        write_results(RESULT)
+    if TIMINGS_REPORT:
+        for line in timings_summary():
+            logg.warning("%s", line)
+    if JSON_REPORT:
+        write_report(JSON_REPORT, JOB.results[0].image if JOB.results else "")
+    if TRACE:
+        write_trace(TRACE)
+
+class CopyEdit(NamedTuple):
+    """ the options of a copyedit() job - the config has more module settings by name (as in -c NAME=VAL) """
+    tmpdir: str = TMPDIR
+    docker: str = DOCKER
+    podman: str = PODMAN
+    tar: str = TAR
+    keepdir: int = KEEPDIR
+    dryrun: bool = DRYRUN
+    offline: bool = OFFLINE
+    registry: bool = REGISTRY
+    platform: str = PLATFORM
+    null: str = NULL
+    result: str = RESULT
+    timings: bool = TIMINGS_REPORT
+    json_report: str = JSON_REPORT
+    progress: str = PROGRESS
+    metrics: str = METRICS
+    trace: str = TRACE
+    profile: str = PROFILE
+    config: Optional[Dict[str, Any]] = None
+    def settings(self) -> Dict[str, Any]:
+        """ => the module settings of the job (see configure) """
+        settings: Dict[str, Any] = {
+            "TMPDIR": self.tmpdir, "DOCKER": self.docker, "PODMAN": self.podman, "TAR": self.tar, "KEEPDIR": self.keepdir,
+            "KEEPDATADIR": self.keepdir >= 1, "KEEPSAVEFILE": self.keepdir >= 2, "KEEPINPUTFILE": self.keepdir >= 3,
+            "KEEPOUTPUTFILE": self.keepdir >= 4, "DRYRUN": self.dryrun, "OFFLINE": self.offline, "REGISTRY": self.registry,
+            "PLATFORM": self.platform, "NULL": self.null, "RESULT": self.result, "TIMINGS_REPORT": self.timings,
+            "JSON_REPORT": self.json_report, "PROGRESS": self.progress, "METRICS": self.metrics, "TRACE": self.trace,
+            "PROFILE": self.profile}
+        settings.update(self.config or {})
+        return settings
+
+class CopyEditResult(NamedTuple):
+    exitcode: int
+    results: List[EditResult]  # the new image ids (as in --result)
+    timings: List[PhaseTiming]  # the phases (as in --json)
+    counters: Dict[str, int]
+
+def copyedit(inp: str, out: str, edits: Sequence[str] = (), options: Optional[CopyEdit] = None) -> CopyEditResult:
+    """ FROM inp INTO out with the edits as on the command line (like "set", "user", "foo") """
+    return copyedit_args(["FROM", inp, "INTO", out] + list(edits), options)
+
+JOBCODE: Dict[str, Any] = {}  # the compiled module for the namespaces of copyedit_args
+JOBCODE_LOCK = threading.Lock()
+
+def copyedit_args(args: Sequence[str], options: Optional[CopyEdit] = None) -> CopyEditResult:
+    """ run the job in a fresh namespace of this module - the jobs do not share their settings and
+        state, so that they can run in threads, and the settings of this module stay unchanged
+        (the module is compiled once, a new namespace costs about a millisecond) """
+    import types # pylint: disable=import-outside-toplevel
+    with JOBCODE_LOCK:
+        if __file__ not in JOBCODE:
+            with open(__file__, encoding="utf-8") as fp:
+                JOBCODE[__file__] = compile(fp.read(), __file__, "exec")
+    job = types.ModuleType("docker_copyedit")
+    job.__file__ = __file__
+    exec(JOBCODE[__file__], job.__dict__) # pylint: disable=exec-used
+    job.configure((options or CopyEdit()).settings())
+    exitcode = job.run_job(*args)
+    return CopyEditResult(exitcode, [EditResult(*result) for result in job.JOB.results],
+                          [PhaseTiming(*timing) for timing in job.JOB.timings], dict(job.JOB.counters))
+
 def main() -> int:
-    global TMPDIR, DOCKER, PODMAN, TAR, KEEPDIR, DRYRUN, NULL, KEEPDATADIR, KEEPSAVEFILE, KEEPINPUTFILE, KEEPOUTPUTFILE
+    if plain_retag(sys.argv[1:]):  # the wrapper scripts do that a lot - skip the option parser and logging
+        logg.threshold = 40  # logging.ERROR
+        return run(*sys.argv[1:])
+    import logging # pylint: disable=import-outside-toplevel
     from optparse import OptionParser # pylint: disable=deprecated-module,import-outside-toplevel
     cmdline = OptionParser("%prog input-image output-image [commands...]", epilog=__doc__)
     cmdline.add_option("-v", "--verbose", action="count", default=0,
@@ -943,60 +3167,58 @@ def main() -> int:
                        help="keep the unpacked dirs [%default]")
     cmdline.add_option("-z", "--dryrun", action="store_true", default=DRYRUN,
                        help="only run logic, do not change anything [%default]")
+    cmdline.add_option("--offline", action="store_true", default=OFFLINE,
+                       help="edit the imagedb of a stopped docker daemon in -c DOCKERROOT=%s"
+                       " or the containers-storage of podman [%%default]" % DOCKERROOT)
+    cmdline.add_option("--registry", action="store_true", default=REGISTRY,
+                       help="edit the manifest and config in the registry (copying to the registry of INTO) [%default]")
+    cmdline.add_option("--remote", action="store_true", default=REMOTE,
+                       help="run in a helper container -c REMOTEIMAGE=%s on the docker host [%%default]" % REMOTEIMAGE)
+    cmdline.add_option("--result", metavar="FILE", default=RESULT,
+                       help="write the new image id and digest as json ('-' for stdout) [%default]")
+    cmdline.add_option("--timings", action="store_true", default=TIMINGS_REPORT,
+                       help="log the time, bytes and temp-disk usage of each phase [%default]")
+    cmdline.add_option("--json", metavar="FILE", default=JSON_REPORT,
+                       help="write the phase timings and counters as json ('-' for stdout) [%default]")
+    cmdline.add_option("--progress", metavar="WHEN", default=PROGRESS,
+                       help="show the bytes, MB/s and ETA of the data streams: auto (on a tty), always, never [%default]")
+    cmdline.add_option("--metrics", metavar="FILE", default=METRICS,
+                       help="rewrite a Prometheus textfile with the images, bytes, phases and failures [%default]")
+    cmdline.add_option("--trace", metavar="FILE", default=TRACE,
+                       help="write a Chrome trace-event timeline of the phases and workers [%default]")
+    cmdline.add_option("--profile", metavar="cpu|mem", default=PROFILE,
+                       help="profile the edit engine into profile.XXXX files of the tmpdir (pstats or tracemalloc top-N) [%default]")
+    cmdline.add_option("--platform", metavar="OS/ARCH,..", default=PLATFORM,
+                       help="edit only these platform images of a multi-arch index [all]")
     cmdline.add_option("--with-null", metavar="name", default=NULL,
                        help="specify the special value for disable [%default]")
     cmdline.add_option("-c", "--config", metavar="NAME=VAL", action="append", default=[],
                        help="..override internal variables (MAX_PATH) {%default}")
     opt, cmdline_args = cmdline.parse_args()
     logging.basicConfig(level=max(0, logging.ERROR - 10 * opt.verbose + 10 * opt.quiet))
-    TMPDIR = opt.tmpdir
-    DOCKER = opt.docker
-    PODMAN = opt.podman
-    TAR = opt.tar
-    KEEPDIR = opt.keepdir
-    DRYRUN = opt.dryrun
-    NULL = opt.with_null
-    if KEEPDIR >= 1:
-        KEEPDATADIR = True
-    if KEEPDIR >= 2:
-        KEEPSAVEFILE = True
-    if KEEPDIR >= 3:
-        KEEPINPUTFILE = True
-    if KEEPDIR >= 4:
-        KEEPOUTPUTFILE = True
-    ########################################
-    for setting in opt.config:
-        nam, val = setting, "1"
-        if "=" in setting:
-            nam, val = setting.split("=", 1)
-        elif nam.startswith("no-") or nam.startswith("NO-"):
-            nam, val = nam[3:], "0"
-        elif nam.startswith("No") or nam.startswith("NO"):
-            nam, val = nam[2:], "0"
-        if nam in globals():
-            old = globals()[nam]
-            if old is False or old is True:
-                logg.debug("yes %s=%s", nam, val)
-                globals()[nam] = (val in ("true", "True", "TRUE", "yes", "y", "Y", "YES", "1"))
-            elif isinstance(old, float):
-                logg.debug("num %s=%s", nam, val)
-                globals()[nam] = float(val)
-            elif isinstance(old, int):
-                logg.debug("int %s=%s", nam, val)
-                globals()[nam] = int(val)
-            elif isinstance(old, str):
-                logg.debug("str %s=%s", nam, val)
-                globals()[nam] = val.strip()
-            else:
-                logg.warning("(ignored) unknown target type -c '%s' : %s", nam, type(old))
-        else:
-            logg.warning("(ignored) unknown target config -c '%s' : no such variable", nam)
-    ########################################
+    config = config_settings(opt.config)
+    options = CopyEdit(tmpdir=opt.tmpdir, docker=opt.docker, podman=opt.podman, tar=opt.tar, keepdir=opt.keepdir,
+                       dryrun=opt.dryrun, offline=opt.offline, registry=opt.registry, platform=opt.platform,
+                       null=opt.with_null, result=opt.result, timings=opt.timings, json_report=opt.json,
+                       progress=opt.progress, metrics=opt.metrics, trace=opt.trace, profile=opt.profile, config=config)
+    settings = options.settings()
     if len(cmdline_args) < 2:
         logg.error("not enough arguments, use --help")
         return os.EX_USAGE
+    elif settings["PROFILE"] not in ("", "cpu", "mem"):
+        logg.error("unknown --profile=%s (use cpu or mem)", settings["PROFILE"])
+        return os.EX_USAGE
+    elif settings["RESULT"] == "-" and settings["JSON_REPORT"] == "-":
+        logg.error("--result=- and --json=- would both write to stdout, use a file for one of them")
+        return os.EX_USAGE
+    elif opt.remote or config.get("REMOTE"):
+        configure(settings)
+        return run_remote(sys.argv[1:])
     else:
-        return run(*cmdline_args)
+        if re.match("(tcp|ssh)://", os.environ.get("DOCKER_HOST", "")):
+            logg.info("DOCKER_HOST is remote, the image is moved over the network (see --remote)")
+        configure(settings)
+        return run_job(*cmdline_args)
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,409 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-module-docstring,missing-class-docstring,missing-function-docstring,line-too-long,too-many-locals
+# pylint: disable=invalid-name,unspecified-encoding,consider-using-with,too-many-arguments
+
+""" generate synthetic 'docker save' archives and time the edit engine on them - no docker daemon needed.
+    The results can be written to a json baseline that later runs compare against. """
+
+__copyright__ = "(C) 2017-2025 Guido U. Draheim, licensed under the EUPL"
+__version__ = "1.5.1222"
+
+from typing import Optional, List, Dict, Tuple, Any, Callable, IO
+import sys
+import os
+import os.path
+import io
+import time
+import json
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import platform
+import datetime
+import logging
+import subprocess
+from fnmatch import fnmatchcase as fnmatch
+import docker_copyedit
+
+logg = logging.getLogger("bench")
+
+TMPDIR = "tmp.bench"
+TAR = "tar"
+REPEAT = 3
+TOLERANCE = 0.2  # slower than the baseline by this fraction is a regression
+HERE = os.path.dirname(os.path.abspath(__file__))
+COPYEDIT = os.path.join(HERE, "docker_copyedit.py")
+STANDIN = os.path.join(HERE, "docker_copyedit_standin.py")
+EDITS = "set label bench 1 remove envs VAR1* add volume /bench remove port 8000 set user bench"
+STARTUP = 0.050  # seconds for 'import docker_copyedit' in 'python -X importtime' (with the bytecode cached)
+LAZY = ["optparse", "shutil", "datetime", "tarfile", "tempfile", "http.client", "urllib.request", "concurrent.futures",
+        "cProfile", "pstats", "tracemalloc", "json", "hashlib", "logging", "subprocess"]  # imported where they are needed - not on the way to a plain retag
+WRAPPER = os.path.join(os.path.dirname(HERE), "docker-copyedit.py")
+COMMANDS = {"retag": ["FROM", "bench:0", "INTO", "bench:new"], "option": ["-v", "FROM", "bench:0", "INTO", "bench:new"]}
+BASELINE = {"retag": 0.069, "option": 0.066}  # seconds end to end of "python docker_copyedit.py" in 1.5.1222 - ./docker-copyedit.py stays below
+
+SIZES: Dict[str, Dict[str, int]] = {
+    "tiny": {"layers": 1, "layer_size": 64 * 1024, "env": 5, "labels": 5, "volumes": 1, "ports": 1, "history": 5, "items": 1},
+    "small": {"layers": 3, "layer_size": 1024 * 1024, "env": 20, "labels": 20, "volumes": 5, "ports": 5, "history": 20, "items": 1},
+    "medium": {"layers": 10, "layer_size": 16 * 1024 * 1024, "env": 100, "labels": 200, "volumes": 20, "ports": 20, "history": 100, "items": 3},
+    "large": {"layers": 20, "layer_size": 64 * 1024 * 1024, "env": 500, "labels": 1000, "volumes": 100, "ports": 100, "history": 500, "items": 10},
+    # the throughput of the whole pipeline (needs about four times the size on the -T disk)
+    "1g": {"layers": 16, "layer_size": 64 * 1024 * 1024, "env": 20, "labels": 20, "volumes": 5, "ports": 5, "history": 40, "items": 1},
+    "10g": {"layers": 40, "layer_size": 256 * 1024 * 1024, "env": 20, "labels": 20, "volumes": 5, "ports": 5, "history": 80, "items": 1},
+    "50g": {"layers": 100, "layer_size": 512 * 1024 * 1024, "env": 20, "labels": 20, "volumes": 5, "ports": 5, "history": 200, "items": 1},
+}
+
+class PatternReader:
+    """ size bytes of a seeded pattern - streamed, so that gigabyte layers do not need the memory """
+    def __init__(self, size: int, seed: int) -> None:
+        self.size = size
+        self.block = b"".join(hashlib.sha256(b"%i:%i" % (seed, num)).digest() for num in range(2048))
+        self.offset = 0
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.size - self.offset:
+            size = self.size - self.offset
+        data = b""
+        while len(data) < size:
+            start = (self.offset + len(data)) % len(self.block)
+            data += self.block[start:start + size - len(data)]
+        self.offset += size
+        return data
+
+def generate_config(num: int, env: int = 5, labels: int = 5, volumes: int = 1, ports: int = 1,
+                    history: int = 5, diff_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    diff_ids = diff_ids or []
+    created = "2025-01-01T00:00:00Z"
+    entries: List[Dict[str, Any]] = []
+    for step in range(max(history, len(diff_ids))):
+        entry: Dict[str, Any] = {"created": created, "created_by": F"/bin/sh -c #(nop) STEP {step}"}
+        if step >= len(diff_ids):
+            entry["empty_layer"] = True
+        entries.append(entry)
+    return {"architecture": "amd64", "os": "linux", "created": created,
+            "config": {"Env": ["PATH=/usr/bin:/bin"] + [F"VAR{var}=value{var}" for var in range(env)],
+                       "Labels": dict([(F"label{label}", F"value{label}") for label in range(labels)] + [("item", str(num))]),
+                       "Volumes": dict((F"/data{volume}", {}) for volume in range(volumes)),
+                       "ExposedPorts": dict((F"{8000 + port}/tcp", {}) for port in range(ports)),
+                       "Cmd": ["/bin/sh"], "WorkingDir": "", "User": ""},
+            "rootfs": {"type": "layers", "diff_ids": diff_ids},
+            "history": entries}
+
+def generate_layer(size: int, seed: int) -> Tuple[IO[bytes], str, int]:
+    """ a layer tar with one file of size bytes in a temp file => the file, its sha256, its size """
+    layer: IO[bytes] = tempfile.TemporaryFile()  # pylint: disable=consider-using-with
+    with tarfile.open(fileobj=layer, mode="w|") as tar:
+        info = tarfile.TarInfo(F"data/layer{seed}.bin")
+        info.size = size
+        tar.addfile(info, PatternReader(size, seed))
+    layer.seek(0)
+    sha256 = hashlib.sha256()
+    while True:
+        chunk = layer.read(1024 * 1024)
+        if not chunk:
+            break
+        sha256.update(chunk)
+    layer_size = layer.tell()
+    layer.seek(0)
+    return layer, sha256.hexdigest(), layer_size
+
+def generate_archive(filename: str, layers: int = 1, layer_size: int = 64 * 1024, env: int = 5, labels: int = 5,
+                     volumes: int = 1, ports: int = 1, history: int = 5, items: int = 1, oci: bool = False) -> str:
+    """ write a 'docker save' archive - the legacy layout with <id>/layer.tar and <id>.json, or the
+        OCI layout (as docker 25 saves it) with blobs/sha256 and an index.json next to the manifest.json """
+    with tarfile.open(filename, "w") as tar:
+        def add(name: str, data: bytes) -> None:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        layer_names: List[str] = []
+        layer_descriptors: List[Dict[str, Any]] = []
+        diff_ids: List[str] = []
+        for seed in range(layers):
+            layer, digest, size = generate_layer(layer_size, seed)
+            with layer:
+                name = F"blobs/sha256/{digest}" if oci else F"{digest}/layer.tar"
+                info = tarfile.TarInfo(name)
+                info.size = size
+                tar.addfile(info, layer)
+            layer_names.append(name)
+            layer_descriptors.append({"mediaType": "application/vnd.oci.image.layer.v1.tar", "digest": "sha256:" + digest, "size": size})
+            diff_ids.append("sha256:" + digest)
+        manifest: List[Dict[str, Any]] = []
+        index: List[Dict[str, Any]] = []
+        for num in range(items):
+            config = json.dumps(generate_config(num, env, labels, volumes, ports, history, diff_ids), separators=(",", ":")).encode("utf-8")
+            config_digest = hashlib.sha256(config).hexdigest()
+            config_name = F"blobs/sha256/{config_digest}" if oci else F"{config_digest}.json"
+            add(config_name, config)
+            tag = F"bench:{num}"
+            manifest.append({"Config": config_name, "RepoTags": [tag], "Layers": layer_names})
+            if oci:
+                image = json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                                    "config": {"mediaType": "application/vnd.oci.image.config.v1+json",
+                                               "digest": "sha256:" + config_digest, "size": len(config)},
+                                    "layers": layer_descriptors}).encode("utf-8")
+                image_digest = hashlib.sha256(image).hexdigest()
+                add(F"blobs/sha256/{image_digest}", image)
+                index.append({"mediaType": "application/vnd.oci.image.manifest.v1+json", "digest": "sha256:" + image_digest,
+                              "size": len(image), "annotations": {"io.containerd.image.name": "docker.io/library/" + tag}})
+        if oci:
+            add("oci-layout", b'{"imageLayoutVersion":"1.0.0"}')
+            add("index.json", json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.index.v1+json",
+                                          "manifests": index}).encode("utf-8"))
+        add("manifest.json", json.dumps(manifest).encode("utf-8"))
+    return filename
+
+def sh(cmd: str, check: bool = True) -> None:
+    run = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if run.returncode and check:
+        raise RuntimeError(F"{cmd}: {run.stderr.decode('utf-8', 'replace')}")
+
+class Bench:
+    """ the archive of one size preset, unpacked once - the benchmarks work on copies """
+    def __init__(self, tmpdir: str, size: str, oci: bool = False) -> None:
+        self.size = size
+        self.name = size + ("-oci" if oci else "")
+        self.tmpdir = os.path.join(tmpdir, self.name)
+        self.archive = os.path.join(self.tmpdir, "saved.tar")
+        self.unpacked = os.path.join(self.tmpdir, "unpacked")
+        if not os.path.isdir(self.unpacked):
+            os.makedirs(self.unpacked)
+            generate_archive(self.archive, oci=oci, **SIZES[size])
+            sh(F"{TAR} xf {self.archive} -C {self.unpacked}")
+        self.edits = docker_copyedit.parse_commands(["FROM", "bench:0", "INTO", "bench:new"] + EDITS.split())[2]
+    def bytes(self) -> int:
+        return os.path.getsize(self.archive)
+    def fresh(self, name: str) -> str:
+        """ a copy of the manifest and the configs - edit_datadir does not read the layers """
+        datadir = os.path.join(self.tmpdir, name)
+        if os.path.isdir(datadir):
+            shutil.rmtree(datadir)
+        os.makedirs(datadir)
+        with open(os.path.join(self.unpacked, "manifest.json")) as fp:
+            manifest = json.load(fp)
+        for filename in ["manifest.json"] + [item["Config"] for item in manifest]:
+            target = os.path.join(datadir, filename)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            shutil.copyfile(os.path.join(self.unpacked, filename), target)
+        return datadir
+    def edit_datadir(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        datadir = os.path.join(self.tmpdir, "edit")
+        def setup() -> None:
+            self.fresh("edit")
+        return setup, lambda: self.check(docker_copyedit.edit_datadir(datadir, "bench:new", self.edits))
+    def repack(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        packed = os.path.join(self.tmpdir, "packed.tar")
+        return nothing, lambda: sh(F"cd {self.unpacked} && {TAR} cf {os.path.abspath(packed)} .")
+    def pipeline(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        """ the datadir flow of edit_image without the daemon: tar x, edit_datadir, tar cf """
+        datadir = os.path.join(self.tmpdir, "pipeline")
+        packed = os.path.join(self.tmpdir, "pipeline.tar")
+        def run() -> None:
+            if os.path.isdir(datadir):
+                shutil.rmtree(datadir)
+            os.makedirs(datadir)
+            sh(F"{TAR} xf {self.archive} -C {datadir}")
+            self.check(docker_copyedit.edit_datadir(datadir, "bench:new", self.edits))
+            sh(F"cd {datadir} && {TAR} cf {os.path.abspath(packed)} .")
+        return nothing, run
+    def stream(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        """ the streaming flow of 'FROM image1 IMPORT image2' from an archive file into an archive file """
+        streamed = os.path.join(self.tmpdir, "streamed.tar")
+        def run() -> None:
+            with open(self.archive, "rb") as source, open(streamed, "wb") as target:
+                changed, _ = docker_copyedit.rewrite_archive(source, target, "bench:new", self.edits)
+            self.check(changed)
+        return nothing, run
+    def copyedit(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        """ docker-copyedit.py end-to-end (save, tar x, edit, tar cf, load, cleanup) against the stand-in engine """
+        store = os.path.join(self.tmpdir, "store")
+        docker = F"{sys.executable} {STANDIN} --store={store}"
+        if not os.path.isdir(store):
+            sh(F"{docker} load -i {self.archive}")
+        def setup() -> None:
+            sh(F"{docker} rmi bench:new", check=False)
+        def run() -> None:
+            sh(F"{sys.executable} {COPYEDIT} --docker='{docker}' -G {TAR} -T {self.tmpdir}/copyedit.tmp FROM bench:0 INTO bench:new {EDITS}")
+        return setup, run
+    def check(self, changed: int) -> None:
+        if changed != SIZES[self.size]["items"]:
+            raise RuntimeError(F"{self.name}: {changed} configs edited")
+
+BENCHMARKS = ["edit_datadir", "repack", "pipeline", "stream", "copyedit"]
+
+def importtime(repeat: int = REPEAT) -> Tuple[float, List[str]]:
+    """ the best cumulative 'python -X importtime' of 'import docker_copyedit' => seconds, the modules it imported """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    cmd = [sys.executable, "-X", "importtime", "-X", "pycache_prefix=" + os.path.abspath(os.path.join(TMPDIR, "pycache")),
+           "-c", "import docker_copyedit"]
+    subprocess.run(cmd, cwd=HERE, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)  # compile once
+    best = 0.
+    modules: List[str] = []
+    for _ in range(max(1, repeat)):
+        run = subprocess.run(cmd, cwd=HERE, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        modules = []
+        for line in run.stderr.decode("utf-8").splitlines():
+            if line.startswith("import time:") and line.count("|") == 2:
+                _, cumulative, name = line.split("|")
+                modules.append(name.strip())
+                if name.strip() == "docker_copyedit":
+                    seconds = int(cumulative) / 1000000
+                    best = seconds if not best else min(best, seconds)
+    return best, modules
+
+def endtoend(script: str, args: List[str], repeat: int = REPEAT) -> float:
+    """ the best wall time of 'python script args' with a docker on the PATH that does nothing => seconds """
+    bindir = os.path.abspath(os.path.join(TMPDIR, "bin"))
+    if not os.path.exists(os.path.join(bindir, "docker")):
+        os.makedirs(bindir, exist_ok=True)
+        with open(os.path.join(bindir, "docker"), "w") as fp:
+            fp.write("#! /bin/sh\nexit 0\n")
+        os.chmod(os.path.join(bindir, "docker"), 0o755)
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PATH"] = bindir + os.pathsep + env.get("PATH", "")
+    cmd = [sys.executable, script] + args
+    subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)  # the bytecode gets cached
+    def run() -> None:
+        subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return timed(nothing, run, repeat)
+
+def startup(repeat: int = REPEAT, budget: float = STARTUP, tolerance: float = TOLERANCE) -> Tuple[Dict[str, Dict[str, float]], List[str]]:
+    """ the import time against the budget, the commands end to end against the BASELINE => the results, the problems.
+        Only ./docker-copyedit.py is checked - the module run as a script compiles all of its source on each call. """
+    seconds, modules = importtime(repeat)
+    problems = [F"imports {module}" for module in LAZY if module in modules]
+    if seconds > budget:
+        problems.append("startup %.3fs over the budget of %.3fs" % (seconds, budget))
+    results = {"startup": {"seconds": seconds, "bytes": 0, "mb_per_s": 0.}}
+    for name, args in COMMANDS.items():
+        wrapper = endtoend(WRAPPER, args, repeat)
+        script = endtoend(COPYEDIT, args, repeat)
+        results[F"startup/{name}"] = {"seconds": wrapper, "bytes": 0, "mb_per_s": 0.}
+        results[F"startup/{name}-script"] = {"seconds": script, "bytes": 0, "mb_per_s": 0.}
+        if wrapper > BASELINE[name] * (1 + tolerance):
+            problems.append("%s %.3fs slower than the %.3fs before" % (name, wrapper, BASELINE[name]))
+    return results, problems
+
+def nothing() -> None:
+    pass
+
+def timed(setup: Callable[[], None], func: Callable[[], None], repeat: int) -> float:
+    """ the best of the repeated runs (the most stable number on a busy box) - the setup is not timed """
+    best = 0.
+    for _ in range(max(1, repeat)):
+        setup()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if not best else min(best, elapsed)
+    return best
+
+def run_benchmarks(patterns: List[str], sizes: List[str], oci: bool = False, repeat: int = REPEAT) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        name = size + ("-oci" if oci else "")
+        selected = [benchmark for benchmark in BENCHMARKS
+                    if any(fnmatch(F"{benchmark}/{name}", pattern) or fnmatch(benchmark, pattern) for pattern in patterns)]
+        if not selected:
+            continue
+        bench = Bench(TMPDIR, size, oci)
+        for benchmark in selected:
+            name = F"{benchmark}/{bench.name}"
+            setup, func = getattr(bench, benchmark)()
+            seconds = timed(setup, func, repeat)
+            results[name] = {"seconds": seconds, "bytes": bench.bytes(), "mb_per_s": bench.bytes() / max(seconds, 1e-9) / 1024 / 1024}
+            logg.info("%s %.3fs", name, seconds)
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float = TOLERANCE) -> List[str]:
+    """ print the results next to the baseline => the names that got slower than the tolerance """
+    regressions: List[str] = []
+    for name, result in results.items():
+        line = "%-24s %9.3fs %9.1f MB/s" % (name, result["seconds"], result["mb_per_s"])
+        if name in baseline:
+            before = baseline[name]["seconds"]
+            change = result["seconds"] / max(before, 1e-9) - 1
+            line += "  (baseline %.3fs %+.0f%%)" % (before, 100 * change)
+            if change > tolerance:
+                line += " REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main() -> int:
+    global TMPDIR, TAR # pylint: disable=global-statement
+    from optparse import OptionParser # pylint: disable=deprecated-module,import-outside-toplevel
+    cmdline = OptionParser("%prog [options] [benchmark-pattern...]", epilog=__doc__)
+    cmdline.add_option("-v", "--verbose", action="count", default=0,
+                       help="increase logging level [%default]")
+    cmdline.add_option("-T", "--tmpdir", metavar="DIR", default=TMPDIR,
+                       help="keep the generated archives here [%default]")
+    cmdline.add_option("-G", "--tar", metavar="EXE", default=TAR,
+                       help="use another gnu-ish tar tool [%default]")
+    cmdline.add_option("--sizes", metavar="LIST", default="tiny,small,medium",
+                       help="size presets %s [%%default]" % ",".join(SIZES))
+    cmdline.add_option("--oci", action="store_true", default=False,
+                       help="generate OCI layout archives (as docker 25 saves them) [%default]")
+    cmdline.add_option("--repeat", metavar="N", type="int", default=REPEAT,
+                       help="take the best of N runs [%default]")
+    cmdline.add_option("--baseline", metavar="FILE", default="",
+                       help="compare with the json baseline of an earlier run [%default]")
+    cmdline.add_option("--update", action="store_true", default=False,
+                       help="write the results into the --baseline file [%default]")
+    cmdline.add_option("--tolerance", metavar="FRACTION", type="float", default=TOLERANCE,
+                       help="fail when slower than the baseline by more [%default]")
+    cmdline.add_option("--history", metavar="FILE", default="",
+                       help="append the results with the date to a json-lines file [%default]")
+    cmdline.add_option("--generate", metavar="FILE", default="",
+                       help="only write an archive of the first --sizes preset [%default]")
+    cmdline.add_option("--startup", metavar="SECONDS", type="float", default=STARTUP,
+                       help="fail when 'import docker_copyedit' takes longer [%default]")
+    opt, args = cmdline.parse_args()
+    logging.basicConfig(level=max(0, logging.WARNING - 10 * opt.verbose))
+    logging.getLogger("edit").setLevel(max(0, logging.ERROR - 10 * opt.verbose))
+    TMPDIR = opt.tmpdir
+    TAR = opt.tar
+    sizes = [size.strip() for size in opt.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        logg.error("unknown --sizes %s (use %s)", ",".join(unknown), ",".join(SIZES))
+        return os.EX_USAGE
+    if opt.generate:
+        generate_archive(opt.generate, oci=opt.oci, **SIZES[sizes[0]])
+        return os.EX_OK
+    results = run_benchmarks(args or ["*"], sizes, opt.oci, opt.repeat)
+    problems: List[str] = []
+    if any(fnmatch("startup", pattern) for pattern in args or ["*"]):
+        startups, problems = startup(opt.repeat, opt.startup, opt.tolerance)
+        results.update(startups)
+    baseline: Dict[str, Dict[str, float]] = {}
+    if opt.baseline and os.path.exists(opt.baseline):
+        with open(opt.baseline) as fp:
+            baseline = json.load(fp)["results"]
+    regressions = compare(results, baseline, opt.tolerance)
+    if opt.baseline and opt.update:
+        baseline.update(results)
+        with open(opt.baseline + ".tmp", "w") as fp:
+            json.dump({"version": __version__, "python": platform.python_version(), "machine": platform.machine(),
+                       "results": baseline}, fp, indent=2, sort_keys=True)
+        os.rename(opt.baseline + ".tmp", opt.baseline)
+        logg.warning("written %s", opt.baseline)
+    if opt.history:
+        with open(opt.history, "a") as fp:
+            fp.write(json.dumps({"date": datetime.datetime.now(datetime.timezone.utc).isoformat(), "version": __version__,
+                                 "machine": platform.machine(), "results": results}, sort_keys=True) + "\n")
+    for problem in problems:
+        logg.error("startup: %s", problem)
+    if regressions:
+        logg.error("slower than %s: %s", opt.baseline, " ".join(regressions))
+        return 1
+    if problems:
+        return 1
+    return os.EX_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
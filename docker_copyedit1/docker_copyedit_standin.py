@@ -0,0 +1,271 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-module-docstring,missing-class-docstring,missing-function-docstring,line-too-long
+# pylint: disable=invalid-name,unspecified-encoding,consider-using-with,too-many-return-statements
+
+""" a docker/podman stand-in over a local directory store - it knows 'save', 'load', 'tag', 'rmi', 'inspect',
+    'image inspect', 'images' and 'history', so that docker-copyedit.py --docker='docker_copyedit_standin.py --store=DIR'
+    runs its whole pipeline without a daemon. The archives are streamed at disk speed and kept as they were loaded. """
+
+__copyright__ = "(C) 2017-2025 Guido U. Draheim, licensed under the EUPL"
+__version__ = "1.5.1222"
+
+from typing import List, Dict, Any, Optional, IO
+import sys
+import os
+import os.path
+import io
+import re
+import json
+import hashlib
+import tarfile
+import datetime
+
+STORE = os.environ.get("DOCKER_COPYEDIT_STORE", "tmp.store")
+BUFSIZE = 1024 * 1024
+
+class Store:
+    """ STORE/archives/*.tar as loaded, STORE/images.json with the config id => archive and manifest item,
+        and STORE/tags.json with the image name => config id """
+    def __init__(self, store: str) -> None:
+        self.store = store
+        self.archives = os.path.join(store, "archives")
+        if not os.path.isdir(self.archives):
+            os.makedirs(self.archives)
+        self.images: Dict[str, Dict[str, Any]] = self.read("images.json")
+        self.tags: Dict[str, str] = self.read("tags.json")
+    def read(self, name: str) -> Dict[str, Any]:
+        filename = os.path.join(self.store, name)
+        if not os.path.exists(filename):
+            return {}
+        with open(filename) as fp:
+            return dict(json.load(fp))
+    def write(self) -> None:
+        for name, data in [("images.json", self.images), ("tags.json", self.tags)]:
+            filename = os.path.join(self.store, name)
+            with open(filename + ".tmp", "w") as fp:
+                json.dump(data, fp, indent=1, sort_keys=True)
+            os.rename(filename + ".tmp", filename)
+    def find(self, image: str) -> Optional[str]:
+        """ the config id of an image name, an image id, or a short image id """
+        if image in self.tags:
+            return self.tags[image]
+        if ":" not in image.split("/")[-1] and image + ":latest" in self.tags:
+            return self.tags[image + ":latest"]
+        for image_id in self.images:
+            if image_id == image or image_id == "sha256:" + image or (len(image) >= 12 and image_id[len("sha256:"):].startswith(image)):
+                return image_id
+        return None
+    def config(self, image_id: str) -> Dict[str, Any]:
+        image = self.images[image_id]
+        with tarfile.open(image["archive"]) as tar:
+            member = tar.extractfile(members(tar)[image["config"]])
+            assert member is not None
+            return dict(json.loads(member.read()))
+    def untag(self, name: str) -> None:
+        """ drop the tag - and the image that lost its last tag (with its archive when no other image is in it),
+            so that repeated benchmark runs do not fill the disk """
+        image_id = self.tags.pop(name, "")
+        if image_id and image_id not in self.tags.values():
+            self.drop(image_id)
+    def drop(self, image_id: str) -> None:
+        if image_id in self.images:
+            archive = self.images.pop(image_id)["archive"]
+            if archive not in [image["archive"] for image in self.images.values()] and os.path.exists(archive):
+                os.remove(archive)
+    def repotags(self, image_id: str) -> List[str]:
+        return sorted(tag for tag, tagged in self.tags.items() if tagged == image_id)
+
+def members(tar: tarfile.TarFile) -> Dict[str, tarfile.TarInfo]:
+    """ the members by name - without the './' of an archive packed with 'tar cf - .' """
+    return dict((os.path.normpath(info.name), info) for info in tar.getmembers())
+
+def tagged(image: str) -> str:
+    return image if ":" in image.split("/")[-1] else image + ":latest"
+
+def load(store: Store, source: IO[bytes]) -> int:
+    """ stream the archive into the store (hashing as it goes), then register its manifest items """
+    tmpfile = os.path.join(store.archives, "loading.%i.tmp" % os.getpid())
+    sha256 = hashlib.sha256()
+    with open(tmpfile, "wb") as fp:
+        while True:
+            chunk = source.read(BUFSIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            fp.write(chunk)
+    archive = os.path.join(store.archives, sha256.hexdigest() + ".tar")
+    os.rename(tmpfile, archive)
+    try:
+        with tarfile.open(archive) as tar:
+            found = members(tar)
+            member = tar.extractfile(found["manifest.json"])
+            assert member is not None
+            manifest = json.loads(member.read())
+            for item in manifest:
+                config = tar.extractfile(found[item["Config"]])
+                assert config is not None
+                image_id = "sha256:" + hashlib.sha256(config.read()).hexdigest()
+                store.images[image_id] = {"archive": archive, "config": item["Config"], "layers": item["Layers"],
+                                          "size": sum(found[layer].size for layer in item["Layers"] if layer in found),
+                                          "loaded": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+                for tag in item.get("RepoTags") or []:
+                    if store.tags.get(tag) != image_id:
+                        store.untag(tag)
+                    store.tags[tag] = image_id
+                    print(F"Loaded image: {tag}")
+                if not item.get("RepoTags"):
+                    print(F"Loaded image ID: {image_id}")
+    except (KeyError, tarfile.TarError, ValueError) as e:
+        os.remove(archive)
+        sys.stderr.write(F"Error: invalid image archive: {e}\n")
+        return 1
+    store.write()
+    return 0
+
+def save(store: Store, images: List[str], target: IO[bytes]) -> int:
+    """ stream the members of the images from their archives - with a manifest.json of the requested names """
+    found: List[str] = []
+    for image in images:
+        image_id = store.find(image)
+        if not image_id:
+            sys.stderr.write(F"Error: No such image: {image}\n")
+            return 1
+        found.append(image_id)
+    manifest: List[Dict[str, Any]] = []
+    written = set()
+    with tarfile.open(fileobj=target, mode="w|") as out:
+        out.copybufsize = BUFSIZE  # type: ignore[attr-defined]
+        for image, image_id in zip(images, found):
+            entry = store.images[image_id]
+            wanted = [entry["config"]] + entry["layers"]
+            with tarfile.open(entry["archive"]) as tar:
+                for name, info in members(tar).items():
+                    if name in written or not (name in wanted or any(layer.startswith(name + "/") for layer in wanted)):
+                        continue
+                    info.name = name
+                    out.addfile(info, tar.extractfile(info) if info.isfile() else None)
+                    written.add(name)
+            by_id = image.startswith("sha256:") or image_id[len("sha256:"):].startswith(image)
+            manifest.append({"Config": entry["config"], "RepoTags": None if by_id else [tagged(image)], "Layers": entry["layers"]})
+        data = json.dumps(manifest).encode("utf-8")
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(data)
+        out.addfile(info, io.BytesIO(data))
+    return 0
+
+def inspect_data(store: Store, image_id: str) -> Dict[str, Any]:
+    config = store.config(image_id)
+    return {"Id": image_id, "RepoTags": store.repotags(image_id), "Size": store.images[image_id]["size"],
+            "Created": config.get("created", ""), "Architecture": config.get("architecture", ""), "Os": config.get("os", ""),
+            "Config": config.get("config", {}), "RootFS": config.get("rootfs", {})}
+
+def formatted(template: str, data: Dict[str, Any]) -> str:
+    """ the {{.Field}} and {{json .Field}} parts of a go template """
+    def value(m: "re.Match[str]") -> str:
+        found: Any = data
+        for key in m.group(2).split("."):
+            found = found.get(key, "") if isinstance(found, dict) else ""
+        return json.dumps(found) if m.group(1) else str(found)
+    return re.sub(r"\{\{\s*(json\s+)?\.([\w.]+)\s*\}\}", value, template)
+
+def main(args: List[str]) -> int:
+    global STORE # pylint: disable=global-statement
+    while args and args[0].startswith("--"):
+        option = args.pop(0)
+        if option.startswith("--store="):
+            STORE = option[len("--store="):]
+        elif option in ["--context", "--host"]:
+            args.pop(0)
+    if not args:
+        sys.stderr.write(__doc__ + "\n")
+        return 1
+    store = Store(STORE)
+    cmd = args.pop(0)
+    if cmd == "image" and args:
+        cmd = args.pop(0)
+        cmd = "images" if cmd == "ls" else cmd
+    template = ""
+    output = ""
+    names: List[str] = []
+    while args:
+        arg = args.pop(0)
+        if arg in ["--format", "-f"] and args:
+            template = args.pop(0)
+        elif arg.startswith("--format="):
+            template = arg[len("--format="):]
+        elif arg in ["-o", "--output", "-i", "--input"] and args:
+            output = args.pop(0)
+        elif arg.startswith("-"):
+            continue
+        else:
+            names.append(arg)
+    if cmd == "load":
+        if output:
+            with open(output, "rb") as fp:
+                return load(store, fp)
+        return load(store, sys.stdin.buffer)
+    if cmd == "save":
+        if output:
+            with open(output, "wb") as fp:
+                return save(store, names, fp)
+        return save(store, names, sys.stdout.buffer)
+    if cmd == "tag" and len(names) == 2:
+        image_id = store.find(names[0])
+        if not image_id:
+            sys.stderr.write(F"Error: No such image: {names[0]}\n")
+            return 1
+        if store.tags.get(tagged(names[1])) != image_id:
+            store.untag(tagged(names[1]))
+        store.tags[tagged(names[1])] = image_id
+        store.write()
+        return 0
+    if cmd in ["rmi", "rm"]:
+        for name in names:
+            image_id = store.find(name)
+            if not image_id:
+                sys.stderr.write(F"Error: No such image: {name}\n")
+                return 1
+            if tagged(name) in store.tags:
+                store.untag(tagged(name))
+            else:
+                for tag in store.repotags(image_id):
+                    store.untag(tag)
+                store.drop(image_id)
+            print(F"Untagged: {name}")
+        store.write()
+        return 0
+    if cmd in ["inspect", "history"]:
+        found = [(name, store.find(name)) for name in names]
+        missing = [name for name, image_id in found if not image_id]
+        if missing:
+            sys.stderr.write(F"Error: No such image: {missing[0]}\n")
+            return 1
+        if cmd == "history":
+            image_id = found[0][1] or ""
+            entries = list(reversed(store.config(image_id).get("history", [])))
+            for num, entry in enumerate(entries):
+                row = {"ID": image_id if not num else "<missing>", "CreatedBy": entry.get("created_by", ""),
+                       "Comment": entry.get("comment", ""), "CreatedAt": entry.get("created", "")}
+                print(formatted(template, row) if template else "\t".join(str(value) for value in row.values()))
+            return 0
+        data = [inspect_data(store, image_id or "") for _, image_id in found]
+        if template:
+            for item in data:
+                print(formatted(template, item))
+        else:
+            print(json.dumps(data, indent=4))
+        return 0
+    if cmd == "images":
+        if not template:
+            print("REPOSITORY\tTAG\tIMAGE ID\tSIZE")
+            template = "{{.Repository}}\t{{.Tag}}\t{{.ID}}\t{{.Size}}"
+        for tag, image_id in sorted(store.tags.items()):
+            repository, _, version = tag.rpartition(":")
+            print(formatted(template, {"Repository": repository, "Tag": version, "ID": image_id[len("sha256:"):][:12],
+                                       "Size": store.images[image_id]["size"]}))
+        return 0
+    sys.stderr.write(F"standin: {cmd} not supported\n")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -6,7 +6,7 @@
 __copyright__ = "(C) 2017-2025 Guido U. Draheim, licensed under the EUPL"
 __version__ = "1.5.1222"
 
-from typing import Optional, Union, List, Iterator, NamedTuple
+from typing import Optional, Union, List, Iterator, NamedTuple, Dict, Set, Tuple, Any
 import sys
 import subprocess
 import unittest
@@ -16,9 +16,22 @@ import inspect
 import shutil
 import os.path
 import glob
+import hashlib
+import base64
+import io
+import tarfile
+import pstats
+import threading
+import socket
+import http.server
+import urllib.parse
 import logging
 from fnmatch import fnmatchcase as fnmatch
 import json
+import concurrent.futures
+import fcntl
+import docker_copyedit  # in-process checks of the edit engine
+import docker_copyedit_bench
 
 os.chdir(os.path.dirname(os.path.abspath(__file__)))  # assume the scripts stayed together
 
@@ -129,7 +142,7 @@ def _grep(pattern: str, lines: Union[str, List[str]]) -> Iterator[str]:
         if re.search(pattern, line.rstrip()):
             yield line.rstrip()
 def grep(pattern: str, lines: Union[str, List[str]]) -> List[str]:
-    return list(grep(pattern, lines))
+    return list(_grep(pattern, lines))
 def greps(lines: Union[str, List[str]], pattern: str) -> List[str]:
     return list(grep(pattern, lines))
 
@@ -153,6 +166,330 @@ def shell_file(filename: str, content: str) -> None:
     text_file(filename, content)
     os.chmod(filename, 0o770)
 
+# configs as written by the daemons (docker 20 with container_config, docker 27 via buildkit, podman/buildah)
+DAEMON_CONFIGS = [
+    '{"architecture":"amd64","config":{"Hostname":"","Domainname":"","User":"","AttachStdin":false,"AttachStdout":false,'
+    '"AttachStderr":false,"ExposedPorts":{"80/tcp":{}},"Tty":false,"OpenStdin":false,"StdinOnce":false,"Env":["PATH=/usr/local/sbin:'
+    '/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin","NGINX_VERSION=1.21.6"],"Cmd":["nginx","-g","daemon off;"],"Image":"sha256:'
+    '1a0e2b5b9d3d7c2c7a9bd9c2fa0a8d3c2b3e4d5f6a7b8c9d0e1f2a3b4c5d6e7f","Volumes":{"/var/cache/nginx":{}},"WorkingDir":"",'
+    '"Entrypoint":["/docker-entrypoint.sh"],"OnBuild":null,"Labels":{"maintainer":"NGINX Docker Maintainers \\u003cdocker-maint@nginx.com\\u003e"},'
+    '"StopSignal":"SIGQUIT"},"container":"3d2a4b9f0c1e","container_config":{"Hostname":"3d2a4b9f0c1e","Domainname":"","User":"",'
+    '"Env":["PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin","NGINX_VERSION=1.21.6"],"Cmd":["/bin/sh","-c",'
+    '"#(nop) ","CMD [\\"nginx\\" \\"-g\\" \\"daemon off;\\"]"],"Volumes":{"/var/cache/nginx":{}},"WorkingDir":"","Entrypoint":'
+    '["/docker-entrypoint.sh"],"OnBuild":null,"Labels":{"maintainer":"NGINX Docker Maintainers \\u003cdocker-maint@nginx.com\\u003e"},'
+    '"StopSignal":"SIGQUIT"},"created":"2022-03-01T03:11:41.617290523Z","docker_version":"20.10.7","history":[{"created":'
+    '"2022-03-01T01:20:51.830293014Z","created_by":"/bin/sh -c #(nop) ADD file:c51141702f568a28a37a5f0f7a3c5a8f9b1ce9e4 in / "},'
+    '{"created":"2022-03-01T01:20:52.227270337Z","created_by":"/bin/sh -c #(nop)  CMD [\\"bash\\"]","empty_layer":true},'
+    '{"created":"2022-03-01T03:11:41.617290523Z","created_by":"/bin/sh -c #(nop)  CMD [\\"nginx\\" \\"-g\\" \\"daemon off;\\"]",'
+    '"empty_layer":true}],"os":"linux","rootfs":{"type":"layers","diff_ids":["sha256:'
+    '7d0ebbe3f5d26c1b5ec4d5dbb6fe3205d7061f9735080b0162d550530328abd6"]}}',
+    '{"architecture":"arm64","config":{"Env":["PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"],'
+    '"Cmd":["/bin/bash"],"WorkingDir":"/app","Labels":{"org.opencontainers.image.ref.name":"ubuntu",'
+    '"org.opencontainers.image.version":"24.04"},"ArgsEscaped":true},"created":"2025-02-11T09:13:04.512941113Z","history":'
+    '[{"created":"2025-01-26T05:31:14.812414455Z","created_by":"/bin/sh -c #(nop)  ARG RELEASE","empty_layer":true},'
+    '{"created":"2025-01-26T05:31:17.149289291Z","created_by":"/bin/sh -c #(nop) ADD file:1b6c8c9518be42fa2afe5e241ca31677fce5'
+    '8d27cdfa88baa91a65a259be3637 in / "},{"created":"2025-02-11T09:13:04.512941113Z","created_by":"WORKDIR /app",'
+    '"comment":"buildkit.dockerfile.v0"}],"os":"linux","rootfs":{"type":"layers","diff_ids":["sha256:'
+    '4b7c01ed0534d4f9be9cf97d068da1598c6c20b26cb6134fad066defdb6d541d","sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cdd'
+    'fd10ace2f5c5e"]},"variant":"v8"}',
+    '{"created":"2025-03-07T11:02:27.263213011Z","architecture":"amd64","os":"linux","config":{"Env":["PATH=/usr/local/sbin:'
+    '/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin","container=oci"],"Cmd":["/bin/bash"],"Labels":{"io.buildah.version":"1.33.8",'
+    '"name":"almalinux"}},"rootfs":{"type":"layers","diff_ids":["sha256:3a1c5e2d8b3c37eb4ef9f2c1d0f35a1c5b0e6b5f10c9c0d3cd4b6d'
+    '0fd7a8f2d1"]},"history":[{"created":"2025-03-07T11:02:26.561324221Z","created_by":"/bin/sh -c #(nop) ADD file:8c9d2b4a'
+    '7e1f4d3b0c in / ","empty_layer":false},{"created":"2025-03-07T11:02:27.263213011Z","created_by":"/bin/sh -c #(nop) CMD'
+    ' [\\"/bin/bash\\"]","comment":"FROM 3a1c5e2d8b3c","empty_layer":true}]}\n',
+]
+
+def fake_config(env: Optional[List[str]] = None, labels: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {"architecture": "amd64", "os": "linux", "created": "2025-01-01T00:00:00Z",
+            "config": {"Env": env or ["PATH=/usr/bin:/bin"], "Cmd": ["/bin/sh"], "Labels": labels or {},
+                       "WorkingDir": "", "User": ""},
+            "rootfs": {"type": "layers", "diff_ids": []},
+            "history": [{"created": "2025-01-01T00:00:00Z", "created_by": "/bin/sh -c #(nop) ADD file:0 in / "}]}
+def fake_archive(filename: str, configs: Union[Dict[str, Any], List[Dict[str, Any]]], tags: Optional[List[str]] = None,
+                 config_text: Optional[str] = None) -> str:
+    """ write a small 'docker save' archive with one layer per image """
+    if isinstance(configs, dict):
+        configs = [configs]
+    manifest = []
+    with tarfile.open(filename, "w") as tar:
+        def add(name: str, data: bytes) -> None:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        for num, config in enumerate(configs):
+            layer = io.BytesIO()
+            with tarfile.open(fileobj=layer, mode="w") as layertar:
+                data = json.dumps(config.get("config")).encode("utf-8")
+                info = tarfile.TarInfo("etc/layer.json")
+                info.size = len(data)
+                layertar.addfile(info, io.BytesIO(data))
+            layerdata = layer.getvalue()
+            layerhash = hashlib.sha256(layerdata).hexdigest()
+            config["rootfs"] = {"type": "layers", "diff_ids": ["sha256:" + layerhash]}
+            text = config_text if config_text is not None else json.dumps(config, separators=(",", ":"))
+            confighash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            add(layerhash + "/layer.tar", layerdata)
+            add(confighash + ".json", text.encode("utf-8"))
+            repotags = [tags[num]] if tags and num < len(tags) else ["image%s:latest" % num]
+            manifest.append({"Config": confighash + ".json", "RepoTags": repotags, "Layers": [layerhash + "/layer.tar"]})
+        add("manifest.json", json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+    return filename
+def job_workdir(tmpdir: str, text: str) -> str:
+    """ the work directory of the job below the -T tmpdir (as it shows up in the log) """
+    found = re.search(re.escape(tmpdir) + r"/job\.\w+", text)
+    return found.group(0) if found else os.path.join(tmpdir, "job.unknown")
+def fake_docker(testdir: str, name: str = "docker") -> str:
+    """ a docker stand-in: 'save' emits testdir/saved.tar and 'load' stores testdir/loaded.tar,
+        where 'run' and 'tag' only record their arguments in testdir/run.txt and testdir/tagged.txt
+        ('run' prints testdir/run.out if it exists),
+        where 'image inspect' finds the image ids listed in testdir/images.txt
+        and 'history' shows testdir/history.txt """
+    store = os.path.abspath(testdir)
+    filename = os.path.join(store, name)
+    shell_file(filename, F"""
+      #! /bin/sh
+      cmd="$1"; shift
+      case "$cmd" in
+        save) if test "$2" = "-o"; then cp "{store}/saved.tar" "$3"; else cat "{store}/saved.tar"; fi ;;
+        load) if test "$1" = "-i"; then cp "$2" "{store}/loaded.tar"; else cat > "{store}/loaded.tar"; fi
+              echo "Loaded image" ;;
+        tag) echo "$1 $2" >> "{store}/tagged.txt" ;;
+        run) echo "$@" >> "{store}/run.txt"
+             if test -f "{store}/run.out"; then cat "{store}/run.out"; else echo "helper done"; fi ;;
+        history) if test -f "{store}/history.txt"; then cat "{store}/history.txt"; else exit 1; fi ;;
+        image) for image in "$@"; do :; done
+               if test -f "{store}/images.txt" && grep -q "$image" "{store}/images.txt"; then echo "$image"
+               else echo "{name}: no such image $image" >&2; exit 1; fi ;;
+        *) echo "{name}: $cmd not supported" >&2; exit 1 ;;
+      esac
+    """)
+    return filename
+def fake_docker_root(root: str, config: Dict[str, Any], tags: List[str], driver: str = "overlay2") -> str:
+    """ write a small /var/lib/docker tree with the imagedb and layerdb of one image """
+    imagedir = os.path.join(root, "image", driver)
+    diff_ids = ["sha256:" + hashlib.sha256(("layer %s" % num).encode("utf-8")).hexdigest() for num in range(3)]
+    config["rootfs"] = {"type": "layers", "diff_ids": diff_ids}
+    text = json.dumps(config, separators=(",", ":"))
+    image_id = "sha256:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    text_file(os.path.join(imagedir, "imagedb", "content", "sha256", image_id[len("sha256:"):]), text)
+    text_file(os.path.join(imagedir, "imagedb", "metadata", "sha256", image_id[len("sha256:"):], "lastUpdated"), "2025")
+    chain_id = ""
+    for diff_id in diff_ids:
+        if not chain_id:
+            chain_id = diff_id
+        else:
+            chain_id = "sha256:" + hashlib.sha256((chain_id + " " + diff_id).encode("utf-8")).hexdigest()
+        text_file(os.path.join(imagedir, "layerdb", "sha256", chain_id[len("sha256:"):], "diff"), diff_id)
+    repositories: Dict[str, Dict[str, str]] = {}
+    for tag in tags:
+        repositories.setdefault(tag.rsplit(":", 1)[0], {})[tag] = image_id
+    text_file(os.path.join(imagedir, "repositories.json"), json.dumps({"Repositories": repositories}))
+    return image_id
+def fake_podman_storage(root: str, config: Dict[str, Any], names: List[str], driver: str = "overlay") -> str:
+    """ write a small containers-storage tree with the images.json and big-data of one image """
+    imagesdir = os.path.join(root, F"{driver}-images")
+    text = json.dumps(config, separators=(",", ":"))
+    image_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    config_key = "sha256:" + image_id
+    manifest = json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                           "config": {"mediaType": "application/vnd.oci.image.config.v1+json",
+                                      "digest": config_key, "size": len(text)}, "layers": []})
+    manifest_digest = "sha256:" + hashlib.sha256(manifest.encode("utf-8")).hexdigest()
+    encoded_key = "=" + base64.b64encode(config_key.encode("utf-8")).decode("ascii")
+    text_file(os.path.join(imagesdir, image_id, encoded_key), text)
+    text_file(os.path.join(imagesdir, image_id, "manifest"), manifest)
+    text_file(os.path.join(imagesdir, "images.lock"), "")
+    image = {"id": image_id, "digest": manifest_digest, "names": names, "layer": "0" * 64,
+             "metadata": "{}", "big-data-names": [config_key, "manifest"], "created": "2025-01-01T00:00:00Z"}
+    text_file(os.path.join(imagesdir, "images.json"), json.dumps([image]))
+    return image_id
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+OCI_CONFIG = "application/vnd.oci.image.config.v1+json"
+OCI_LAYER = "application/vnd.oci.image.layer.v1.tar"
+def fake_layer(filename: str, content: str) -> bytes:
+    layer = io.BytesIO()
+    with tarfile.open(fileobj=layer, mode="w") as tar:
+        data = content.encode("utf-8")
+        info = tarfile.TarInfo(filename)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return layer.getvalue()
+class FakeRegistry:
+    """ a small in-memory registry implementing the blob and manifest endpoints of the distribution api """
+    def __init__(self, token: bool = False, mount: bool = True) -> None:
+        self.blobs: Dict[str, bytes] = {}
+        self.repos: Dict[str, Set[str]] = {}  # repository => blob digests
+        self.manifests: Dict[str, Dict[str, Tuple[str, bytes]]] = {}  # repository => reference => (media_type, data)
+        self.uploads: Dict[str, bytes] = {}
+        self.requests: List[Tuple[str, str]] = []
+        self.clients: Set[Tuple[str, int]] = set()
+        self.scopes: List[str] = []
+        self.token = token
+        self.mount = mount  # False: refuse cross-repository mounts (202 starts an upload instead)
+        self.lock = threading.Lock()
+        registry = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+                logg.debug("registry: " + format, *args)
+            def reply(self, status: int, data: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+            def handle_request(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+                with registry.lock:
+                    registry.handle(self, body)
+            do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host = "127.0.0.1:%i" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+    def add_blob(self, repository: str, data: bytes) -> str:
+        digest = "sha256:" + hashlib.sha256(data).hexdigest()
+        self.blobs[digest] = data
+        self.repos.setdefault(repository, set()).add(digest)
+        return digest
+    def add_manifest(self, repository: str, reference: str, data: bytes, media_type: str) -> str:
+        digest = "sha256:" + hashlib.sha256(data).hexdigest()
+        self.manifests.setdefault(repository, {})[reference] = (media_type, data)
+        self.manifests[repository][digest] = (media_type, data)
+        return digest
+    def push(self, repository: str, tag: str, config: Dict[str, Any], layers: List[bytes]) -> str:
+        config_data = json.dumps(config).encode("utf-8")
+        manifest = {"schemaVersion": 2, "mediaType": OCI_MANIFEST,
+                    "config": {"mediaType": OCI_CONFIG, "digest": self.add_blob(repository, config_data), "size": len(config_data)},
+                    "layers": [{"mediaType": OCI_LAYER, "digest": self.add_blob(repository, layer), "size": len(layer)} for layer in layers]}
+        return self.add_manifest(repository, tag, json.dumps(manifest, indent=3).encode("utf-8"), OCI_MANIFEST)
+    def push_index(self, repository: str, tag: str, configs: List[Dict[str, Any]], layers: List[bytes]) -> str:
+        """ one platform image per config (by os/architecture/variant) and an attestation entry """
+        descriptors = []
+        for num, config in enumerate(configs + [dict(fake_config(), os="unknown", architecture="unknown")]):
+            digest = self.push(repository, "", config, [layers[num % len(layers)]])
+            platform = dict((key, config[key]) for key in ["os", "architecture", "variant"] if key in config)
+            descriptors.append({"mediaType": OCI_MANIFEST, "digest": digest, "size": len(self.manifests[repository][digest][1]),
+                                "platform": platform})
+        del self.manifests[repository][""]
+        index = {"schemaVersion": 2, "mediaType": OCI_INDEX, "manifests": descriptors}
+        return self.add_manifest(repository, tag, json.dumps(index, indent=3).encode("utf-8"), OCI_INDEX)
+    def manifest(self, repository: str, reference: str) -> Dict[str, Any]:
+        return dict(json.loads(self.manifests[repository][reference][1]))
+    def config(self, repository: str, reference: str) -> Dict[str, Any]:
+        return dict(json.loads(self.blobs[self.manifest(repository, reference)["config"]["digest"]]))
+    def handle(self, req: Any, body: bytes) -> None:
+        url = urllib.parse.urlsplit(req.path)
+        query = urllib.parse.parse_qs(url.query)
+        self.requests.append((req.command, url.path))
+        self.clients.add(req.client_address)
+        if url.path == "/token":
+            self.scopes += query.get("scope", [])
+            req.reply(200, json.dumps({"token": "secret"}).encode("utf-8"))
+            return
+        if self.token and req.headers.get("Authorization") != "Bearer secret":
+            m = re.match("/v2/(.*)/(manifests|blobs)/", url.path)
+            scope = "repository:%s:pull" % m.group(1) if m else ""
+            challenge = 'Bearer realm="http://%s/token",service="fake",scope="%s"' % (self.host, scope)
+            req.reply(401, b"{}", {"WWW-Authenticate": challenge})
+            return
+        m = re.match(r"^/v2/(.+)/manifests/([^/]+)$", url.path)
+        if m:
+            repository, reference = m.groups()
+            if req.command == "PUT":
+                digest = self.add_manifest(repository, reference, body, req.headers["Content-Type"])
+                req.reply(201, b"", {"Docker-Content-Digest": digest})
+                return
+            if reference not in self.manifests.get(repository, {}):
+                req.reply(404)
+                return
+            media_type, data = self.manifests[repository][reference]
+            digest = "sha256:" + hashlib.sha256(data).hexdigest()
+            req.reply(200, data, {"Content-Type": media_type, "Docker-Content-Digest": digest})
+            return
+        m = re.match(r"^/v2/(.+)/blobs/uploads/(\w*)$", url.path)
+        if m:
+            repository, uuid = m.groups()
+            if req.command == "POST":
+                mount, source = query.get("mount", [""])[0], query.get("from", [""])[0]
+                if self.mount and mount and mount in self.repos.get(source, set()):
+                    self.repos.setdefault(repository, set()).add(mount)
+                    req.reply(201, b"", {"Location": "/v2/%s/blobs/%s" % (repository, mount)})
+                    return
+                uuid = "upload%i" % len(self.uploads) + os.urandom(4).hex()
+                self.uploads[uuid] = body
+                req.reply(202, b"", {"Location": "/v2/%s/blobs/uploads/%s" % (repository, uuid)})
+                return
+            if uuid not in self.uploads:
+                req.reply(404)
+                return
+            if req.command == "PATCH":
+                self.uploads[uuid] += body
+                req.reply(202, b"", {"Location": "/v2/%s/blobs/uploads/%s" % (repository, uuid)})
+                return
+            if req.command == "DELETE":
+                del self.uploads[uuid]
+                req.reply(204)
+                return
+            data = self.uploads.pop(uuid) + body
+            digest = self.add_blob(repository, data)
+            if query.get("digest", [""])[0] != digest:
+                req.reply(400)
+                return
+            req.reply(201, b"", {"Location": "/v2/%s/blobs/%s" % (repository, digest)})
+            return
+        m = re.match(r"^/v2/(.+)/blobs/(sha256:\w+)$", url.path)
+        if m:
+            repository, digest = m.groups()
+            if digest not in self.repos.get(repository, set()):
+                req.reply(404)
+                return
+            req.reply(200, self.blobs[digest], {"Content-Type": "application/octet-stream", "Docker-Content-Digest": digest})
+            return
+        req.reply(404)
+def fake_oci_layout(path: str, tag: str, configs: List[Dict[str, Any]], layers: List[bytes]) -> str:
+    """ write an OCI image layout directory with an index of one platform image per config """
+    def add_blob(data: bytes) -> Dict[str, Any]:
+        digest = hashlib.sha256(data).hexdigest()
+        text_file(os.path.join(path, "blobs", "sha256", digest), "")
+        with open(os.path.join(path, "blobs", "sha256", digest), "wb") as fp:
+            fp.write(data)
+        return {"digest": "sha256:" + digest, "size": len(data)}
+    descriptors = []
+    for num, config in enumerate(configs):
+        layer = layers[num % len(layers)]
+        manifest = {"schemaVersion": 2, "mediaType": OCI_MANIFEST,
+                    "config": dict(add_blob(json.dumps(config).encode("utf-8")), mediaType=OCI_CONFIG),
+                    "layers": [dict(add_blob(layer), mediaType=OCI_LAYER)]}
+        platform = dict((key, config[key]) for key in ["os", "architecture", "variant"] if key in config)
+        descriptors.append(dict(add_blob(json.dumps(manifest).encode("utf-8")), mediaType=OCI_MANIFEST, platform=platform))
+    index = {"schemaVersion": 2, "mediaType": OCI_INDEX, "manifests": descriptors}
+    descriptor = dict(add_blob(json.dumps(index).encode("utf-8")), mediaType=OCI_INDEX,
+                      annotations={"org.opencontainers.image.ref.name": tag})
+    text_file(os.path.join(path, "index.json"), json.dumps({"schemaVersion": 2, "manifests": [descriptor]}))
+    text_file(os.path.join(path, "oci-layout"), json.dumps({"imageLayoutVersion": "1.0.0"}))
+    return str(descriptor["digest"])
+def loaded_archive(filename: str) -> Dict[str, bytes]:
+    files: Dict[str, bytes] = {}
+    with tarfile.open(filename) as tar:
+        for member in tar.getmembers():
+            if member.isfile():
+                data = tar.extractfile(member)
+                assert data is not None
+                files[os.path.normpath(member.name)] = data.read()
+    return files
+def loaded_configs(filename: str) -> List[Dict[str, Any]]:
+    files = loaded_archive(filename)
+    manifest = json.loads(files["manifest.json"])
+    return [json.loads(files[os.path.normpath(item["Config"])]) for item in manifest]
+
 class ShellResult(NamedTuple):
     returncode: int
     stdout: str
@@ -356,6 +693,1275 @@ class DockerCopyeditTest(unittest.TestCase):
             logg.error("you need to check /etc/subgid and /etc/subuid")
             logg.error("you need to run : podman system migrate --log-level=debug")
         self.save(self.testname())
+    def test_120_fake_edit_changes(self) -> None:
+        """ docker-copyedit.py from image1 into image2 set label (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config(labels={"version": "1"}))
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new and rm label version -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        configs = loaded_configs(os_path(testdir, "loaded.tar"))
+        self.assertEqual(configs[0]["config"]["Labels"], {"info": "new"})
+        self.assertEqual(len(configs[0]["history"]), 2)
+        self.assertIn("changed config/Labels/info", run.stderr)
+        self.assertIn("changed config/Labels/version", run.stderr)
+        self.assertIn("changed history/1", run.stderr)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_121_fake_edit_unchanged(self) -> None:
+        """ docker-copyedit.py from image1 into image2 set label (same value, fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config(labels={"version": "1"}))
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label version 1 and set cmd /bin/sh -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertIn("unchanged image", run.stderr)
+        self.assertIn("tagged old image", run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.assertEqual(open(os_path(testdir, "tagged.txt")).read(), "image1 image2:latest\n")
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_122_fake_edit_compact_podman(self) -> None:
+        """ docker-copyedit.py --docker=podman writes compact json """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir, "podman")
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set user foo -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        config_text = files[manifest[0]["Config"]].decode("utf-8")
+        self.assertEqual(json.loads(config_text)["config"]["User"], "foo")
+        self.assertNotIn('": ', config_text)
+        self.assertNotIn(', "', config_text)
+        self.assertEqual(manifest[0]["Config"], hashlib.sha256(files[manifest[0]["Config"]]).hexdigest() + ".json")
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_123_fake_edit_error(self) -> None:
+        """ docker-copyedit.py from image1 into image2 add port with an unknown service is a usage error (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 add port no-such-service -vv"
+        run = sh(cmd, check=False)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(run.returncode, os.EX_USAGE)
+        self.assertIn("bad port value no-such-service", run.stderr)
+        self.assertNotIn("Traceback", run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.assertFalse(os.path.exists(os_path(testdir, "tagged.txt")))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_124_splice_daemon_configs(self) -> None:
+        """ only the changed parts of real daemon configs are rewritten """
+        edits: List[List[docker_copyedit.Commands]] = [
+            [[("set-label", "info", "new")]],
+            [[("remove-label", "maintainer", None)], [("remove-labels", "org.%", None)], [("remove-label", "name", None)]],
+            [[("add", "volume", "/data"), ("add", "port", "8080")]],
+            [[("set", "user", "foo"), ("set", "arch", "s390x"), ("rm", "volumes", "*")]],
+            [[("set-env", "PATH", "/bin"), ("set", "entrypoint", None), ("set-label", "a", "1"), ("remove-label", "name", None)]],
+        ]
+        for num, text in enumerate(DAEMON_CONFIGS):
+            for edit in edits:
+                for commands in edit:
+                    config = json.loads(text)
+                    changes = docker_copyedit.edit_config(config, commands)
+                    if not changes:
+                        continue
+                    changes.append(("history", len(config["history"])))
+                    config["history"].append({"created": "2025-10-01T00:00:00Z", "created_by": "docker-copyedit.py"})
+                    newtext = docker_copyedit.json_splice(text, config, changes)
+                    logg.info("%s %s\n%s", num, commands, newtext)
+                    assert newtext is not None
+                    self.assertEqual(json.loads(newtext), config)
+                    self.assertNotIn('": ', newtext)
+                    history = text.index('"history":')
+                    self.assertIn(text[history:text.index("}]", history)], newtext)
+                    if num == 0 and commands[0][0] != "remove-label":
+                        self.assertIn("\\u003cdocker-maint@nginx.com\\u003e", newtext)
+                    if num == 2:
+                        self.assertTrue(newtext.endswith("}\n"))
+    def test_125_splice_escalations(self) -> None:
+        """ removals and list changes fall back to rewriting the container """
+        text = '{"a": 1, "b": {"x": 1, "y": [1, 2]}, "c": null}'
+        self.assertEqual(docker_copyedit.json_splice(text, {"a": 2, "b": {"x": 1, "y": [1, 2]}, "c": None}, [("a",)]),
+                         '{"a": 2, "b": {"x": 1, "y": [1, 2]}, "c": null}')
+        self.assertEqual(docker_copyedit.json_splice(text, {"a": 1, "b": {"y": [1, 2]}, "c": None}, [("b", "x")]),
+                         '{"a": 1, "b": {"y": [1, 2]}, "c": null}')
+        self.assertEqual(docker_copyedit.json_splice(text, {"a": 1, "b": {"y": [1, 2, 3]}, "c": None}, [("b", "x"), ("b", "y", 2)]),
+                         '{"a": 1, "b": {"y": [1, 2, 3]}, "c": null}')
+        self.assertEqual(docker_copyedit.json_splice(text, {"a": 1, "b": {"z": 0}, "c": None}, [("b", "x"), ("b", "y"), ("b", "z")]),
+                         '{"a": 1, "b": {"z": 0}, "c": null}')
+        self.assertEqual(docker_copyedit.json_splice(text, {"a": 1, "b": {"x": 1, "y": [1, 2]}, "c": {"k": "v"}}, [("c", "k")]),
+                         '{"a": 1, "b": {"x": 1, "y": [1, 2]}, "c": {"k": "v"}}')
+        self.assertEqual(docker_copyedit.json_splice(text, {"b": {"x": 1, "y": [1, 2]}}, [("a",), ("c",)]),
+                         '{"b": {"x": 1, "y": [1, 2]}}')
+        self.assertIsNone(docker_copyedit.json_splice(text, {"a": 1, "b": {"x": 1, "y": [2]}, "c": None}, [("b", "y", 0)]))
+    def test_126_fake_edit_keeps_bytes(self) -> None:
+        """ docker-copyedit.py keeps the original config bytes (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config(), config_text=DAEMON_CONFIGS[0])
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        config_text = files[manifest[0]["Config"]].decode("utf-8")
+        old_text = DAEMON_CONFIGS[0]
+        labels = old_text.index('"StopSignal"')
+        self.assertEqual(config_text[:labels - 2], old_text[:labels - 2])
+        self.assertIn('\\u003e","info":"new"},"StopSignal":"SIGQUIT"},"container":', config_text)
+        self.assertEqual(config_text[-100:], old_text[-100:])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_127_fake_source_date_epoch_invalid(self) -> None:
+        """ SOURCE_DATE_EPOCH=yesterday docker-copyedit.py is a usage error (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        for epoch in ["SOURCE_DATE_EPOCH=yesterday ", ""]:
+            config = "" if epoch else "-c SOURCE_DATE_EPOCH=1.5"
+            cmd = F"{epoch}{python} {copyedit} {config} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new -vv"
+            run = sh(cmd, check=False)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+            self.assertEqual(run.returncode, os.EX_USAGE)
+            self.assertIn("is not a number of seconds", run.stderr)
+            self.assertNotIn("Traceback", run.stderr)
+            self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_128_fake_source_date_epoch(self) -> None:
+        """ SOURCE_DATE_EPOCH=1700000000 docker-copyedit.py from image1 into image2 set label (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        image_ids = []
+        for tmpdir in ["load1.tmp", "load2.tmp"]:
+            cmd = F"SOURCE_DATE_EPOCH=1700000000 {python} {copyedit} -T {testdir}/{tmpdir} FROM image1 INTO image2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+            files = loaded_archive(os_path(testdir, "loaded.tar"))
+            manifest = json.loads(files["manifest.json"])
+            config = json.loads(files[manifest[0]["Config"]])
+            image_ids.append(manifest[0]["Config"])
+            self.assertEqual(config["history"][-1]["created"], "2023-11-14T22:13:20Z")
+            self.assertTrue(config["history"][-1]["created_by"].startswith("docker-copyedit.py #("))
+        cmd = F"{python} {copyedit} -c SOURCE_DATE_EPOCH=1700000001 -T {testdir}/load3.tmp FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        image_ids.append(manifest[0]["Config"])
+        self.assertEqual(image_ids[0], image_ids[1])
+        self.assertNotEqual(image_ids[0], image_ids[2])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_129_fake_source_date_epoch_present(self) -> None:
+        """ SOURCE_DATE_EPOCH=1700000000 docker-copyedit.py does not load an image that is present (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        cmd = F"{python} {copyedit} -c SOURCE_DATE_EPOCH=1700000000 -T {testdir}/load.tmp FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        image_id = "sha256:" + manifest[0]["Config"][:-len(".json")]
+        os.remove(os_path(testdir, "loaded.tar"))
+        text_file(os_path(testdir, "images.txt"), image_id + "\n")
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.assertIn("edited image is already present", run.stderr)
+        self.assertEqual(open(os_path(testdir, "tagged.txt")).read(), F"{image_id} image2:latest\n")
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_131_fake_edits_already_applied(self) -> None:
+        """ docker-copyedit.py from image2 into image3 with the same edits as from image1 into image2 (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new and rm label a -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        configs = loaded_configs(os_path(testdir, "loaded.tar"))
+        self.assertTrue(configs[0]["history"][-1]["comment"].startswith("docker-copyedit edits sha256:"))
+        os.rename(os_path(testdir, "loaded.tar"), os_path(testdir, "saved.tar"))
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image2 INTO image3 set label info new and rm label a -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertIn("edits were already applied", run.stderr)
+        self.assertIn("unchanged image", run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image2 INTO image3 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertNotIn("edits were already applied", run.stderr)
+        self.assertIn("unchanged image", run.stderr)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_132_fake_edits_already_in_history(self) -> None:
+        """ docker-copyedit.py does not save an image that has the edits in its history (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        comment = docker_copyedit.edits_comment([("set-label", "info", "new")])
+        text_file(os_path(testdir, "history.txt"), "sha256:" + "1" * 64 + " " + comment + "\n<missing> buildkit.dockerfile.v0\n")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertIn("edits were already applied", run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "load.tmp")))
+        self.assertEqual(open(os_path(testdir, "tagged.txt")).read(), "image1 image2:latest\n")
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info other -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertNotIn("edits were already applied", run.stderr)  # another plan is saved and edited
+        self.assertTrue(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_134_fake_shared_config(self) -> None:
+        """ docker-copyedit.py edits a config once when it is shared by manifest items (fake docker) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        fake_archive(os_path(testdir, "saved.tar"), [fake_config(), fake_config(), fake_config(env=["A=1"])],
+                     tags=["image1:a", "image1:b", "image2:c"])
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(len(greps(run.stderr, "written new")), 2)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        self.assertEqual(len(manifest), 3)
+        self.assertEqual(manifest[0]["Config"], manifest[1]["Config"])
+        self.assertNotEqual(manifest[0]["Config"], manifest[2]["Config"])
+        for item in manifest:
+            self.assertEqual(json.loads(files[item["Config"]])["config"]["Labels"], {"info": "new"})
+            self.assertEqual(item["RepoTags"], ["image2:latest"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_137_offline_imagedb(self) -> None:
+        """ docker-copyedit.py --offline from image1 into image2 set label (docker root tree) """
+        python = _python
+        copyedit = _copyedit()
+        testdir = self.testdir()
+        root = os_path(testdir, "docker")
+        old_id = fake_docker_root(root, fake_config(), ["image1:latest", "localhost:5000/image1:v1"])
+        options = F"-c DOCKERROOT={root} -c DOCKERPIDFILE={testdir}/docker.pid"
+        cmd = F"{python} {copyedit} --offline {options} FROM localhost:5000/image1:v1 INTO image2:v2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        imagedir = os.path.join(root, "image", "overlay2")
+        repositories = json.load(open(os.path.join(imagedir, "repositories.json")))["Repositories"]
+        new_id = repositories["image2"]["image2:v2"]
+        self.assertNotEqual(new_id, old_id)
+        self.assertEqual(repositories["image1"]["image1:latest"], old_id)
+        config_text = open(os.path.join(imagedir, "imagedb", "content", "sha256", new_id[len("sha256:"):]), "rb").read()
+        self.assertEqual(new_id, "sha256:" + hashlib.sha256(config_text).hexdigest())
+        self.assertEqual(json.loads(config_text)["config"]["Labels"], {"info": "new"})
+        self.assertTrue(os.path.isfile(os.path.join(imagedir, "imagedb", "metadata", "sha256", new_id[len("sha256:"):], "lastUpdated")))
+        cmd = F"{python} {copyedit} --offline {options} FROM image2:v2 INTO image3 set label info new -vv"
+        run = sh(cmd)
+        repositories = json.load(open(os.path.join(imagedir, "repositories.json")))["Repositories"]
+        self.assertEqual(repositories["image3"]["image3:latest"], new_id)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_138_offline_imagedb_checks(self) -> None:
+        """ docker-copyedit.py --offline refuses a running daemon and missing layers (docker root tree) """
+        python = _python
+        copyedit = _copyedit()
+        testdir = self.testdir()
+        root = os_path(testdir, "docker")
+        fake_docker_root(root, fake_config(), ["image1:latest"])
+        imagedir = os.path.join(root, "image", "overlay2")
+        repositories = open(os.path.join(imagedir, "repositories.json")).read()
+        text_file(os_path(testdir, "docker.pid"), "%s\n" % os.getpid())
+        options = F"-c DOCKERROOT={root} -c DOCKERPIDFILE={testdir}/docker.pid"
+        cmd = F"{python} {copyedit} --offline {options} FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd, check=False)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(run.returncode, os.EX_UNAVAILABLE)
+        self.assertIn("docker daemon is running", run.stderr)
+        os.remove(os_path(testdir, "docker.pid"))
+        layers = sorted(os.listdir(os.path.join(imagedir, "layerdb", "sha256")))
+        shutil.rmtree(os.path.join(imagedir, "layerdb", "sha256", layers[0]))
+        run = sh(cmd, check=False)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(run.returncode, os.EX_DATAERR)
+        self.assertIn("missing layer", run.stderr)
+        self.assertEqual(open(os.path.join(imagedir, "repositories.json")).read(), repositories)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_140_offline_podman_storage(self) -> None:
+        """ docker-copyedit.py --offline PODMAN image1 into image2 set label (containers-storage tree) """
+        python = _python
+        copyedit = _copyedit()
+        testdir = self.testdir()
+        root = os_path(testdir, "storage")
+        old_id = fake_podman_storage(root, fake_config(), ["localhost/image1:latest"])
+        imagesdir = os.path.join(root, "overlay-images")
+        cmd = F"{python} {copyedit} --offline -c PODMANSTORAGE={root} PODMAN image1 INTO image2:v2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        images = json.load(open(os.path.join(imagesdir, "images.json")))
+        self.assertEqual(len(images), 2)
+        old_image, new_image = images
+        self.assertEqual(old_image["id"], old_id)
+        self.assertEqual(old_image["names"], ["localhost/image1:latest"])
+        self.assertEqual(new_image["names"], ["localhost/image2:v2"])
+        self.assertEqual(new_image["layer"], old_image["layer"])
+        new_key = "sha256:" + new_image["id"]
+        encoded_key = "=" + base64.b64encode(new_key.encode("utf-8")).decode("ascii")
+        config_text = open(os.path.join(imagesdir, new_image["id"], encoded_key), "rb").read()
+        self.assertEqual(new_image["id"], hashlib.sha256(config_text).hexdigest())
+        self.assertEqual(json.loads(config_text)["config"]["Labels"], {"info": "new"})
+        manifest_text = open(os.path.join(imagesdir, new_image["id"], "manifest"), "rb").read()
+        self.assertEqual(json.loads(manifest_text)["config"]["digest"], new_key)
+        self.assertEqual(new_image["digest"], "sha256:" + hashlib.sha256(manifest_text).hexdigest())
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_141_offline_podman_storage_retag(self) -> None:
+        """ docker-copyedit.py --offline PODMAN moves the target name of an unchanged image (containers-storage tree) """
+        python = _python
+        copyedit = _copyedit()
+        testdir = self.testdir()
+        root = os_path(testdir, "storage")
+        old_id = fake_podman_storage(root, fake_config(), ["localhost/image1:latest"])
+        imagesdir = os.path.join(root, "overlay-images")
+        cmd = F"{python} {copyedit} --offline -c PODMANSTORAGE={root} PODMAN image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        images = json.load(open(os.path.join(imagesdir, "images.json")))
+        new_id = images[1]["id"]
+        cmd = F"{python} {copyedit} --offline -c PODMANSTORAGE={root} PODMAN {old_id[:12]} INTO image2 remove label info -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertIn("unchanged image", run.stderr)
+        images = json.load(open(os.path.join(imagesdir, "images.json")))
+        names = dict([(image["id"], image["names"]) for image in images])
+        self.assertEqual(names[old_id], ["localhost/image1:latest", "localhost/image2:latest"])
+        self.assertEqual(names[new_id], [])
+        self.assertEqual(len(open(os.path.join(imagesdir, "images.lock"), "rb").read()), 64)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_143_registry_edit(self) -> None:
+        """ docker-copyedit.py --registry from image1 into image2 set label (no layer is moved) """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry()
+        layers = [fake_layer("a.txt", "a"), fake_layer("b.txt", "b")]
+        old_digest = registry.push("app", "1", fake_config(), layers)
+        try:
+            cmd = F"{python} {copyedit} --registry FROM {registry.host}/app:1 INTO {registry.host}/app:2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        self.assertEqual(registry.config("app", "2")["config"]["Labels"], {"info": "new"})
+        self.assertEqual(registry.config("app", "1")["config"]["Labels"], {})
+        self.assertEqual(registry.manifest("app", "2")["layers"], registry.manifest("app", "1")["layers"])
+        self.assertEqual(registry.manifest("app", "1"), registry.manifest("app", old_digest))
+        for layer in registry.manifest("app", "1")["layers"]:
+            self.assertNotIn(("GET", "/v2/app/blobs/" + layer["digest"]), registry.requests)
+        self.assertEqual(len(registry.clients), 1)
+        self.assertIn("used 1 connection", run.stderr)
+    def test_144_registry_edit_token_mount(self) -> None:
+        """ docker-copyedit.py --registry into another repository mounts the layers (token auth) """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry(token=True)
+        registry.push("app", "1", fake_config(), [fake_layer("a.txt", "a"), fake_layer("b.txt", "b")])
+        try:
+            cmd = F"{python} {copyedit} --registry FROM {registry.host}/app:1 INTO {registry.host}/lib/other set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        self.assertEqual(registry.config("lib/other", "latest")["config"]["Labels"], {"info": "new"})
+        for layer in registry.manifest("lib/other", "latest")["layers"]:
+            self.assertIn(layer["digest"], registry.repos["lib/other"])
+        uploads = [path for method, path in registry.requests if method == "PUT" and "/uploads/" in path]
+        self.assertEqual(len(uploads), 1)  # only the new config
+        self.assertIn("repository:lib/other:pull,push", registry.scopes)
+        self.assertEqual(len([path for method, path in registry.requests if path == "/token"]), 1)
+    def test_145_registry_mount_refused(self) -> None:
+        """ docker-copyedit.py --registry into another repository streams the layers when the mount is refused """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry(mount=False)
+        registry.push("app", "1", fake_config(), [fake_layer("a.txt", "a"), fake_layer("b.txt", "b")])
+        try:
+            cmd = F"{python} {copyedit} --registry FROM {registry.host}/app:1 INTO {registry.host}/lib/other set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        self.assertEqual(registry.config("lib/other", "latest")["config"]["Labels"], {"info": "new"})
+        for layer in registry.manifest("lib/other", "latest")["layers"]:
+            self.assertIn(layer["digest"], registry.repos["lib/other"])
+        self.assertNotIn("sha256:" + hashlib.sha256(b"").hexdigest(), registry.blobs)
+        self.assertIn("0 mounted, 2 copied", run.stderr)
+    def test_146_registry_copy(self) -> None:
+        """ docker-copyedit.py --registry from registry1 into registry2 set label (layers are streamed over) """
+        python = _python
+        copyedit = _copyedit()
+        staging, prod = FakeRegistry(), FakeRegistry(token=True)
+        layers = [fake_layer("a.txt", "a"), fake_layer("b.txt", "b"), fake_layer("c.txt", "c")]
+        staging.push("app", "1", fake_config(), layers)
+        present = prod.add_blob("app", layers[0])
+        try:
+            cmd = F"{python} {copyedit} --registry FROM {staging.host}/app:1 INTO {prod.host}/app:1 set label stage prod -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            staging.stop()
+            prod.stop()
+        self.assertEqual(prod.config("app", "1")["config"]["Labels"], {"stage": "prod"})
+        for layer in prod.manifest("app", "1")["layers"]:
+            self.assertIn(layer["digest"], prod.repos["app"])
+            self.assertEqual(prod.blobs[layer["digest"]], staging.blobs[layer["digest"]])
+        self.assertNotIn(("GET", "/v2/app/blobs/" + present), staging.requests)
+        heads = [num for num, (method, path) in enumerate(prod.requests) if method == "HEAD" and "/blobs/sha256:" in path]
+        uploads = [num for num, (method, path) in enumerate(prod.requests) if method == "PUT" and "/uploads/" in path]
+        self.assertEqual(len(uploads), 3)  # the new config and two layers
+        self.assertLess(max(heads), max(uploads))
+        self.assertIn("1 blobs present, 0 mounted, 2 copied", run.stderr)
+    def test_147_registry_copy_pooled(self) -> None:
+        """ docker-copyedit.py --registry copies many layers on a bounded number of connections """
+        python = _python
+        copyedit = _copyedit()
+        staging, prod = FakeRegistry(), FakeRegistry()
+        layers = [fake_layer("%i.txt" % num, "%i" % num) for num in range(12)]
+        staging.push("app", "1", fake_config(), layers)
+        try:
+            cmd = F"{python} {copyedit} --registry -c REGISTRYTHREADS=3 FROM {staging.host}/app:1 INTO {prod.host}/app:1 -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            staging.stop()
+            prod.stop()
+        self.assertIn("unchanged image", run.stderr)
+        self.assertEqual(prod.manifests["app"]["1"], staging.manifests["app"]["1"])
+        self.assertEqual(prod.repos["app"], staging.repos["app"])
+        self.assertLessEqual(len(staging.clients), 4)
+        self.assertLessEqual(len(prod.clients), 4)
+    def test_148_registry_timeout(self) -> None:
+        """ docker-copyedit.py --registry reports a registry that does not answer as unavailable """
+        python = _python
+        copyedit = _copyedit()
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)  # accepts the connection but never answers
+        host = "127.0.0.1:%i" % server.getsockname()[1]
+        try:
+            cmd = F"{python} {copyedit} --registry -c REGISTRYTIMEOUT=1 FROM {host}/app:1 INTO {host}/app:2 set label info new -vv"
+            run = sh(cmd, check=False)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            server.close()
+        self.assertEqual(run.returncode, os.EX_UNAVAILABLE)
+        self.assertIn("timed out", run.stderr)
+        self.assertNotIn("Traceback", run.stderr)
+    def test_149_registry_load(self) -> None:
+        """ docker-copyedit.py FROM registry/image1 INTO image2 streams the registry image into docker load """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        registry = FakeRegistry()
+        layers = [fake_layer("%i.txt" % num, "layer %i" % num) for num in range(5)]
+        registry.push("app", "1", fake_config(), layers)
+        try:
+            cmd = F"{python} {copyedit} -c REGISTRYTHREADS=2 -c REGISTRYSPOOL=100 FROM {registry.host}/app:1 INTO image2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        self.assertFalse(os.path.exists(os_path(testdir, "saved.tar")))
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        manifest = json.loads(files["manifest.json"])
+        self.assertEqual(manifest[0]["RepoTags"], ["image2:latest"])
+        config = json.loads(files[manifest[0]["Config"]])
+        self.assertEqual(config["config"]["Labels"], {"info": "new"})
+        self.assertEqual([files[name] for name in manifest[0]["Layers"]], layers)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_151_registry_multiarch(self) -> None:
+        """ docker-copyedit.py --registry edits every platform image of an index """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry()
+        configs = [dict(fake_config(), architecture="amd64"), dict(fake_config(), architecture="arm64", variant="v8"),
+                   dict(fake_config(), architecture="ppc64le")]
+        registry.push_index("app", "1", configs, [fake_layer("a.txt", "a"), fake_layer("b.txt", "b")])
+        try:
+            cmd = F"{python} {copyedit} --registry FROM {registry.host}/app:1 INTO {registry.host}/app:2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        old_index, new_index = registry.manifest("app", "1"), registry.manifest("app", "2")
+        self.assertEqual(len(new_index["manifests"]), 4)
+        for old, new in zip(old_index["manifests"], new_index["manifests"]):
+            self.assertEqual(old["platform"], new["platform"])
+            config = registry.config("app", new["digest"])
+            if new["platform"]["os"] == "unknown":
+                self.assertEqual(old["digest"], new["digest"])
+                self.assertEqual(config["config"]["Labels"], {})
+            else:
+                self.assertNotEqual(old["digest"], new["digest"])
+                self.assertEqual(config["config"]["Labels"], {"info": "new"})
+                self.assertEqual(registry.manifest("app", new["digest"])["layers"], registry.manifest("app", old["digest"])["layers"])
+    def test_152_registry_multiarch_platform(self) -> None:
+        """ docker-copyedit.py --registry --platform=linux/arm64 set variant v9 (the index follows the edit) """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry()
+        configs = [dict(fake_config(), architecture="amd64"), dict(fake_config(), architecture="arm64", variant="v8")]
+        registry.push_index("app", "1", configs, [fake_layer("a.txt", "a")])
+        try:
+            cmd = F"{python} {copyedit} --registry --platform=linux/arm64 FROM {registry.host}/app:1 INTO {registry.host}/app:2 set variant v9 -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        old_index, new_index = registry.manifest("app", "1"), registry.manifest("app", "2")
+        self.assertEqual(old_index["manifests"][0], new_index["manifests"][0])
+        self.assertEqual(new_index["manifests"][1]["platform"], {"os": "linux", "architecture": "arm64", "variant": "v9"})
+        self.assertEqual(registry.config("app", new_index["manifests"][1]["digest"])["variant"], "v9")
+        self.assertEqual(registry.config("app", new_index["manifests"][0]["digest"])["architecture"], "amd64")
+    def test_153_oci_archive_multiarch(self) -> None:
+        """ docker-copyedit.py FROM oci-archive:input.tar INTO oci-archive:output.tar set label """
+        python = _python
+        copyedit = _copyedit()
+        testdir = self.testdir()
+        configs = [dict(fake_config(), architecture="amd64"), dict(fake_config(), architecture="arm64", variant="v8")]
+        fake_oci_layout(os_path(testdir, "input"), "v1", configs, [fake_layer("a.txt", "a")])
+        sh(F"tar cf {testdir}/input.tar -C {testdir}/input .")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM oci-archive:{testdir}/input.tar:v1 INTO oci-archive:{testdir}/output.tar:v2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        files = loaded_archive(os_path(testdir, "output.tar"))
+        def blob(digest: str) -> Dict[str, Any]:
+            return dict(json.loads(files[os.path.join("blobs", "sha256", digest.split(":")[1])]))
+        index = json.loads(files["index.json"])
+        self.assertEqual(index["manifests"][0]["annotations"]["org.opencontainers.image.ref.name"], "v2")
+        platforms = blob(index["manifests"][0]["digest"])["manifests"]
+        self.assertEqual([platform["platform"]["architecture"] for platform in platforms], ["amd64", "arm64"])
+        for platform in platforms:
+            manifest = blob(platform["digest"])
+            self.assertEqual(blob(manifest["config"]["digest"])["config"]["Labels"], {"info": "new"})
+            self.assertIn(os.path.join("blobs", "sha256", manifest["layers"][0]["digest"].split(":")[1]), files)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM oci:{testdir}/input:v1 INTO oci:{testdir}/input:v2 set label info new -vv"
+        run = sh(cmd)
+        index = json.load(open(os_path(testdir, "input/index.json")))
+        self.assertEqual([entry["annotations"]["org.opencontainers.image.ref.name"] for entry in index["manifests"]], ["v1", "v2"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_155_load_fanout(self) -> None:
+        """ docker-copyedit.py FROM image1 INTO image2 LOAD engine1,engine2 set label (one stream teed into both) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        engine1 = fake_docker(os_path(testdir, "engine1"))
+        engine2 = fake_docker(os_path(testdir, "engine2"), "podman")
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp FROM image1 INTO image2 LOAD {engine1},{engine2} set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        loaded1 = loaded_archive(os_path(testdir, "engine1/loaded.tar"))
+        loaded2 = loaded_archive(os_path(testdir, "engine2/loaded.tar"))
+        self.assertEqual(loaded1, loaded2)
+        self.assertEqual(loaded_configs(os_path(testdir, "engine1/loaded.tar"))[0]["config"]["Labels"], {"info": "new"})
+        self.assertFalse(os.path.exists(os_path(testdir, "load.tmp/ready.tar")))
+        os.remove(engine2)
+        run = sh(cmd, check=False)
+        self.assertEqual(run.returncode, os.EX_SOFTWARE)
+        self.assertIn("could not load into %s" % engine2, run.stderr)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_156_load_fanout_engines(self) -> None:
+        """ docker-copyedit.py FROM registry/image1 INTO image2 LOAD engine1,engine2 (and the ctx:name engines) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        engine1 = fake_docker(os_path(testdir, "engine1"))
+        engine2 = fake_docker(os_path(testdir, "engine2"), "podman")
+        copyedit = _copyedit(docker)
+        registry = FakeRegistry()
+        layers = [fake_layer("a.txt", "a"), fake_layer("b.txt", "b")]
+        registry.push("app", "1", fake_config(), layers)
+        try:
+            cmd = F"{python} {copyedit} FROM {registry.host}/app:1 INTO image2 LOAD {engine1},{engine2} set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        loaded1 = loaded_archive(os_path(testdir, "engine1/loaded.tar"))
+        self.assertEqual(loaded1, loaded_archive(os_path(testdir, "engine2/loaded.tar")))
+        manifest = json.loads(loaded1["manifest.json"])
+        self.assertEqual([loaded1[name] for name in manifest[0]["Layers"]], layers)
+        docker_copyedit.LOAD = "docker, podman,ctx:build2"
+        try:
+            self.assertEqual(docker_copyedit.load_engines(), ["docker", "podman", "docker --context build2"])
+        finally:
+            docker_copyedit.LOAD = ""
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_157_import_stream_large_config(self) -> None:
+        """ docker-copyedit.py FROM image1 IMPORT image2 holds back a config that is larger than REWRITEHOLD """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        podman = fake_docker(os_path(testdir, "podman"), "podman")
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --podman={podman} -c REWRITEHOLD=10 FROM image1 IMPORT image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        saved = loaded_archive(os_path(testdir, "saved.tar"))
+        loaded = loaded_archive(os_path(testdir, "podman/loaded.tar"))
+        manifest = json.loads(loaded["manifest.json"])
+        self.assertEqual(json.loads(loaded[manifest[0]["Config"]])["config"]["Labels"], {"info": "new"})
+        for layer in manifest[0]["Layers"]:
+            self.assertEqual(loaded[layer], saved[layer])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_158_import_stream(self) -> None:
+        """ docker-copyedit.py FROM image1 IMPORT image2 set label (streamed through the archive rewriter) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        podman = fake_docker(os_path(testdir, "podman"), "podman")
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --podman={podman} FROM image1 IMPORT image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertFalse(os.path.exists(os_path(testdir, "load.tmp/data")))
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        saved = loaded_archive(os_path(testdir, "saved.tar"))
+        loaded = loaded_archive(os_path(testdir, "podman/loaded.tar"))
+        manifest = json.loads(loaded["manifest.json"])
+        self.assertEqual(manifest[0]["RepoTags"], ["image2:latest"])
+        self.assertEqual(json.loads(loaded[manifest[0]["Config"]])["config"]["Labels"], {"info": "new"})
+        for layer in manifest[0]["Layers"]:
+            self.assertEqual(loaded[layer], saved[layer])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_159_import_passthrough(self) -> None:
+        """ docker-copyedit.py FROM image1 IMPORT image1 (no edits: the save stream is piped straight) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        podman = fake_docker(os_path(testdir, "podman"), "podman")
+        fake_archive(os_path(testdir, "saved.tar"), fake_config(), ["image1:latest"])
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --podman={podman} FROM image1 IMPORT image1 -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(open(os_path(testdir, "podman/loaded.tar"), "rb").read(), open(os_path(testdir, "saved.tar"), "rb").read())
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --podman={podman} FROM image1 IMPORT image3 -vv"
+        run = sh(cmd)
+        loaded = loaded_archive(os_path(testdir, "podman/loaded.tar"))
+        saved = loaded_archive(os_path(testdir, "saved.tar"))
+        self.assertEqual(json.loads(loaded["manifest.json"])[0]["RepoTags"], ["image3:latest"])
+        self.assertEqual(json.loads(loaded["manifest.json"])[0]["Config"], json.loads(saved["manifest.json"])[0]["Config"])
+        self.assertEqual(sorted(loaded.keys()), sorted(saved.keys()))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_160_remote_helper_config(self) -> None:
+        """ docker-copyedit.py -c REMOTE=1 does not pass the settings of this side to the helper (no nested helper) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        text_file(os_path(testdir, "run.out"), "[]")
+        config = F"-c REMOTE=1 --config=DOCKER={docker} -c TRACE={testdir}/trace.json --config RESULT=- -cMETRICS={testdir}/copyedit.prom"
+        config += F" --config JSON_REPORT={testdir}/report.json"
+        cmd = F"{python} {copyedit} -c REMOTEIMAGE=helper:1 {config} FROM image1 INTO image2 set label info new"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        runs = open(os_path(testdir, "run.txt")).read().splitlines()
+        self.assertEqual(runs, ["--rm -v /var/run/docker.sock:/var/run/docker.sock helper:1 "
+                                "--result=- -c REMOTEIMAGE=helper:1 FROM image1 INTO image2 set label info new"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_161_remote_helper(self) -> None:
+        """ docker-copyedit.py --remote FROM image1 INTO image2 set label (runs the helper container) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} --remote -c REMOTEIMAGE=helper:1 FROM image1 INTO image2 set label info 'new value' -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertIn("helper done", run.stdout)
+        runs = open(os_path(testdir, "run.txt")).read().splitlines()
+        self.assertEqual(runs, ["--rm -v /var/run/docker.sock:/var/run/docker.sock helper:1 "
+                                "-c REMOTEIMAGE=helper:1 FROM image1 INTO image2 set label info new value -vv"])
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_162_remote_reports(self) -> None:
+        """ docker-copyedit.py --remote --result=FILE --json=FILE --metrics=FILE writes the files here from the helper result """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        results = [{"image": "image2:latest", "id": "sha256:" + "1" * 64, "digest": "", "changed": True}]
+        text_file(os_path(testdir, "run.out"), json.dumps(results))
+        reports = F"--result {testdir}/result.json --json={testdir}/report.json --metrics={testdir}/copyedit.prom"
+        cmd = F"{python} {copyedit} --remote -c REMOTEIMAGE=helper:1 {reports} FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        runs = open(os_path(testdir, "run.txt")).read().splitlines()
+        self.assertEqual(runs, ["--rm -v /var/run/docker.sock:/var/run/docker.sock helper:1 "
+                                "--result=- -c REMOTEIMAGE=helper:1 FROM image1 INTO image2 set label info new -vv"])
+        self.assertEqual(json.loads(open(os_path(testdir, "result.json")).read()), results)
+        report = json.loads(open(os_path(testdir, "report.json")).read())
+        self.assertEqual(report["image"], "image2:latest")
+        self.assertEqual([timing["phase"] for timing in report["phases"]], ["remote"])
+        samples = dict(line.rsplit(" ", 1) for line in lines(open(os_path(testdir, "copyedit.prom")).read()) if not line.startswith("#"))
+        self.assertEqual(samples["docker_copyedit_images_processed_total"], "1")
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_163_result_image_id(self) -> None:
+        """ docker-copyedit.py --result=- prints the new image id (no inspect after the load) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --result=- FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        results = json.loads(run.stdout)
+        files = loaded_archive(os_path(testdir, "loaded.tar"))
+        config_file = json.loads(files["manifest.json"])[0]["Config"]
+        self.assertEqual(results, [{"image": "image2:latest", "id": "sha256:" + hashlib.sha256(files[config_file]).hexdigest(),
+                                    "digest": "", "changed": True}])
+        self.assertFalse(os.path.exists(os_path(testdir, "images.txt")))
+        comment = docker_copyedit.edits_comment([("set-label", "info", "new")])
+        text_file(os_path(testdir, "history.txt"), "sha256:" + "1" * 64 + " " + comment + "\n")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --result={testdir}/result.json FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        results = json.load(open(os_path(testdir, "result.json")))
+        self.assertEqual(results, [{"image": "image2:latest", "id": "sha256:" + "1" * 64, "digest": "", "changed": False}])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_164_result_registry_digest(self) -> None:
+        """ docker-copyedit.py --registry --result=- prints the new config and manifest digests """
+        python = _python
+        copyedit = _copyedit()
+        registry = FakeRegistry()
+        registry.push("app", "1", fake_config(), [fake_layer("a.txt", "a")])
+        try:
+            cmd = F"{python} {copyedit} --registry --result=- FROM {registry.host}/app:1 INTO {registry.host}/app:2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        results = json.loads(run.stdout)
+        media_type, manifest = registry.manifests["app"]["2"]
+        self.assertEqual(results[0]["digest"], "sha256:" + hashlib.sha256(manifest).hexdigest())
+        self.assertEqual(results[0]["id"], registry.manifest("app", "2")["config"]["digest"])
+    def test_165_result_json_stdout(self) -> None:
+        """ docker-copyedit.py --result=- --json=- is refused (both would write to stdout) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --result=- --json=- FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd, check=False)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertEqual(run.returncode, os.EX_USAGE)
+        self.assertIn("both write to stdout", run.stderr)
+        self.assertEqual(run.stdout, "")
+        self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        options = docker_copyedit.CopyEdit(tmpdir=os_path(testdir, "load.tmp"), docker=docker, result="-", json_report="-")
+        self.assertEqual(docker_copyedit.copyedit("image1", "image2", ["set", "label", "info", "new"], options).exitcode, os.EX_USAGE)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_166_timings_json(self) -> None:
+        """ docker-copyedit.py --timings --json=- reports the phases and counters (a cache miss only with a history lookup) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --timings --json=- FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        report = json.loads(run.stdout)
+        self.assertEqual(report["image"], "image2:latest")
+        self.assertEqual([timing["phase"] for timing in report["phases"]], ["save", "edit", "pack", "load", "cleanup"])
+        self.assertEqual(report["counters"], {"configs_rewritten": 1, "hash_collisions": 0, "cache_hits": 0, "cache_misses": 0})
+        self.assertGreater(report["peak_disk"], 0)
+        self.assertIn("configs rewritten 1, hash collisions 0", run.stderr)
+        text_file(os_path(testdir, "history.txt"), "sha256:" + "1" * 64 + " some other comment\n")
+        run = sh(cmd)
+        report = json.loads(run.stdout)
+        self.assertEqual(report["counters"], {"configs_rewritten": 1, "hash_collisions": 0, "cache_hits": 0, "cache_misses": 1})
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_167_hash_collisions_counted(self) -> None:
+        """ two configs that edit into the same text (with SOURCE_DATE_EPOCH) share the config file of their sha256,
+            where a file of that name with other content is an error """
+        testdir = self.testdir()
+        manifest = []
+        for name, info in [("a", "old"), ("b", "other")]:
+            text_file(os_path(testdir, name + ".json"), json.dumps(fake_config(labels={"info": info})))
+            manifest.append({"Config": name + ".json", "RepoTags": [name + ":latest"], "Layers": []})
+        text_file(os_path(testdir, "manifest.json"), json.dumps(manifest))
+        counters = dict(docker_copyedit.JOB.counters)
+        epoch, docker_copyedit.SOURCE_DATE_EPOCH = docker_copyedit.SOURCE_DATE_EPOCH, "1700000000"
+        try:
+            changed = docker_copyedit.edit_datadir(testdir, None, [("set-label", "info", "new")])
+            self.assertEqual(changed, 2)
+            self.assertEqual(docker_copyedit.JOB.counters["configs_rewritten"] - counters["configs_rewritten"], 2)
+            self.assertEqual(docker_copyedit.JOB.counters["hash_collisions"] - counters["hash_collisions"], 1)
+            configs = [item["Config"] for item in json.load(open(os_path(testdir, "manifest.json")))]
+            self.assertEqual(configs[0], configs[1])
+            config_data = open(os_path(testdir, configs[0]), "rb").read()
+            image_id = "sha256:" + hashlib.sha256(config_data).hexdigest()
+            self.assertEqual(docker_copyedit.datadir_image_ids(testdir), [image_id, image_id])
+            text_file(os_path(testdir, configs[0]), "{}")
+            text_file(os_path(testdir, "manifest.json"), json.dumps(manifest))
+            with self.assertRaises(docker_copyedit.CommandError):
+                docker_copyedit.edit_datadir(testdir, None, [("set-label", "info", "new")])
+        finally:
+            docker_copyedit.SOURCE_DATE_EPOCH = epoch
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_169_profile_cpu_mem(self) -> None:
+        """ docker-copyedit.py --profile=cpu writes pstats into the tmpdir, -c PROFILE=mem a tracemalloc top-N (per job) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --profile=cpu FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        written = glob.glob(os_path(testdir, "load.tmp/profile.*.pstats"))
+        self.assertEqual(len(written), 1)
+        self.assertIn("profile written to " + os.path.abspath(written[0]), run.stderr)
+        stats = pstats.Stats(written[0])
+        profiled = [func[2] for func in stats.stats]  # type: ignore[attr-defined]
+        self.assertIn("parse_commands", profiled)
+        self.assertIn("edit_datadir", profiled)
+        self.assertNotIn("sh", profiled)
+        summary = open(written[0][:-len(".pstats")] + ".txt").read()
+        self.assertIn("subprocesses cpu", summary)
+        self.assertIn("edit_datadir", summary)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp -c PROFILE=mem FROM image1 INTO image2 set label info new -vv"
+        for _ in range(2):
+            run = sh(cmd)
+        written = glob.glob(os_path(testdir, "load.tmp/profile.*.mem.txt"))
+        self.assertEqual(len(written), 2)  # the jobs on a shared tmpdir do not overwrite each other
+        summary = open(written[0]).read()
+        self.assertIn("traced memory", summary)
+        self.assertIn("docker_copyedit.py", summary)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --profile=io FROM image1 INTO image2 set label info new"
+        run = sh(cmd, check=False)
+        self.assertEqual(run.returncode, os.EX_USAGE)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_171_trace_events(self) -> None:
+        """ docker-copyedit.py --trace=FILE writes the phases and the platform workers as Chrome trace events """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --trace={testdir}/trace.json FROM image1 INTO image2 set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        events = json.load(open(os_path(testdir, "trace.json")))["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        self.assertEqual([event["name"] for event in spans], ["save", "edit", "pack", "load", "cleanup"])
+        self.assertEqual({event["tid"] for event in spans}, {1})
+        self.assertEqual({event["args"]["image"] for event in spans}, {"image2:latest"})
+        self.assertEqual(spans[1]["args"]["result"], "changed")
+        self.assertGreater(spans[2]["args"]["bytes_out"], 0)
+        self.assertTrue(all(later["ts"] >= earlier["ts"] + earlier["dur"] for earlier, later in zip(spans, spans[1:])))
+        registry = FakeRegistry()
+        configs = [dict(fake_config(), architecture="amd64"), dict(fake_config(), architecture="arm64")]
+        registry.push_index("app", "1", configs, [fake_layer("a.txt", "a")])
+        try:
+            cmd = F"{python} {copyedit} --registry --trace={testdir}/trace.json FROM {registry.host}/app:1 INTO {registry.host}/app:2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        finally:
+            registry.stop()
+        events = json.load(open(os_path(testdir, "trace.json")))["traceEvents"]
+        tracks = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+        edits = [event for event in events if event["ph"] == "X" and event["name"] == "edit"]
+        self.assertEqual(sorted(event["args"]["image"].split(" ")[-1] for event in edits), ["(linux/amd64)", "(linux/arm64)", "(unknown/unknown)"])
+        self.assertTrue(all(tracks[event["tid"]].startswith("worker") for event in edits))
+        self.assertEqual([event["name"] for event in events if event["ph"] == "X" and event["tid"] == 1], ["registry"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_173_metrics_textfile(self) -> None:
+        """ docker-copyedit.py --metrics=FILE adds each run to the counters of the Prometheus textfile """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        metrics = os_path(testdir, "copyedit.prom")
+        text_file(os_path(testdir, "history.txt"), "sha256:" + "1" * 64 + " some other comment\n")
+        for _ in range(2):
+            cmd = F"{python} {copyedit} -T {testdir}/load.tmp --metrics={metrics} FROM image1 INTO image2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        samples = dict(line.rsplit(" ", 1) for line in lines(open(metrics).read()) if not line.startswith("#"))
+        self.assertEqual(samples["docker_copyedit_images_processed_total"], "2")
+        self.assertEqual(samples["docker_copyedit_images_unchanged_total"], "0")
+        self.assertEqual(samples['docker_copyedit_cache_total{result="miss"}'], "2")
+        self.assertGreater(int(samples['docker_copyedit_bytes_total{direction="saved"}']), 0)
+        self.assertGreater(int(samples['docker_copyedit_bytes_total{direction="loaded"}']), 0)
+        self.assertEqual(samples['docker_copyedit_phase_duration_seconds_count{phase="edit"}'], "2")
+        self.assertEqual(samples['docker_copyedit_phase_duration_seconds_bucket{phase="edit",le="+Inf"}'], "2")
+        self.assertEqual(samples["docker_copyedit_last_run_success"], "1")
+        self.assertIn("# TYPE docker_copyedit_phase_duration_seconds histogram", open(metrics).read())
+        self.assertEqual(glob.glob(metrics + "*.tmp"), [])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_174_metrics_failure_phase(self) -> None:
+        """ docker-copyedit.py --metrics=FILE counts a failed save (and keeps the older counters) """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        metrics = os_path(testdir, "copyedit.prom")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --metrics={metrics} FROM image1 INTO image2 set label info new -vv"
+        sh(cmd)
+        os.remove(os_path(testdir, "saved.tar"))
+        run = sh(cmd, check=False)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        self.assertNotEqual(run.returncode, 0)
+        samples = dict(line.rsplit(" ", 1) for line in lines(open(metrics).read()) if not line.startswith("#"))
+        self.assertEqual(samples['docker_copyedit_failures_total{phase="save"}'], "1")
+        self.assertEqual(samples["docker_copyedit_last_run_success"], "0")
+        self.assertEqual(samples["docker_copyedit_images_processed_total"], "1")
+        self.assertEqual(samples['docker_copyedit_phase_duration_seconds_count{phase="load"}'], "1")
+        self.assertEqual(samples['docker_copyedit_phase_duration_seconds_count{phase="save"}'], "2")
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_176_progress_streams(self) -> None:
+        """ docker-copyedit.py --progress=always passes the save, pack and load streams through a progress meter """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        for keep in ["", "-kk"]:
+            cmd = F"{python} {copyedit} -T {testdir}/load.tmp {keep} --progress=always -c PROGRESSRATE=0 FROM image1 INTO image2 set label info new"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+            shown = [line.split(":")[0] for line in lines(run.stderr) if "MB/s" in line]
+            self.assertEqual(sorted(set(shown)), sorted(["save", "pack", "load"] + (["unpack"] if keep else [])))
+            configs = loaded_configs(os_path(testdir, "loaded.tar"))
+            self.assertEqual(configs[0]["config"]["Labels"], {"info": "new"})
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --progress=never -c PROGRESSRATE=0 FROM image1 INTO image2 set label info new"
+        run = sh(cmd)
+        self.assertEqual(greps(run.stderr, "MB/s"), [])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_177_progress_line(self) -> None:
+        """ the progress line shows the bytes of the expected total, MB/s and the ETA """
+        progress = docker_copyedit.Progress("save", 100 * 1024 * 1024)
+        progress.done = 25 * 1024 * 1024
+        self.assertEqual(progress.line(progress.started + 5), "save: 25.0 MB of 100.0 MB (25%) 5.0 MB/s ETA 15s")
+        progress.expected = 0
+        self.assertEqual(progress.line(progress.started + 5), "save: 25.0 MB 5.0 MB/s")
+        self.assertEqual(docker_copyedit.human_size(3 * 1024 ** 4), "3.0 TB")
+    def test_178_progress_dryrun(self) -> None:
+        """ docker-copyedit.py -z --progress=always skips the save stream like any other command """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        copyedit = _copyedit(docker)
+        for keep in ["", "-kk"]:
+            cmd = F"{python} {copyedit} -T {testdir}/load.tmp {keep} -z --progress=always -c PROGRESSRATE=0 FROM image1 INTO image2 set label info new -vv"
+            run = sh(cmd)
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+            self.assertEqual(greps(run.stderr, "MB/s"), [])
+            self.assertTrue(greps(run.stderr, "skip .* save image1 [|]"))
+            self.assertFalse(os.path.exists(os_path(testdir, "loaded.tar")))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_179_bench_archives(self) -> None:
+        """ docker_copyedit_bench.py generates legacy and OCI archives and compares its timings to a baseline """
+        python = _python
+        testdir = self.testdir()
+        for oci in [False, True]:
+            archive = docker_copyedit_bench.generate_archive(os_path(testdir, "saved.tar"), layers=2, layer_size=100000,
+                                                             env=3, labels=4, volumes=2, ports=2, history=6, items=2, oci=oci)
+            files = loaded_archive(archive)
+            manifest = json.loads(files["manifest.json"])
+            self.assertEqual([item["RepoTags"] for item in manifest], [["bench:0"], ["bench:1"]])
+            self.assertEqual("index.json" in files, oci)
+            for item in manifest:
+                config = json.loads(files[item["Config"]])
+                self.assertEqual(len(config["config"]["Env"]), 4)
+                self.assertEqual(len(config["config"]["Labels"]), 5)
+                self.assertEqual(len(config["config"]["Volumes"]), 2)
+                self.assertEqual(len(config["history"]), 6)
+                for layer, diff_id in zip(item["Layers"], config["rootfs"]["diff_ids"]):
+                    self.assertEqual("sha256:" + hashlib.sha256(files[layer]).hexdigest(), diff_id)
+        bench = "docker_copyedit_bench.py"
+        baseline = os_path(testdir, "baseline.json")
+        cmd = F"{python} {bench} -T {testdir}/bench --sizes=tiny --repeat=1 --baseline={baseline} --update edit_datadir stream"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        results = json.load(open(baseline))["results"]
+        self.assertEqual(sorted(results), ["edit_datadir/tiny", "stream/tiny"])
+        for name in results:
+            results[name]["seconds"] = 0.0000001
+        text_file(baseline, json.dumps({"results": results}))
+        run = sh(F"{python} {bench} -T {testdir}/bench --sizes=tiny --repeat=1 --baseline={baseline} stream", check=False)
+        self.assertEqual(run.returncode, 1)
+        self.assertIn("REGRESSION", run.stdout)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_180_metrics_parallel(self) -> None:
+        """ docker-copyedit.py --metrics=FILE in parallel runs adds up all of them """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config())
+        copyedit = _copyedit(docker)
+        metrics = os_path(testdir, "copyedit.prom")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --metrics={metrics} FROM image1 INTO image2 set label info new -vv"
+        with concurrent.futures.ThreadPoolExecutor(6) as pool:
+            runs = list(pool.map(lambda _: sh(cmd), range(6)))
+        for run in runs:
+            logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        samples = dict(line.rsplit(" ", 1) for line in lines(open(metrics).read()) if not line.startswith("#"))
+        self.assertEqual(samples["docker_copyedit_images_processed_total"], "6")
+        self.assertEqual(samples['docker_copyedit_phase_duration_seconds_count{phase="edit"}'], "6")
+        self.assertEqual(glob.glob(metrics + "*.tmp"), [])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_181_standin_engine(self) -> None:
+        """ docker-copyedit.py runs its whole pipeline against docker_copyedit_standin.py (no daemon) """
+        python = _python
+        testdir = self.testdir()
+        archive = docker_copyedit_bench.generate_archive(os_path(testdir, "saved.tar"), layers=2, layer_size=100000)
+        standin = F"{python} docker_copyedit_standin.py --store={testdir}/store"
+        run = sh(F"{standin} load -i {archive}")
+        self.assertEqual(lines(run.stdout), ["Loaded image: bench:0"])
+        copyedit = _copyedit(F"'{standin}'")
+        cmd = F"{python} {copyedit} -T {testdir}/load.tmp --result=- FROM bench:0 INTO bench:new set label info new -vv"
+        run = sh(cmd)
+        logg.info("%s\n%s\n%s", cmd, run.stdout, run.stderr)
+        results = json.loads(run.stdout)
+        inspect = json.loads(sh(F"{standin} image inspect bench:new").stdout)
+        self.assertEqual(inspect[0]["Id"], results[0]["id"])
+        self.assertEqual(inspect[0]["Config"]["Labels"]["info"], "new")
+        self.assertEqual(sh(F"{standin} image inspect --format '{{{{.Size}}}}' bench:new").stdout.strip(),
+                         sh(F"{standin} image inspect --format '{{{{.Size}}}}' bench:0").stdout.strip())
+        run = sh(F"{python} {copyedit} -T {testdir}/load.tmp --result=- FROM bench:new INTO bench:new set label info new")
+        self.assertEqual(json.loads(run.stdout)[0], dict(results[0], changed=False))
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_182_standin_save_tag_rmi(self) -> None:
+        """ docker_copyedit_standin.py saves one image under the requested name, and drops archives without tags """
+        python = _python
+        testdir = self.testdir()
+        archive = docker_copyedit_bench.generate_archive(os_path(testdir, "saved.tar"), layers=1, layer_size=1000, items=2, oci=True)
+        standin = F"{python} docker_copyedit_standin.py --store={testdir}/store"
+        run = sh(F"{standin} load -i {archive}")
+        self.assertEqual(lines(run.stdout), ["Loaded image: bench:0", "Loaded image: bench:1"])
+        sh(F"{standin} tag bench:1 other")
+        sh(F"{standin} save other -o {testdir}/other.tar")
+        files = loaded_archive(os_path(testdir, "other.tar"))
+        manifest = json.loads(files["manifest.json"])
+        self.assertEqual(manifest[0]["RepoTags"], ["other:latest"])
+        self.assertEqual(sorted(files), sorted([manifest[0]["Config"]] + manifest[0]["Layers"] + ["manifest.json"]))
+        self.assertEqual(json.loads(files[manifest[0]["Config"]])["config"]["Labels"]["item"], "1")
+        run = sh(F"{standin} images --format '{{{{.Repository}}}}:{{{{.Tag}}}}'")
+        self.assertEqual(lines(run.stdout), ["bench:0", "bench:1", "other:latest"])
+        run = sh(F"{standin} image inspect missing", check=False)
+        self.assertEqual(run.returncode, 1)
+        self.assertIn("No such image", run.stderr)
+        sh(F"{standin} load -i {testdir}/other.tar")
+        self.assertEqual(len(os.listdir(os_path(testdir, "store/archives"))), 2)
+        sh(F"{standin} rmi other bench:0 bench:1")
+        self.assertEqual(os.listdir(os_path(testdir, "store/archives")), [])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_184_lazy_imports(self) -> None:
+        """ importing docker_copyedit (and a plain retag or a -z edit run) leaves the modules of the registry, profile and archive code unloaded """
+        python = _python
+        cmd = F"{python} -c 'import sys, docker_copyedit; print(*sorted(sys.modules))'"
+        run = sh(cmd)
+        loaded = run.stdout.split()
+        self.assertIn("docker_copyedit", loaded)
+        self.assertEqual([module for module in docker_copyedit_bench.LAZY if module in loaded], [])
+        self.assertEqual(docker_copyedit.plain_retag(["FROM", "image1", "INTO", "image2"]), ("image1", "image2"))
+        self.assertEqual(docker_copyedit.plain_retag(["into", "image2", "from", "image1"]), ("image1", "image2"))
+        self.assertIsNone(docker_copyedit.plain_retag(["FROM", "image1", "INTO", "image2", "set", "user", "foo"]))
+        self.assertIsNone(docker_copyedit.plain_retag(["FROM", "image1", "INTO", "image2", "-vv"]))
+        self.assertIsNone(docker_copyedit.plain_retag(["PODMAN", "image1", "INTO", "image2"]))
+        self.assertIsNone(docker_copyedit.plain_retag(["FROM", "oci:dir:v1", "INTO", "image2"]))
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        retag = "docker_copyedit.py FROM image1 INTO image2"
+        cmd = F"PATH={os.path.dirname(docker)}:$PATH {python} -c 'import sys, docker_copyedit; sys.argv = \"{retag}\".split(); docker_copyedit.main(); print(*sorted(sys.modules))'"
+        run = sh(cmd)
+        loaded = run.stdout.split()
+        self.assertIn("subprocess", loaded)
+        self.assertEqual(open(os_path(testdir, "tagged.txt")).read(), "image1 image2\n")
+        self.assertEqual([module for module in ["optparse", "json", "hashlib", "logging"] if module in loaded], [])
+        edit = F"docker_copyedit.py --docker={docker} -T {testdir}/load.tmp -z FROM image1 INTO image2 set label info new"
+        cmd = F"{python} -c 'import sys, docker_copyedit; sys.argv = \"{edit}\".split(); docker_copyedit.main(); print(*sorted(sys.modules))'"
+        run = sh(cmd)
+        loaded = run.stdout.split()
+        self.assertIn("docker_copyedit", loaded)
+        self.assertEqual([module for module in ["cProfile", "tracemalloc"] if module in loaded], [])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_185_fast_retag(self) -> None:
+        """ docker-copyedit.py FROM image1 INTO image2 without edits goes to 'docker tag' without the option parser """
+        python = _python
+        testdir = self.testdir()
+        fake_docker(testdir)
+        cmd = F"PATH={os.path.abspath(testdir)}:$PATH {python} -X importtime {_script} FROM image1 INTO image2"
+        run = sh(cmd)
+        self.assertEqual(lines(open(os_path(testdir, "tagged.txt")).read()), ["image1 image2"])
+        self.assertNotIn("optparse", run.stderr)
+        self.assertNotIn("tarfile", run.stderr)
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_187_copyedit_api_threads(self) -> None:
+        """ copyedit() runs jobs in threads - each one with its own settings, results and timings """
+        testdirs = [os_path(self.testdir(), F"job{num}") for num in range(3)]
+        jobs = []
+        for num, testdir in enumerate(testdirs):
+            os.makedirs(testdir)
+            fake_archive(os_path(testdir, "saved.tar"), fake_config(labels={"job": "old"}))
+            options = docker_copyedit.CopyEdit(tmpdir=F"{testdir}/load.tmp", docker=fake_docker(testdir))
+            jobs.append((num, options))
+        with concurrent.futures.ThreadPoolExecutor(3) as pool:
+            done = list(pool.map(lambda job: docker_copyedit.copyedit("image1", F"image{job[0]}", ["set", "label", "job", str(job[0])], job[1]), jobs))
+        for num, testdir in enumerate(testdirs):
+            self.assertEqual(done[num].exitcode, 0)
+            self.assertEqual([result.image for result in done[num].results], [F"image{num}:latest"])
+            self.assertEqual(done[num].counters["configs_rewritten"], 1)
+            self.assertIn("save", [timing.phase for timing in done[num].timings])
+            configs = loaded_configs(os_path(testdir, "loaded.tar"))
+            self.assertEqual(configs[0]["config"]["Labels"], {"job": str(num)})
+        self.assertEqual(docker_copyedit.DOCKER, "docker")
+        self.assertEqual(docker_copyedit.JOB.results, [])
+        self.assertEqual(list(docker_copyedit.JOBCODE), [docker_copyedit.__file__])  # compiled once for all jobs
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_188_parse_commands_settings(self) -> None:
+        """ the PODMAN / IMPORT / LOAD words come back as settings - the module settings stay unchanged """
+        inp, out, commands, settings = docker_copyedit.parse_commands(["PODMAN", "image1", "INTO", "image2", "LOAD", "docker,podman"])
+        self.assertEqual((inp, out, commands), ("image1", "image2", []))
+        self.assertEqual(settings, {"DOCKER": "podman", "LOAD": "docker,podman"})
+        self.assertEqual(docker_copyedit.parse_commands(["FROM", "image1", "IMPORT", "image2"])[3], {"IMPORT": "podman"})
+        self.assertEqual((docker_copyedit.DOCKER, docker_copyedit.IMPORT, docker_copyedit.LOAD), ("docker", "", ""))
+        self.save(self.testname())
+    def test_189_copyedit_options(self) -> None:
+        """ CopyEdit options map to the module settings, -c NAME=VAL is typed like the setting """
+        options = docker_copyedit.CopyEdit(keepdir=2, docker="podman", config={"REGISTRYTHREADS": 8})
+        settings = options.settings()
+        self.assertEqual(settings["DOCKER"], "podman")
+        self.assertEqual([settings[name] for name in ["KEEPDATADIR", "KEEPSAVEFILE", "KEEPINPUTFILE", "KEEPOUTPUTFILE"]], [True, True, False, False])
+        self.assertEqual(settings["REGISTRYTHREADS"], 8)
+        config = docker_copyedit.config_settings(["REGISTRYTHREADS=2", "REWRITEHOLD=10", "NoDRYRUN", "PROGRESSRATE=0.5"])
+        self.assertEqual(config, {"REGISTRYTHREADS": 2, "REWRITEHOLD": 10, "DRYRUN": False, "PROGRESSRATE": 0.5})
+        self.save(self.testname())
+    def test_191_parallel_jobs_one_tmpdir(self) -> None:
+        """ docker-copyedit.py runs in parallel with the same -T tmpdir - each job has a work directory of its own """
+        python = _python
+        testdir = self.testdir()
+        tmpdir = os_path(testdir, "load.tmp")
+        runs = []
+        for num in range(4):
+            store = os_path(testdir, F"engine{num}")
+            os.makedirs(store)
+            docker = fake_docker(store)
+            fake_archive(os_path(store, "saved.tar"), fake_config(labels={"job": "old"}))
+            cmd = F"{python} {_script} --docker={docker} -T {tmpdir} FROM image1 INTO image{num} set label job {num}"
+            runs.append(subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+        for num, run in enumerate(runs):
+            run.communicate()
+            self.assertEqual(run.returncode, 0)
+            configs = loaded_configs(os_path(testdir, F"engine{num}/loaded.tar"))
+            self.assertEqual(configs[0]["config"]["Labels"], {"job": str(num)})
+        self.assertEqual(os.listdir(tmpdir), ["jobs.lock"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_192_reclaim_stale_workdirs(self) -> None:
+        """ the job directories with a free lock are removed - not the running ones and not the ones kept with -k """
+        testdir = self.testdir()
+        for name in ["job.crashed", "job.running", "job.kept", "other"]:
+            os.makedirs(os_path(testdir, name))
+            text_file(os_path(testdir, F"{name}/lock"), "")
+        text_file(os_path(testdir, "job.kept/keep"), "")
+        with open(os_path(testdir, "job.running/lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            reclaimed = docker_copyedit.reclaim_workdirs(testdir)
+        self.assertEqual(reclaimed, [os_path(testdir, "job.crashed")])
+        self.assertEqual(sorted(os.listdir(testdir)), ["job.kept", "job.running", "other"])
+        self.rm_testdir()
+        self.save(self.testname())
+    def test_193_keep_per_job(self) -> None:
+        """ docker-copyedit.py -kkk keeps the data and the saved.tar in the work directory of each job """
+        python = _python
+        testdir = self.testdir()
+        docker = fake_docker(testdir)
+        fake_archive(os_path(testdir, "saved.tar"), fake_config(labels={"version": "1"}))
+        tmpdir = os_path(testdir, "load.tmp")
+        workdirs = []
+        for num in range(2):
+            cmd = F"{python} {_script} --docker={docker} -T {tmpdir} -kkk FROM image1 INTO image{num} set label version {num} -v"
+            run = sh(cmd)
+            workdir = job_workdir(tmpdir, run.stderr)
+            self.assertIn(F"keeping {workdir}/data", run.stderr)
+            self.assertIn(F"keeping {workdir}/saved.tar", run.stderr)
+            self.assertTrue(os.path.isfile(os_path(workdir, "data/manifest.json")))
+            self.assertTrue(os.path.isfile(os_path(workdir, "saved.tar")))
+            self.assertTrue(os.path.isfile(os_path(workdir, "keep")))
+            workdirs.append(workdir)
+        self.assertNotEqual(workdirs[0], workdirs[1])
+        self.assertEqual(sorted(os.listdir(tmpdir)), sorted(["jobs.lock"] + [os.path.basename(workdir) for workdir in workdirs]))
+        self.rm_testdir()
+        self.save(self.testname())
     def test_202_real_simple(self, docker: Optional[str] = None) -> None:
         """ docker-copyedit.py from image1 into image2 """
         python = _python
@@ -603,9 +2209,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertNotIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)
@@ -655,9 +2262,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)
@@ -707,9 +2315,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)
@@ -759,9 +2368,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertIn("keeping " + datadir, run.stderr)
         self.assertIn("keeping " + savetar, run.stderr)
@@ -811,9 +2421,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertIn("keeping " + datadir, run.stderr)
         self.assertIn("keeping " + savetar, run.stderr)
@@ -863,9 +2474,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)
@@ -917,9 +2529,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertNotIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)
@@ -971,9 +2584,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertNotIn("keeping " + datadir, run.stderr)
         self.assertIn("keeping " + savetar, run.stderr)
@@ -1025,9 +2639,10 @@ class DockerCopyeditTest(unittest.TestCase):
         self.assertIn("unchanged image", run.stderr)
         self.assertIn("tagged old image", run.stderr)
         #
-        datadir = tempdir + "/data"
-        savetar = tempdir + "/saved.tar"
-        loadtar = tempdir + "/ready.tar"
+        workdir = job_workdir(tempdir, run.stderr)
+        datadir = workdir + "/data"
+        savetar = workdir + "/saved.tar"
+        loadtar = workdir + "/ready.tar"
         self.assertIn(datadir, run.stderr)
         self.assertNotIn("keeping " + datadir, run.stderr)
         self.assertNotIn("keeping " + savetar, run.stderr)